@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Packed thumbnail atlases for list views
+
+A list screen showing the events of one day or one venue fetches one
+event_thumbnail per event, i.e. dozens of requests. AtlasBuilder packs small
+renditions of those thumbnails (at most TILE_SIZE px on each side) into a few
+JPEG sprite sheets with a JSON index, so the screen needs one index and one
+or two images:
+
+    atlases/<collection>/<grouping>/<group>.json
+    atlases/<collection>/<grouping>/<group>-<signature>-<n>.jpg
+
+where grouping is 'day' (YYYY-MM-DD of the event date) or 'venue' (a slug of
+the venue name), for upcoming events only. The index maps each event ID to
+its image and rectangle:
+
+    {"images": [{"path": ..., "width": ..., "height": ...}],
+     "tiles": {"<eventID>": {"image": 0, "x": 0, "y": 0, "width": 128, "height": 85, "md5": ...,
+                             "copies": 0}}}
+
+Atlases are rebuilt incrementally:
+
+- each index records a signature of its members (event IDs and thumbnail
+  MD5s) in its blob metadata, so a lean listing tells which groups changed
+  and unchanged groups cost nothing,
+- when a group changes, tiles of unchanged members are cut out of the old
+  sheets; only new or replaced thumbnails are downloaded, and tiles that
+  have already been carried over MAX_TILE_COPIES times (`copies`), since
+  every sheet re-encodes them,
+- sheet names include the signature, so they can be cached forever; the
+  index is written with a generation precondition and a short cache
+  lifetime, and the sheets it no longer references are deleted afterwards,
+- groups with no members left (past days) are deleted.
+
+Usage:
+    python atlas_builder.py --collections bayAreaEvents,austinEvents --grouping day,venue
+    python generate_thumbnails.py --atlases day   # rebuild after generating thumbnails
+"""
+
+import io
+import re
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from firebase_admin import storage, firestore
+from google.api_core.exceptions import PreconditionFailed
+from PIL import Image
+from event_priority import CHUNK_SIZE, DATE_FIELDS, parse_start
+from storage_io import list_blobs_lean, upload_buffer
+from storage_batch import StorageBatch
+from firebase_setup import find_service_account, initialize_firebase, THUMBNAIL_NAMES
+
+logger = logging.getLogger(__name__)
+
+ATLAS_PREFIX = 'atlases'
+GROUPINGS = ['day', 'venue']
+
+# Tiles fit in a TILE_SIZE square; sheets are at most ATLAS_WIDTH x ATLAS_HEIGHT
+TILE_SIZE = 128
+ATLAS_WIDTH = 1024
+ATLAS_HEIGHT = 1024
+ATLAS_QUALITY = 80
+# A tile is cut from a previous sheet at most this many times in a row, then downloaded again, so
+# re-encoding it into each new sheet costs a bounded amount of quality
+MAX_TILE_COPIES = 2
+
+INDEX_CACHE_CONTROL = 'public, max-age=300'
+SHEET_CACHE_CONTROL = 'public, max-age=31536000'
+
+
+def day_key(data: dict) -> Optional[str]:
+    """YYYY-MM-DD an event is listed under: its local date string, else the UTC date of its timestamp"""
+    date = data.get('date')
+    if isinstance(date, str) and re.match(r'\d{4}-\d{2}-\d{2}', date):
+        return date[:10]
+    start = parse_start(data)
+    return start.date().isoformat() if start else None
+
+
+def venue_key(data: dict) -> Optional[str]:
+    """URL-safe slug of an event's venue name"""
+    venue = data.get('venue')
+    if not isinstance(venue, str):
+        return None
+    slug = re.sub(r'[^a-z0-9]+', '-', venue.lower()).strip('-')
+    return slug[:80] or None
+
+
+GROUP_KEYS = {'day': day_key, 'venue': venue_key}
+
+
+def signature(members: Dict[str, str]) -> str:
+    """Short hash of the event IDs and thumbnail MD5s of a group"""
+    digest = hashlib.sha1()
+    for event_id in sorted(members):
+        digest.update(f"{event_id}:{members[event_id]}\n".encode())
+    return digest.hexdigest()[:12]
+
+
+def pack(sizes: Dict[str, Tuple[int, int]], width: int = ATLAS_WIDTH,
+         height: int = ATLAS_HEIGHT) -> List[Dict[str, Tuple[int, int]]]:
+    """Shelf-pack rectangles, tallest first, into as few sheets as needed: one {id: (x, y)} per sheet"""
+    sheets = [{}]
+    x = y = shelf = 0
+    for key, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if x + w > width:
+            x, y, shelf = 0, y + shelf, 0
+        if y + h > height:
+            sheets.append({})
+            x = y = shelf = 0
+        sheets[-1][key] = (x, y)
+        x += w
+        shelf = max(shelf, h)
+    return [sheet for sheet in sheets if sheet]
+
+
+class AtlasBuilder:
+    def __init__(self, bucket, db, workers: int = 8, grace: timedelta = timedelta(hours=24),
+                 days_ahead: int = 60):
+        self.bucket = bucket
+        self.db = db
+        self.workers = workers
+        self.grace = grace
+        self.days_ahead = days_ahead
+        self.built_count = 0
+        self.unchanged_count = 0
+        self.deleted_count = 0
+        self.downloaded_count = 0
+        self.reused_count = 0
+        self.error_count = 0
+
+    def scan_thumbnails(self, collection: str) -> Dict[str, dict]:
+        """eventID -> {'name', 'md5'} of each event's thumbnail (PNG wins, as in the generators)"""
+        thumbnails = {}
+        for blob in list_blobs_lean(self.bucket, f"{collection}/", fields=('name', 'md5Hash')):
+            path_parts = blob.name.split('/')
+            if len(path_parts) < 3 or path_parts[2] not in THUMBNAIL_NAMES:
+                continue
+            if path_parts[1] not in thumbnails or blob.name.endswith('.png'):
+                thumbnails[path_parts[1]] = {'name': blob.name, 'md5': blob.md5_hash}
+        return thumbnails
+
+    def fetch_events(self, collection: str, event_ids: List[str]) -> Dict[str, dict]:
+        """Date and venue fields of upcoming events, batch-read from Firestore"""
+        now = datetime.now(timezone.utc)
+        earliest, latest = now - self.grace, now + timedelta(days=self.days_ahead)
+        events = {}
+        for i in range(0, len(event_ids), CHUNK_SIZE):
+            refs = [self.db.collection(collection).document(event_id)
+                    for event_id in event_ids[i:i + CHUNK_SIZE]]
+            for snapshot in self.db.get_all(refs, field_paths=DATE_FIELDS + ['venue']):
+                data = snapshot.to_dict() if snapshot.exists else None
+                start = parse_start(data) if data else None
+                if start and earliest <= start <= latest:
+                    events[snapshot.id] = data
+        return events
+
+    def group_members(self, grouping: str, events: Dict[str, dict],
+                      thumbnails: Dict[str, dict]) -> Dict[str, Dict[str, str]]:
+        """group -> {eventID: thumbnail md5}"""
+        groups = {}
+        for event_id, data in events.items():
+            group = GROUP_KEYS[grouping](data)
+            if group:
+                groups.setdefault(group, {})[event_id] = thumbnails[event_id]['md5']
+        return groups
+
+    def existing_atlases(self, prefix: str) -> Tuple[Dict[str, dict], List[str]]:
+        """Current indexes (group -> name, generation, signature) and every sheet under a prefix"""
+        indexes, sheets = {}, []
+        for blob in list_blobs_lean(self.bucket, prefix, fields=('name', 'generation', 'metadata')):
+            filename = blob.name[len(prefix):]
+            if filename.endswith('.json'):
+                indexes[filename[:-len('.json')]] = {'name': blob.name, 'generation': blob.generation,
+                                                     'signature': (blob.metadata or {}).get('signature')}
+            elif filename.endswith('.jpg'):
+                sheets.append(blob.name)
+        return indexes, sheets
+
+    def load_tiles(self, members: Dict[str, str], thumbnails: Dict[str, dict],
+                   previous: Optional[dict]) -> Tuple[Dict[str, Image.Image], Dict[str, int]]:
+        """Tile image per member, cut from the previous sheets when unchanged, downloaded otherwise
+        
+        Also returns how many sheets in a row each tile has been cut from (0 when downloaded).
+        """
+        tiles, copies = {}, {}
+        reusable = {}
+        if previous:
+            for event_id, tile in previous.get('tiles', {}).items():
+                if members.get(event_id) == tile.get('md5') and tile.get('copies', 0) < MAX_TILE_COPIES:
+                    reusable.setdefault(tile['image'], []).append((event_id, tile))
+
+        for image_number, items in reusable.items():
+            try:
+                path = previous['images'][image_number]['path']
+                sheet = Image.open(io.BytesIO(self.bucket.blob(path).download_as_bytes()))
+                sheet.load()
+                for event_id, tile in items:
+                    tiles[event_id] = sheet.crop((tile['x'], tile['y'],
+                                                  tile['x'] + tile['width'], tile['y'] + tile['height']))
+                    copies[event_id] = tile.get('copies', 0) + 1
+                self.reused_count += len(items)
+            except Exception as e:
+                # Downloaded again below
+                logger.warning(f"⚠️ Could not reuse tiles from the previous atlas: {e}")
+
+        def fetch(event_id: str) -> Tuple[str, Optional[Image.Image]]:
+            try:
+                data = self.bucket.blob(thumbnails[event_id]['name']).download_as_bytes()
+                with Image.open(io.BytesIO(data)) as img:
+                    img.draft('RGB', (TILE_SIZE, TILE_SIZE))
+                    tile = img.convert('RGB')
+                tile.thumbnail((TILE_SIZE, TILE_SIZE), Image.Resampling.LANCZOS)
+                return event_id, tile
+            except Exception as e:
+                logger.warning(f"⚠️ Could not read thumbnail of {event_id}: {e}")
+                return event_id, None
+
+        missing = [event_id for event_id in members if event_id not in tiles]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for event_id, tile in executor.map(fetch, missing):
+                if tile is not None:
+                    tiles[event_id] = tile
+                    copies[event_id] = 0
+                    self.downloaded_count += 1
+        return tiles, copies
+
+    def build_group(self, prefix: str, group: str, members: Dict[str, str], thumbnails: Dict[str, dict],
+                    existing: Optional[dict]) -> Optional[List[str]]:
+        """Write the sheets and index of one group, returning the sheet names it references (None on failure)"""
+        try:
+            previous = None
+            if existing:
+                previous = json.loads(self.bucket.blob(existing['name']).download_as_bytes())
+
+            tiles, copies = self.load_tiles(members, thumbnails, previous)
+            # Members whose thumbnail could not be read are left out, and retried next time
+            sig = signature({event_id: members[event_id] for event_id in tiles})
+            layout = pack({event_id: tile.size for event_id, tile in tiles.items()})
+
+            index = {'group': group, 'signature': sig, 'tileSize': TILE_SIZE,
+                     'generatedAt': datetime.now(timezone.utc).isoformat(), 'images': [], 'tiles': {}}
+            for image_number, positions in enumerate(layout):
+                width = max(x + tiles[event_id].width for event_id, (x, y) in positions.items())
+                height = max(y + tiles[event_id].height for event_id, (x, y) in positions.items())
+                sheet = Image.new('RGB', (width, height), 'white')
+                for event_id, (x, y) in positions.items():
+                    sheet.paste(tiles[event_id], (x, y))
+                    index['tiles'][event_id] = {'image': image_number, 'x': x, 'y': y,
+                                                'width': tiles[event_id].width,
+                                                'height': tiles[event_id].height, 'md5': members[event_id],
+                                                'copies': copies[event_id]}
+
+                path = f"{prefix}{group}-{sig}-{image_number}.jpg"
+                buffer = io.BytesIO()
+                sheet.save(buffer, format='JPEG', quality=ATLAS_QUALITY, optimize=True, progressive=True)
+                blob = self.bucket.blob(path)
+                blob.cache_control = SHEET_CACHE_CONTROL
+                upload_buffer(blob, buffer, content_type='image/jpeg')
+                index['images'].append({'path': path, 'width': width, 'height': height})
+
+            # Publish the index last, unless another runner replaced it meanwhile
+            blob = self.bucket.blob(f"{prefix}{group}.json")
+            blob.cache_control = INDEX_CACHE_CONTROL
+            blob.metadata = {'signature': sig, 'tiles': str(len(index['tiles']))}
+            blob.upload_from_string(json.dumps(index, separators=(',', ':')), content_type='application/json',
+                                    if_generation_match=existing['generation'] if existing else 0)
+            self.built_count += 1
+            logger.info(f"🧩 {prefix}{group}: {len(index['tiles'])} tiles in {len(index['images'])} sheets")
+            return [image['path'] for image in index['images']]
+
+        except PreconditionFailed:
+            logger.info(f"⏭️ {prefix}{group} was rebuilt by another run meanwhile, keeping it")
+            return None
+        except Exception as e:
+            logger.error(f"❌ Error building atlas {prefix}{group}: {e}")
+            self.error_count += 1
+            return None
+
+    def build(self, collection: str, grouping: str = 'day'):
+        """Bring the atlases of one collection and grouping up to date"""
+        prefix = f"{ATLAS_PREFIX}/{collection}/{grouping}/"
+        logger.info(f"🔍 Scanning {collection} for {grouping} atlases...")
+        thumbnails = self.scan_thumbnails(collection)
+        events = self.fetch_events(collection, list(thumbnails))
+        groups = self.group_members(grouping, events, thumbnails)
+        indexes, sheets = self.existing_atlases(prefix)
+
+        changed = {group: members for group, members in groups.items()
+                   if indexes.get(group, {}).get('signature') != signature(members)}
+        self.unchanged_count += len(groups) - len(changed)
+        logger.info(f"📋 {len(groups)} {grouping} groups with upcoming events in {collection}, "
+                    f"{len(changed)} to rebuild")
+
+        keep = set()
+        for group, members in sorted(changed.items()):
+            written = self.build_group(prefix, group, members, thumbnails, indexes.get(group))
+            if written is None:
+                # Leave everything of a group that failed or lost a race in place
+                keep.update(sheet for sheet in sheets if sheet.startswith(f"{prefix}{group}-"))
+            keep.update(written or [])
+
+        # Sheets of groups that did not change are still referenced
+        unchanged = set(groups) - set(changed)
+        keep.update(sheet for sheet in sheets
+                    if sheet[len(prefix):].rsplit('-', 2)[0] in unchanged)
+
+        batch = StorageBatch(self.bucket)
+        for group in set(indexes) - set(groups):
+            batch.delete(indexes[group]['name'], if_generation_match=indexes[group]['generation'])
+        for sheet in set(sheets) - keep:
+            batch.delete(sheet)
+        for result in batch.execute():
+            if result['status'] == 'ok':
+                self.deleted_count += 1
+
+    def build_all(self, collections: List[str], groupings: List[str]):
+        for collection in collections:
+            for grouping in groupings:
+                self.build(collection, grouping)
+
+        logger.info(f"\n📊 ATLAS SUMMARY:")
+        logger.info(f"="*50)
+        logger.info(f"🧩 Atlases rebuilt: {self.built_count} ({self.unchanged_count} unchanged)")
+        logger.info(f"♻️ Tiles reused from previous atlases: {self.reused_count}")
+        logger.info(f"📥 Thumbnails downloaded: {self.downloaded_count}")
+        logger.info(f"🗑️ Old atlas objects deleted: {self.deleted_count}")
+        logger.info(f"❌ Errors encountered: {self.error_count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build packed thumbnail atlases for list views")
+    parser.add_argument('--collections', default='events',
+                        help='Comma-separated collections, e.g. bayAreaEvents,austinEvents')
+    parser.add_argument('--grouping', default='day',
+                        help=f"Comma-separated groupings: {', '.join(GROUPINGS)}")
+    parser.add_argument('--days-ahead', type=int, default=60, help='Only events starting within this many days')
+    args = parser.parse_args()
+    collections = [c.strip() for c in args.collections.split(',') if c.strip()]
+    groupings = [g.strip() for g in args.grouping.split(',') if g.strip()]
+    unknown = set(groupings) - set(GROUPINGS)
+    if unknown:
+        parser.error(f"unknown grouping: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print("🧩 Thumbnail Atlas Builder")
+    print("==========================")
+    service_account_path = find_service_account()
+    print()
+
+    try:
+        initialize_firebase(service_account_path)
+        bucket, db = storage.bucket(), firestore.client()
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize Firebase: {e}")
+        sys.exit(1)
+
+    AtlasBuilder(bucket, db, days_ahead=args.days_ahead).build_all(collections, groupings)
+
+
+if __name__ == "__main__":
+    main()
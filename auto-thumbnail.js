@@ -10,6 +10,7 @@
 const admin = require("firebase-admin");
 const { spawn } = require("child_process");
 const path = require("path");
+const { WORKER_URL, WorkerUnavailableError, runEventOnWorker } = require("./thumbnail-worker-client");
 
 // Initialize Firebase Admin SDK
 const serviceAccount = require("../serviceAccountKey.json");
@@ -27,7 +28,27 @@ console.log("⏹️  Press Ctrl+C to stop");
 // Collections to monitor
 const collectionsToWatch = ['austinEvents', 'bayAreaEvents', 'testEvents'];
 
-function runThumbnailScript(eventId, collection) {
+async function runThumbnailScript(eventId, collection) {
+  // Prefer the long-lived worker: no interpreter start-up or Firebase setup per event
+  if (WORKER_URL) {
+    try {
+      console.log(`🐍 Sending ${collection}/${eventId} to thumbnail worker at ${WORKER_URL}`);
+      const job = await runEventOnWorker(eventId, collection);
+      console.log(`✅ Thumbnail generated successfully for ${eventId}`);
+      return job.logs.join('\n');
+    } catch (error) {
+      if (!(error instanceof WorkerUnavailableError)) {
+        console.error(`❌ Thumbnail generation failed for ${eventId}: ${error.message}`);
+        throw error;
+      }
+      console.log(`⚠️ ${error.message}, running the script directly`);
+    }
+  }
+  
+  return spawnThumbnailScript(eventId, collection);
+}
+
+function spawnThumbnailScript(eventId, collection) {
   return new Promise((resolve, reject) => {
     console.log(`🐍 Running thumbnail generator for ${collection}/${eventId}`);
     
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Backfill image metadata on existing event images and thumbnails
+
+New uploads carry custom metadata (width, height, format, quality, source
+MD5, generator and version; see storage_io.image_metadata). This script adds
+what can be known about the objects uploaded before that, so scans, audits
+and clients can rely on listing metadata alone:
+
+- width, height and format come from a ranged read of each image's header
+  (the first 64KB, never the whole image),
+- a thumbnail gets sourceMd5 when it was written after the current version
+  of its event_image, i.e. it was made from that version,
+- the metadata is applied with batched patch requests (see storage_batch.py),
+  each conditional on the object's generation, so an image replaced in the
+  meantime keeps the metadata of its own upload.
+
+Objects that already have width metadata are skipped, so the script can be
+re-run at any time.
+
+Usage:
+    python backfill_image_metadata.py --collections bayAreaEvents,austinEvents
+    python backfill_image_metadata.py --dry-run
+"""
+
+import sys
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from firebase_admin import storage
+from storage_io import list_blobs_lean, probe_blob, image_metadata
+from storage_batch import StorageBatch
+from firebase_setup import find_service_account, initialize_firebase, IMAGE_NAMES, THUMBNAIL_NAMES
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+)
+logger = logging.getLogger(__name__)
+
+
+class MetadataBackfill:
+    def __init__(self, bucket, workers: int = 8, dry_run: bool = False):
+        self.bucket = bucket
+        self.workers = workers
+        self.dry_run = dry_run
+        self.patched_count = 0
+        self.unreadable_count = 0
+        self.error_count = 0
+
+    def scan_collection(self, collection: str) -> List[dict]:
+        """Images and thumbnails in a collection that have no dimensions in their metadata yet"""
+        events = {}
+        for blob in list_blobs_lean(self.bucket, f"{collection}/",
+                                    fields=('name', 'size', 'md5Hash', 'generation', 'metadata')):
+            path_parts = blob.name.split('/')
+            if len(path_parts) < 3:
+                continue
+            event_id, filename = path_parts[1], path_parts[2]
+            item = {'name': blob.name, 'size': blob.size, 'md5': blob.md5_hash,
+                    'generation': blob.generation, 'metadata': blob.metadata or {}}
+            files = events.setdefault(event_id, {})
+            # PNG wins when both extensions exist, as in the generators
+            if filename in IMAGE_NAMES and ('image' not in files or filename.endswith('.png')):
+                files['image'] = item
+            elif filename in THUMBNAIL_NAMES and ('thumbnail' not in files or filename.endswith('.png')):
+                files['thumbnail'] = item
+
+        todo = []
+        for files in events.values():
+            image, thumbnail = files.get('image'), files.get('thumbnail')
+            if image and 'width' not in image['metadata']:
+                todo.append(image)
+            if thumbnail and 'width' not in thumbnail['metadata']:
+                # Made from the image's current version if written after it
+                if image and (thumbnail['generation'] or 0) > (image['generation'] or 0):
+                    thumbnail['source_md5'] = image['md5']
+                todo.append(thumbnail)
+        return todo
+
+    def describe(self, item: dict) -> Optional[Dict[str, str]]:
+        """Metadata for one object from its header"""
+        try:
+            probe = probe_blob(self.bucket.blob(item['name']), size=item['size'])
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read {item['name']}: {e}")
+            return None
+        if probe is None:
+            return None
+        return image_metadata(probe['width'], probe['height'], probe['format'], source_md5=item.get('source_md5'))
+
+    def backfill(self, collections: List[str]):
+        for collection in collections:
+            logger.info(f"🔍 Scanning {collection} for images without metadata...")
+            todo = self.scan_collection(collection)
+            logger.info(f"📋 {len(todo)} objects in {collection} need metadata")
+            if not todo:
+                continue
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                described = list(executor.map(self.describe, todo))
+
+            batch = StorageBatch(self.bucket)
+            for item, metadata in zip(todo, described):
+                if metadata is None:
+                    self.unreadable_count += 1
+                    continue
+                if self.dry_run:
+                    logger.info(f"🧪 Would set {item['name']}: {metadata}")
+                    continue
+                batch.set_metadata(item['name'], metadata, if_generation_match=item['generation'])
+
+            for result in batch.execute():
+                if result['status'] == 'ok':
+                    self.patched_count += 1
+                elif result['status'] != 'precondition_failed':
+                    # Replaced objects were uploaded with their own metadata
+                    logger.warning(f"⚠️ Could not update {result['name']}: {result['status']} ({result['code']})")
+                    self.error_count += 1
+
+        logger.info(f"\n📊 BACKFILL SUMMARY:")
+        logger.info(f"="*50)
+        logger.info(f"✅ Objects updated: {self.patched_count}")
+        logger.info(f"🔎 Headers not readable from the first 64KB: {self.unreadable_count}")
+        logger.info(f"❌ Errors encountered: {self.error_count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill image metadata on existing objects")
+    parser.add_argument('--collections', default='events',
+                        help='Comma-separated storage folders, e.g. bayAreaEvents,austinEvents')
+    parser.add_argument('--workers', type=int, default=8, help='Parallel header reads')
+    parser.add_argument('--dry-run', action='store_true', help='Only log the metadata that would be set')
+    args = parser.parse_args()
+    collections = [c.strip() for c in args.collections.split(',') if c.strip()]
+
+    print("🏷️ Image Metadata Backfill")
+    print("==========================")
+    service_account_path = find_service_account()
+    print()
+
+    try:
+        initialize_firebase(service_account_path)
+        bucket = storage.bucket()
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize Firebase: {e}")
+        sys.exit(1)
+
+    MetadataBackfill(bucket, workers=args.workers, dry_run=args.dry_run).backfill(collections)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ Quick script to check if thumbnails exist in Firebase Storage
 import firebase_admin
 from firebase_admin import credentials, storage
 import sys
+from storage_io import list_blobs_lean
 
 def check_thumbnail_exists():
     try:
@@ -56,7 +57,7 @@ def check_thumbnail_exists():
         # Let's also check if there are ANY events needing thumbnails
         print(f"\n🔍 Scanning {collection} for events needing thumbnails...")
         
-        all_blobs = bucket.list_blobs(prefix=f"{collection}/")
+        all_blobs = list_blobs_lean(bucket, f"{collection}/", fields=('name',))
         events = {}
         
         for blob in all_blobs:
@@ -17,6 +17,8 @@ import sys
 import firebase_admin
 from firebase_admin import credentials, storage
 import logging
+from run_planner import load_model, estimate, log_estimate
+from storage_io import list_blobs_lean
 
 # Configure logging
 logging.basicConfig(
@@ -56,8 +58,8 @@ class EventCounter:
         total_blobs = 0
         
         try:
-            # List all blobs in the collection folder
-            blobs = self.bucket.list_blobs(prefix=f"{collection}/")
+            # List all blobs in the collection folder (names and sizes only)
+            blobs = list_blobs_lean(self.bucket, f"{collection}/", fields=('name', 'size'))
             
             for blob in blobs:
                 total_blobs += 1
@@ -70,12 +72,13 @@ class EventCounter:
                     filename = path_parts[2]
                     
                     if event_id not in events:
-                        events[event_id] = {'has_image': False, 'has_thumbnail': False}
+                        events[event_id] = {'has_image': False, 'has_thumbnail': False, 'thumbnail_size': 0}
                     
                     if filename in ['event_image.png', 'event_image.jpg']:
                         events[event_id]['has_image'] = True
                     elif filename in ['event_thumbnail.png', 'event_thumbnail.jpg']:
                         events[event_id]['has_thumbnail'] = True
+                        events[event_id]['thumbnail_size'] = blob.size or 0
             
             # Count different categories
             total_events = len(events)
@@ -99,8 +102,10 @@ class EventCounter:
             if events_with_only_thumbnail > 0:
                 batches_of_500 = (events_with_only_thumbnail + 499) // 500  # Round up
                 logger.info(f"📦 Batches needed (500 each): {batches_of_500}")
-                estimated_time = batches_of_500 * 12.5  # ~12.5 minutes per batch
-                logger.info(f"⏱️  Estimated total time: {estimated_time:.1f} minutes")
+                # Based on the throughput measured by previous generator runs (3 workers, as in CI)
+                download_bytes = sum(e['thumbnail_size'] for e in events.values()
+                                     if not e['has_image'] and e['has_thumbnail'])
+                log_estimate(estimate(load_model('missing_images'), events_with_only_thumbnail, download_bytes, workers=3))
             
             return events_with_only_thumbnail
             
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Memory-aware admission control for image decodes
+
+Workers used to decode whatever arrived, so a few large originals decoding at
+once could push RSS past the runner's memory limit. DecodeAdmission estimates
+how many bytes a decode will need from the image header (Pillow only reads the
+header on Image.open) and admits jobs against a shared memory budget:
+
+- many small images decode concurrently,
+- a job larger than the free budget waits until enough memory is released,
+- a job larger than the whole budget runs alone,
+- images above max_pixels (decompression bombs) are refused outright.
+
+Jobs are admitted in arrival order, so a large image is never starved by a
+stream of small ones.
+
+Usage:
+    admission = DecodeAdmission(memory_budget=1024 * MB)
+    img = Image.open(buffer)                      # header only
+    cost = admission.estimate(img.width, img.height, img.mode)
+    if cost is None:
+        ...                                       # too many pixels, skip
+    with admission.admit(cost):
+        img = img.convert('RGB').resize(...)
+"""
+
+import threading
+import itertools
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Bytes per pixel for the decoded image in each Pillow mode
+MODE_BYTES = {
+    '1': 1, 'L': 1, 'P': 1, 'LA': 2, 'PA': 2, 'I;16': 2,
+    'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3,
+    'RGBA': 4, 'RGBa': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4,
+}
+
+DEFAULT_MEMORY_BUDGET = 1024 * MB
+DEFAULT_MAX_PIXELS = 100_000_000
+
+
+class DecodeAdmission:
+    """Admits decode jobs against a memory budget, in arrival order"""
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, max_pixels: int = DEFAULT_MAX_PIXELS):
+        self.memory_budget = memory_budget
+        self.max_pixels = max_pixels
+        self.in_use = 0
+        self.active = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._tickets = itertools.count()
+
+    def estimate(self, width: int, height: int, mode: str, output_pixels: int = 0) -> Optional[int]:
+        """Estimate peak bytes for decoding, converting to RGB and resizing an image
+
+        Returns None if the image exceeds the decompression-bomb cap.
+        """
+        pixels = width * height
+        if pixels > self.max_pixels:
+            logger.warning(f"💣 Refusing {width}x{height} image: {pixels:,} pixels exceeds cap of {self.max_pixels:,}")
+            return None
+
+        decoded = pixels * MODE_BYTES.get(mode, 4)
+        # convert('RGB') keeps the decoded image alive while it builds an RGB copy
+        converted = pixels * 3 if mode != 'RGB' else 0
+        # Resized output plus the encoder's working copy
+        return decoded + converted + output_pixels * 3 * 2
+
+    @contextmanager
+    def admit(self, cost: int):
+        """Block until `cost` bytes fit in the budget, then hold them for the with-block"""
+        ticket = next(self._tickets)
+        with self._cond:
+            self._waiting.append(ticket)
+            # First come first served; a job bigger than the whole budget runs once nothing else is active
+            while self._waiting[0] != ticket or (self.active and self.in_use + cost > self.memory_budget):
+                self._cond.wait()
+            self._waiting.popleft()
+            self.in_use += cost
+            self.active += 1
+            self.peak = max(self.peak, self.in_use)
+            self._cond.notify_all()
+
+        if cost > self.memory_budget:
+            logger.info(f"🐘 Decoding alone: estimated {cost / MB:.0f}MB exceeds budget of {self.memory_budget / MB:.0f}MB")
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= cost
+                self.active -= 1
+                self._cond.notify_all()
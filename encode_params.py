@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Remembered thumbnail encode parameters
+
+create_thumbnail searches for the largest PNG, or failing that the best JPEG
+quality and scale, that fits the size budget, which can take a dozen encodes.
+The point it settles on is recorded twice:
+
+- as custom metadata on the thumbnail blob (sourceMd5, format, quality,
+  width, height, scale, encodes, targetBytes), so any runner that lists the
+  collection learns it,
+- in a local JSON cache keyed by the source image's MD5, which outlives the
+  thumbnail (re-runs after deletion, format or budget changes).
+
+The next encode of the same source starts at the known-good point and
+normally finishes in a single encode. A point found for a larger or equal
+budget is a safe start: if it no longer fits, the search simply continues
+downwards from there. After a budget increase the search starts from the
+top again, since a better point may now fit.
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import Dict, Optional
+from json_store import file_lock, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+ENCODE_PARAMS_FILE = 'encode_params.json'
+
+# Blob metadata values are strings; these are converted back on read
+METADATA_TYPES = {
+    'format': str,
+    'quality': int,
+    'width': int,
+    'height': int,
+    'scale': float,
+    'encodes': int,
+    'targetBytes': int,
+}
+
+
+def to_metadata(params: dict, source_md5: Optional[str]) -> Dict[str, str]:
+    """Custom blob metadata recording the encode parameters of a thumbnail"""
+    metadata = {name: str(params[name]) for name in METADATA_TYPES if params.get(name) is not None}
+    if source_md5:
+        metadata['sourceMd5'] = source_md5
+    return metadata
+
+
+def from_metadata(metadata: Optional[dict]) -> Optional[dict]:
+    """Encode parameters from a thumbnail's custom metadata, None if it has none"""
+    if not metadata or 'sourceMd5' not in metadata or 'format' not in metadata:
+        return None
+    try:
+        return {name: cast(metadata[name]) for name, cast in METADATA_TYPES.items() if name in metadata}
+    except ValueError:
+        return None
+
+
+def usable_hint(params: Optional[dict], target_bytes: int) -> Optional[dict]:
+    """Known parameters that are a safe place to start a search for `target_bytes`"""
+    if not params or params.get('targetBytes', 0) < target_bytes:
+        return None
+    return params
+
+
+class EncodeParamCache:
+    """Thread-safe source MD5 -> encode parameters map, persisted to a JSON file"""
+
+    def __init__(self, path: str = ENCODE_PARAMS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.params = {}
+        self.dirty = {}
+        self.hits = 0  # encodes that started from known parameters
+
+        try:
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.params = json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read encode parameters from {path}, starting empty: {e}")
+
+    def get(self, source_md5: Optional[str]) -> Optional[dict]:
+        if not source_md5:
+            return None
+        with self.lock:
+            return self.params.get(source_md5)
+
+    def put(self, source_md5: Optional[str], params: dict):
+        if not source_md5:
+            return
+        with self.lock:
+            if self.params.get(source_md5) != params:
+                self.params[source_md5] = params
+                self.dirty[source_md5] = params
+
+    def hit(self):
+        """Count an encode that could start from the parameters found here"""
+        with self.lock:
+            self.hits += 1
+
+    def seed(self, metadata: Optional[dict]):
+        """Learn from an existing thumbnail's metadata, without overriding what this runner found"""
+        params = from_metadata(metadata)
+        if params:
+            with self.lock:
+                self.params.setdefault(metadata['sourceMd5'], params)
+
+    def save(self):
+        """Merge the parameters found since the last save into the file"""
+        with file_lock(self.path):
+            with self.lock:
+                if not self.dirty:
+                    return
+                dirty, self.dirty = self.dirty, {}
+            try:
+                stored = read_json(self.path)
+                stored.update(dirty)
+                write_json(self.path, stored)
+                logger.info(f"💾 Saved encode parameters for {len(dirty)} sources to {self.path}")
+
+            except Exception as e:
+                logger.warning(f"⚠️ Could not save encode parameters: {e}")
+                with self.lock:
+                    for source_md5, params in dirty.items():
+                        self.dirty.setdefault(source_md5, params)
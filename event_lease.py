@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Per-event leases so concurrent runs never duplicate work
+
+The scheduled workflow, the webhook server, the Firestore watcher, the worker
+daemon and manual runs can all pick up the same event at once. Before
+processing an event a runner creates a small lock object in the bucket with
+`if_generation_match=0`, which Cloud Storage only allows if the object does
+not exist yet. Exactly one runner wins; the others skip the event instantly.
+
+Leases expire after `ttl` seconds (recorded in the lock object's metadata),
+so a runner that crashes never blocks an event for long: the next runner
+takes an expired lease over with a precondition on its generation, so two
+runners cannot both take it over either. Lock objects live under
+`_leases/` rather than in the event folders, so storage scans never see them.
+"""
+
+import os
+import socket
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from google.api_core.exceptions import PreconditionFailed, NotFound
+
+logger = logging.getLogger(__name__)
+
+LEASE_PREFIX = '_leases'
+DEFAULT_TTL = 300
+
+
+class EventLeases:
+    """Acquire and release per-event lock objects in a storage bucket"""
+
+    def __init__(self, bucket, ttl: int = DEFAULT_TTL, owner: str = None):
+        self.bucket = bucket
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    def lock_name(self, collection: str, event_id: str) -> str:
+        return f"{LEASE_PREFIX}/{collection}/{event_id}.lock"
+
+    def acquire(self, collection: str, event_id: str) -> Optional[dict]:
+        """Take the lease on an event, returning it, or None if another runner holds it"""
+        name = self.lock_name(collection, event_id)
+        try:
+            return self._write(name, if_generation_match=0)
+        except PreconditionFailed:
+            pass
+
+        # Someone holds (or held) it: take it over only if it has expired
+        existing = self.bucket.get_blob(name)
+        if existing is None:
+            # Released between our attempt and the lookup
+            try:
+                return self._write(name, if_generation_match=0)
+            except PreconditionFailed:
+                return None
+
+        expires = (existing.metadata or {}).get('expiresAt')
+        if expires and datetime.fromisoformat(expires) > datetime.now(timezone.utc):
+            logger.info(f"🔒 {collection}/{event_id} is being processed by {existing.metadata.get('owner')}, skipping")
+            return None
+
+        try:
+            logger.info(f"♻️ Taking over expired lease on {collection}/{event_id}")
+            return self._write(name, if_generation_match=existing.generation)
+        except PreconditionFailed:
+            return None
+
+    def release(self, lease: dict):
+        """Delete the lock object, unless the lease expired and someone else took it over"""
+        try:
+            self.bucket.blob(lease['name']).delete(if_generation_match=lease['generation'])
+        except (PreconditionFailed, NotFound):
+            logger.warning(f"⚠️ Lease {lease['name']} was taken over before it was released")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not release lease {lease['name']}, it will expire: {e}")
+
+    def _write(self, name: str, if_generation_match: int) -> dict:
+        blob = self.bucket.blob(name)
+        blob.metadata = {
+            'owner': self.owner,
+            'expiresAt': (datetime.now(timezone.utc) + timedelta(seconds=self.ttl)).isoformat(),
+        }
+        blob.upload_from_string(b'', content_type='text/plain', if_generation_match=if_generation_match)
+        return {'name': name, 'generation': blob.generation}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Order thumbnail work by upcoming event date
+
+Storage listings come back in event ID order, which has nothing to do with
+when people will look at an event. EventPrioritizer batch-fetches the event
+documents for the candidate IDs from Firestore (get_all in chunks, reading
+only the date fields) and orders the work so that:
+
+1. upcoming events come first, soonest first (events that started within the
+   last `grace` period still count as upcoming),
+2. then events with no usable date,
+3. then past events, most recent first.
+
+A time-limited run therefore spends its time on events people will browse
+this weekend before anything else.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Firestore get_all batch size (keeps each BatchGetDocuments request small)
+CHUNK_SIZE = 300
+DATE_FIELDS = ['startDateTimestamp', 'date']
+
+
+def parse_start(data: dict) -> Optional[datetime]:
+    """Start time of an event document as an aware datetime"""
+    start = data.get('startDateTimestamp')
+    if isinstance(start, datetime):
+        return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+
+    date = data.get('date')
+    if isinstance(date, str) and date:
+        try:
+            start = datetime.fromisoformat(date.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+
+    return None
+
+
+class EventPrioritizer:
+    """Orders event IDs by their upcoming start date from Firestore"""
+
+    def __init__(self, db, chunk_size: int = CHUNK_SIZE, grace: timedelta = timedelta(hours=24)):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.grace = grace
+
+    def fetch_start_dates(self, collection: str, event_ids: List[str]) -> Dict[str, Optional[datetime]]:
+        """Batch-read the start date of each event document"""
+        start_dates = {}
+        for i in range(0, len(event_ids), self.chunk_size):
+            refs = [self.db.collection(collection).document(event_id)
+                    for event_id in event_ids[i:i + self.chunk_size]]
+            for snapshot in self.db.get_all(refs, field_paths=DATE_FIELDS):
+                start_dates[snapshot.id] = parse_start(snapshot.to_dict() or {}) if snapshot.exists else None
+        return start_dates
+
+    def order(self, collection: str, event_ids: List[str], now: datetime = None) -> List[str]:
+        """Return event_ids with upcoming events first, soonest first"""
+        if not event_ids:
+            return event_ids
+
+        try:
+            start_dates = self.fetch_start_dates(collection, event_ids)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read event dates for {collection}, keeping listing order: {e}")
+            return event_ids
+
+        cutoff = (now or datetime.now(timezone.utc)) - self.grace
+
+        def rank(event_id):
+            start = start_dates.get(event_id)
+            if start is None:
+                return (1, 0)
+            if start >= cutoff:
+                return (0, start.timestamp())
+            return (2, -start.timestamp())
+
+        ordered = sorted(event_ids, key=rank)
+        upcoming = sum(1 for event_id in event_ids if rank(event_id)[0] == 0)
+        logger.info(f"📅 Prioritised {len(event_ids)} events in {collection}: {upcoming} upcoming first")
+        return ordered
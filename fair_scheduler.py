@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Weighted fair queuing across collections
+
+Each collection (market) gets its own queue and a weight. pop() always serves
+the queue that has received the least weighted service so far, so a large
+backlog in one market cannot starve another: with weights bayAreaEvents=2 and
+austinEvents=1, Bay Area gets two jobs for every Austin job while both have
+work, and whichever still has work gets everything once the other is empty.
+
+Jobs can carry a cost (defaults to 1) so expensive jobs use up more of their
+queue's share.
+
+Usage:
+    scheduler = FairScheduler({'bayAreaEvents': 2})
+    scheduler.add('bayAreaEvents', ['e1', 'e2'])
+    scheduler.add('austinEvents', ['e3'])
+    while scheduler:
+        collection, event_id = scheduler.pop()
+"""
+
+from collections import deque
+from typing import Dict, Iterable, Tuple, Any
+
+
+class FairScheduler:
+    """Weighted fair queuing over named queues"""
+
+    def __init__(self, weights: Dict[str, float] = None, default_weight: float = 1.0):
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.queues = {}
+        self.passes = {}  # virtual finish time of each queue's service so far
+        self.virtual_time = 0.0
+        self._size = 0
+
+    def add(self, queue: str, items: Iterable[Any], costs: Iterable[float] = None):
+        """Append items (with optional per-item costs) to a queue"""
+        if queue not in self.queues:
+            self.queues[queue] = deque()
+            self.passes[queue] = self.virtual_time
+        elif not self.queues[queue]:
+            # An idle queue does not bank credit while it has nothing to run
+            self.passes[queue] = max(self.passes[queue], self.virtual_time)
+
+        items = list(items)
+        costs = list(costs) if costs is not None else [1.0] * len(items)
+        self.queues[queue].extend(zip(items, costs))
+        self._size += len(items)
+
+    def pop(self) -> Tuple[str, Any]:
+        """Remove and return (queue, item) from the queue that is furthest behind its share"""
+        candidates = [name for name, q in self.queues.items() if q]
+        if not candidates:
+            raise IndexError("pop from empty FairScheduler")
+
+        queue = min(candidates, key=lambda name: (self.passes[name], name))
+        item, cost = self.queues[queue].popleft()
+        self._size -= 1
+
+        self.virtual_time = self.passes[queue]
+        self.passes[queue] += cost / self.weights.get(queue, self.default_weight)
+        return queue, item
+
+    def pending(self, queue: str) -> int:
+        """Number of items still waiting in a queue"""
+        return len(self.queues.get(queue, ()))
+
+    def __len__(self) -> int:
+        return self._size
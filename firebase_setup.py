@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Firebase setup shared by the generators, the worker, the image service and
+the maintenance scripts
+
+- find_service_account() locates a service account key file, falling back
+  to GOOGLE_APPLICATION_CREDENTIALS,
+- initialize_firebase() initializes the Firebase Admin SDK once per process
+  with the project's storage bucket, from that key or default credentials,
+- IMAGE_NAMES and THUMBNAIL_NAMES are the object names of an event's image
+  and thumbnail under <collection>/<eventID>/.
+"""
+
+import os
+from typing import Optional
+import firebase_admin
+from firebase_admin import credentials
+
+STORAGE_BUCKET = 'hash-836eb.appspot.com'
+
+IMAGE_NAMES = ['event_image.png', 'event_image.jpg']
+THUMBNAIL_NAMES = ['event_thumbnail.png', 'event_thumbnail.jpg']
+
+
+def find_service_account() -> Optional[str]:
+    """Locate a service account key file (or GOOGLE_APPLICATION_CREDENTIALS), printing what was found"""
+    service_account_paths = [
+        './firebase-key.json',  # GitHub Actions
+        './serviceAccountKey.json',
+        '../serviceAccountKey.json',
+        './Hash/serviceAccountKey.json',
+        '../../serviceAccountKey.json',
+        os.path.expanduser('~/serviceAccountKey.json'),
+    ]
+
+    for path in service_account_paths:
+        if os.path.exists(path):
+            print(f"🔑 Using service account: {path}")
+            return path
+
+    if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+        path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+        print(f"🔑 Using credentials from environment: {path}")
+        return path
+
+    print("⚠️ No service account key found. Make sure:")
+    print("   1. You have serviceAccountKey.json in the project directory, OR")
+    print("   2. GOOGLE_APPLICATION_CREDENTIALS environment variable is set")
+    print("\n🔄 Continuing with default credentials...")
+    return None
+
+
+def initialize_firebase(service_account_path: str = None):
+    """Initialize the Firebase Admin SDK unless this process already did; errors propagate"""
+    if firebase_admin._apps:
+        return
+    if service_account_path and os.path.exists(service_account_path):
+        firebase_admin.initialize_app(credentials.Certificate(service_account_path),
+                                      {'storageBucket': STORAGE_BUCKET})
+    else:
+        # Default credentials (on Google Cloud or with GOOGLE_APPLICATION_CREDENTIALS)
+        firebase_admin.initialize_app(options={'storageBucket': STORAGE_BUCKET})
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Firestore-driven discovery of events needing thumbnails
+
+Listing every object in a collection's storage folder to find the few events
+without thumbnails gets slower as the bucket grows. Instead, the generator
+keeps a `thumbnailStatus` field on each event document:
+
+    pending   - has (or will have) an event_image and needs a thumbnail
+    done      - event_thumbnail has been generated
+    failed    - the image cannot be processed (see quarantine.py); set back
+                to pending to retry. Transient failures stay pending.
+
+Discovery then only reads candidate IDs with two indexed queries (both use
+Firestore's automatic single-field indexes, no composite index needed):
+
+    thumbnailStatus == 'pending'
+    createdAt >= now - since   (new events that have no status yet)
+
+Documents are read with an empty/one-field projection, so only IDs and the
+status come back. Existing collections are seeded once with
+`python generate_thumbnails.py --backfill-status`, which derives every
+event's status from a single storage listing.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from firestore_writer import BATCH_LIMIT
+
+logger = logging.getLogger(__name__)
+
+STATUS_FIELD = 'thumbnailStatus'
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class FirestoreDiscovery:
+    """Finds candidate events with indexed queries and seeds thumbnailStatus"""
+
+    def __init__(self, db, since: timedelta = timedelta(hours=72)):
+        self.db = db
+        self.since = since
+
+    def discover(self, collection: str) -> List[str]:
+        """IDs of events marked pending, plus recently created events with no status yet"""
+        ref = self.db.collection(collection)
+        candidates = []
+        seen = set()
+
+        for snapshot in ref.where(STATUS_FIELD, '==', PENDING).select([]).stream():
+            seen.add(snapshot.id)
+            candidates.append(snapshot.id)
+
+        created_after = datetime.now(timezone.utc) - self.since
+        for snapshot in ref.where('createdAt', '>=', created_after).select([STATUS_FIELD]).stream():
+            if snapshot.id in seen:
+                continue
+            if (snapshot.to_dict() or {}).get(STATUS_FIELD) is None:
+                candidates.append(snapshot.id)
+
+        logger.info(f"🔥 Firestore discovery found {len(candidates)} candidate events in {collection}")
+        return candidates
+
+    def backfill(self, collection: str, statuses: Dict[str, str]) -> int:
+        """Write many statuses in batches of up to 500, returning the number written"""
+        written = 0
+        items = list(statuses.items())
+        for i in range(0, len(items), BATCH_LIMIT):
+            chunk = items[i:i + BATCH_LIMIT]
+            refs = [self.db.collection(collection).document(event_id) for event_id, _ in chunk]
+
+            # update() fails the whole batch on a missing document, so only write existing ones
+            existing = {snapshot.id for snapshot in self.db.get_all(refs, field_paths=[STATUS_FIELD]) if snapshot.exists}
+
+            batch = self.db.batch()
+            count = 0
+            for ref, (event_id, status) in zip(refs, chunk):
+                if event_id in existing:
+                    batch.update(ref, {STATUS_FIELD: status})
+                    count += 1
+            if count:
+                batch.commit()
+            written += count
+
+        logger.info(f"📝 Backfilled {STATUS_FIELD} on {written} documents in {collection}")
+        return written
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Batched Firestore write-back of per-event results
+
+Writing each event's result with its own update() costs a round trip per
+event. BatchedWriter collects updates from any number of worker threads and
+commits them in WriteBatches of up to 500 (Firestore's limit), flushing early
+when results have waited longer than `flush_interval` seconds so a long or
+interrupted run does not sit on hundreds of unwritten results.
+
+Updates never create documents: if a batch fails (typically because one
+event document no longer exists), its writes are retried one by one and the
+missing documents are skipped.
+
+Usage:
+    writer = BatchedWriter(db)
+    writer.add('events', 'abc123', {'thumbnailWidth': 400})
+    writer.flush()
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Firestore's limit on writes per batch
+BATCH_LIMIT = 500
+
+
+class BatchedWriter:
+    """Thread-safe accumulator that commits document updates in WriteBatches"""
+
+    def __init__(self, db, batch_size: int = BATCH_LIMIT, flush_interval: float = 30.0):
+        self.db = db
+        self.batch_size = min(batch_size, BATCH_LIMIT)
+        self.flush_interval = flush_interval
+        self.pending = {}  # "collection/eventID" -> fields, so repeated updates merge into one write
+        self.lock = threading.Lock()
+        self.last_flush = time.time()
+        self.written_count = 0
+        self.failed_count = 0
+        self.batch_count = 0
+
+    def add(self, collection: str, event_id: str, fields: Dict):
+        """Queue an update of `fields` on collection/event_id, committing when a batch is due"""
+        with self.lock:
+            self.pending.setdefault(f"{collection}/{event_id}", {}).update(fields)
+            due = (len(self.pending) >= self.batch_size
+                   or time.time() - self.last_flush >= self.flush_interval)
+            writes = self._take() if due else []
+        if writes:
+            self._commit(writes)
+
+    def flush(self):
+        """Commit everything still pending"""
+        with self.lock:
+            writes = self._take()
+        for i in range(0, len(writes), self.batch_size):
+            self._commit(writes[i:i + self.batch_size])
+
+    def _take(self) -> List[Tuple[str, Dict]]:
+        """Remove and return the pending writes (caller holds the lock)"""
+        writes = list(self.pending.items())
+        self.pending = {}
+        self.last_flush = time.time()
+        return writes
+
+    def _commit(self, writes: List[Tuple[str, Dict]]):
+        """Commit writes as one batch, falling back to single updates if the batch fails"""
+        batch = self.db.batch()
+        for path, fields in writes:
+            batch.update(self._document(path), fields)
+
+        try:
+            batch.commit()
+            self._count(written=len(writes), batches=1)
+            logger.info(f"📝 Wrote results for {len(writes)} events in one batch")
+            return
+        except Exception as e:
+            logger.warning(f"⚠️ Batch of {len(writes)} updates failed, retrying individually: {e}")
+
+        for path, fields in writes:
+            try:
+                self._document(path).update(fields)
+                self._count(written=1)
+            except Exception as e:
+                logger.debug(f"Could not update {path}: {e}")
+                self._count(failed=1)
+
+    def _count(self, written: int = 0, failed: int = 0, batches: int = 0):
+        """Update the counters; commits run outside the lock, from several threads in the worker"""
+        with self.lock:
+            self.written_count += written
+            self.failed_count += failed
+            self.batch_count += batches
+
+    def _document(self, path: str):
+        collection, event_id = path.split('/', 1)
+        return self.db.collection(collection).document(event_id)
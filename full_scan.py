@@ -6,6 +6,7 @@ Full scan of both collections to see thumbnail coverage
 import firebase_admin
 from firebase_admin import credentials, storage
 import sys
+from storage_io import list_blobs_lean
 
 def full_scan():
     try:
@@ -23,7 +24,7 @@ def full_scan():
         for collection in collections:
             print(f"\n🔍 Scanning {collection}...")
             
-            all_blobs = bucket.list_blobs(prefix=f"{collection}/")
+            all_blobs = list_blobs_lean(bucket, f"{collection}/", fields=('name', 'size'))
             events = {}
             
             for blob in all_blobs:
@@ -3,11 +3,21 @@
 Firebase Storage Event Thumbnail Generator
 
 Generates event_thumbnail.png files for events that don't already have them.
-Processes all events in the 'events' Firebase Storage folder.
+Processes the 'events' Firebase Storage folder, or several collections concurrently.
 Maintains original aspect ratio while optimizing for 63KB size limit.
 
 Usage:
     python generate_thumbnails.py
+    python generate_thumbnails.py --workers 8 --memory-budget 2048
+    python generate_thumbnails.py --collections bayAreaEvents,austinEvents --weights bayAreaEvents=2
+    python generate_thumbnails.py --discovery firestore
+    python generate_thumbnails.py --backfill-status --collections bayAreaEvents,austinEvents
+    python generate_thumbnails.py --queue thumbnail_queue.db
+    python generate_thumbnails.py --event-id abc123 --collection bayAreaEvents   # one event, as the webhooks do
+    python generate_thumbnails.py --shard 0/4   # one of 4 parallel runners
+    python generate_thumbnails.py --dry-run --plan-output plan.json
+    python generate_thumbnails.py --stale   # redo thumbnails whose event_image was replaced
+    python generate_thumbnails.py --atlases day,venue
 
 Requirements:
     pip install firebase-admin pillow
@@ -18,21 +28,68 @@ This script will:
 3. Find events that have event_image.png but no event_thumbnail.png
 4. Download the full image, create an aspect-ratio-preserving thumbnail, and upload it
 5. Maintain a 63KB size limit for optimal loading performance
+6. Record the result (status, path, dimensions, bytes, content type, source md5,
+   BlurHash and a tiny base64 preview) in each event document, committed in
+   batches of up to 500 writes
+
+With --discovery firestore, step 2-3 become two indexed Firestore queries on
+thumbnailStatus and createdAt instead of a full storage listing (see
+firestore_discovery.py); seed existing collections once with --backfill-status.
+
+Each event is processed under a short lease (event_lease.py) and thumbnails are
+uploaded with an if_generation_match=0 precondition, so cron, webhook, worker
+and manual runs never duplicate or overwrite each other's work.
+
+Events whose image is empty or undecodable are quarantined (see
+quarantine.py) and skipped until that image is replaced.
+
+The format, quality and dimensions each thumbnail was encoded with are stored
+as blob metadata and in encode_params.json (see encode_params.py), so encoding
+the same source again usually takes a single attempt.
+
+Sources that are re-encoded copies of a picture that already has a thumbnail
+(same perceptual hash within a few bits, same aspect ratio, and the thumbnail
+matching the decoded source pixel by pixel; see perceptual_hash.py) get a
+server-side copy of that thumbnail instead of a new encode and upload.
+Disable with --no-reuse.
+
+With --atlases day,venue the run ends by rebuilding the sprite atlases of
+upcoming events whose members changed (see atlas_builder.py).
 """
 
-import os
 import sys
 from pathlib import Path
 import json
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Dict
 import io
+import copy
+import contextlib
 from PIL import Image
-import firebase_admin
-from firebase_admin import credentials, storage, firestore
+from firebase_admin import storage, firestore
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
 import time
 import logging
+import argparse
+from datetime import timedelta
+from decode_admission import DecodeAdmission, MB, DEFAULT_MEMORY_BUDGET, DEFAULT_MAX_PIXELS
+from storage_io import (reusable_buffer, download_into, sniff_content_type, upload_buffer, probe_blob,
+                        list_blobs_lean, image_metadata, PROBE_BYTES)
+from fair_scheduler import FairScheduler
+from event_priority import EventPrioritizer
+from firestore_discovery import FirestoreDiscovery, STATUS_FIELD, PENDING, DONE, FAILED
+from firestore_writer import BatchedWriter
+from placeholders import blurhash, lqip
+from job_queue import JobQueue
+from sharding import Shard, parse_shard, filter_shard, describe_shard
+from event_lease import EventLeases
+from google.api_core.exceptions import PreconditionFailed
+from run_planner import ThroughputRecorder, load_model, estimate, log_estimate, format_bytes
+from encode_params import EncodeParamCache, to_metadata, usable_hint
+from quarantine import Quarantine
+from perceptual_hash import PerceptualIndex, dhash, pixel_error, as_encoded, MAX_PIXEL_ERROR
+from atlas_builder import AtlasBuilder, GROUPINGS
+from firebase_setup import find_service_account, initialize_firebase
 
 # Configure logging
 logging.basicConfig(
@@ -45,36 +102,141 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEFAULT_COLLECTIONS = ['events']
+MAX_DIMENSION = 400
+MAX_THUMBNAIL_BYTES = 63 * 1024
+GENERATED_BY = 'python-generator'
+# Recorded on every thumbnail; bump when the encoding changes in a way worth auditing
+GENERATOR_VERSION = '1'
+
+# _process_event result for images that fail the same way every time (see quarantine.py)
+QUARANTINED = 'quarantined'
+
+# Object fields the storage scan reads (metadata: encode parameters and source MD5 of thumbnails)
+SCAN_FIELDS = ('name', 'size', 'md5Hash', 'generation', 'metadata')
+
+# EXIF orientation -> transpose that displays the image upright
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+def stale_reason(source: dict, thumbnail: dict) -> Optional[str]:
+    """Why a thumbnail no longer matches its source image, or None if it is current"""
+    if thumbnail['md5'] and thumbnail['md5'] == source['md5']:
+        return None  # copied as is
+    if thumbnail['md5'] and source.get('metadata', {}).get('sourceMd5') == thumbnail['md5']:
+        return None  # the image was made from this thumbnail (missing_image_engine.py)
+    recorded = thumbnail['metadata'].get('sourceMd5')
+    if recorded:
+        return 'source changed' if recorded != source['md5'] else None
+    if (source.get('generation') or 0) > (thumbnail['generation'] or 0):
+        return 'source newer'
+    return None
+
 class ThumbnailGenerator:
-    def __init__(self, service_account_path: str = None):
+    def __init__(self, service_account_path: str = None, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 max_pixels: int = DEFAULT_MAX_PIXELS, prioritize: bool = True,
+                 discovery: str = 'storage', since: timedelta = timedelta(hours=72), shard: Shard = None,
+                 leases: bool = True, stale: bool = False, reuse: bool = True):
         """Initialize Firebase connection"""
         self.bucket = None
         self.db = None
+        self.prioritizer = None
+        self.discovery = None
+        self.writer = None
+        self.leases = None
+        self.throughput = ThroughputRecorder('thumbnails')
+        self.encode_params = EncodeParamCache()
+        self.quarantine = Quarantine('thumbnails')
+        self.phashes = PerceptualIndex() if reuse else None
+        self.use_firestore_discovery = discovery == 'firestore'
+        self.shard = shard
+        self.stale = stale
+        self.admission = DecodeAdmission(memory_budget, max_pixels)
+        self.sources = {}  # "collection/eventID" -> event_image name and size, from the scan
+        self.thumbnails = {}  # "collection/eventID" -> existing event_thumbnail, from the scan
+        self.replace = {}  # "collection/eventID" -> generation of the stale thumbnail to overwrite
         self.processed_count = 0
+        self.copied_count = 0
+        self.reused_count = 0
         self.skipped_count = 0
         self.error_count = 0
         
         try:
-            # Initialize Firebase Admin SDK
-            if service_account_path and os.path.exists(service_account_path):
-                cred = credentials.Certificate(service_account_path)
-                firebase_admin.initialize_app(cred, {
-                    'storageBucket': 'hash-836eb.appspot.com'
-                })
-            else:
-                # Use default credentials (if running on Google Cloud or with GOOGLE_APPLICATION_CREDENTIALS)
-                firebase_admin.initialize_app({
-                    'storageBucket': 'hash-836eb.appspot.com'
-                })
-            
+            # Once per process, so a long-lived worker can create generators cheaply
+            initialize_firebase(service_account_path)
             self.bucket = storage.bucket()
             self.db = firestore.client()
+            self.prioritizer = EventPrioritizer(self.db) if prioritize else None
+            self.discovery = FirestoreDiscovery(self.db, since=since)
+            self.writer = BatchedWriter(self.db)
+            self.leases = EventLeases(self.bucket) if leases else None
             logger.info("✅ Firebase initialized successfully")
             
         except Exception as e:
             logger.error(f"❌ Failed to initialize Firebase: {e}")
             sys.exit(1)
 
+    def fork(self) -> 'ThumbnailGenerator':
+        """A generator for another run in this process, with its own scan state and counts
+        
+        Firebase clients, leases, the batched writer, the decode memory budget and
+        the encode parameter, quarantine and perceptual hash caches are shared, so
+        nothing is read from disk again and the owner's flushes cover both.
+        """
+        run = copy.copy(self)
+        run.throughput = ThroughputRecorder('thumbnails')
+        run.sources = {}
+        run.thumbnails = {}
+        run.replace = {}
+        run.processed_count = 0
+        run.copied_count = 0
+        run.reused_count = 0
+        run.skipped_count = 0
+        run.error_count = 0
+        return run
+
+    def scan_collection(self, collection: str) -> Dict[str, dict]:
+        """List a collection's storage folder once, grouping its files by event ID"""
+        # List all blobs in the collection folder, fetching only the fields used below
+        blobs = list_blobs_lean(self.bucket, f"{collection}/", fields=SCAN_FIELDS)
+        
+        # Group blobs by event ID
+        events = {}
+        for blob in blobs:
+            path_parts = blob.name.split('/')
+            if len(path_parts) >= 3:  # collection/eventID/filename
+                event_id = path_parts[1]
+                filename = path_parts[2]
+                
+                if event_id not in events:
+                    events[event_id] = {'has_image': False, 'has_thumbnail': False}
+                
+                if filename in ['event_image.png', 'event_image.jpg']:
+                    events[event_id]['has_image'] = True
+                    # Remember the source so processing needs no exists() lookups (PNG wins, as before)
+                    key = f"{collection}/{event_id}"
+                    if key not in self.sources or filename.endswith('.png'):
+                        self.sources[key] = {'name': blob.name, 'size': blob.size, 'md5': blob.md5_hash,
+                                             'generation': blob.generation, 'metadata': blob.metadata or {}}
+                elif filename in ['event_thumbnail.png', 'event_thumbnail.jpg']:
+                    events[event_id]['has_thumbnail'] = True
+                    self.encode_params.seed(blob.metadata)
+                    if self.phashes:
+                        self.phashes.seed(blob.name, blob.metadata)
+                    key = f"{collection}/{event_id}"
+                    if key not in self.thumbnails or filename.endswith('.png'):
+                        self.thumbnails[key] = {'name': blob.name, 'md5': blob.md5_hash,
+                                                'generation': blob.generation, 'metadata': blob.metadata or {}}
+        
+        return events
+
     def get_events_needing_thumbnails(self, collection: str) -> List[str]:
         """Get list of event IDs that need thumbnails generated"""
         logger.info(f"🔍 Scanning {collection} for events needing thumbnails...")
@@ -82,24 +244,7 @@ class ThumbnailGenerator:
         events_needing_thumbnails = []
         
         try:
-            # List all blobs in the collection folder
-            blobs = self.bucket.list_blobs(prefix=f"{collection}/")
-            
-            # Group blobs by event ID
-            events = {}
-            for blob in blobs:
-                path_parts = blob.name.split('/')
-                if len(path_parts) >= 3:  # collection/eventID/filename
-                    event_id = path_parts[1]
-                    filename = path_parts[2]
-                    
-                    if event_id not in events:
-                        events[event_id] = {'has_image': False, 'has_thumbnail': False}
-                    
-                    if filename in ['event_image.png', 'event_image.jpg']:
-                        events[event_id]['has_image'] = True
-                    elif filename in ['event_thumbnail.png', 'event_thumbnail.jpg']:
-                        events[event_id]['has_thumbnail'] = True
+            events = self.scan_collection(collection)
             
             # Find events that have images but no thumbnails
             for event_id, files in events.items():
@@ -113,65 +258,374 @@ class ThumbnailGenerator:
             logger.error(f"❌ Error scanning {collection}: {e}")
             return []
 
-    def download_image(self, collection: str, event_id: str) -> Optional[bytes]:
-        """Download the original event image"""
+    def get_stale_events(self, collection: str) -> List[str]:
+        """Get list of event IDs whose thumbnail was made from an older version of their image
+        
+        A thumbnail is current if it is a byte-for-byte copy of the image (same MD5),
+        if the source MD5 recorded in its metadata matches the image, or if the
+        image was upscaled from it (the image's recorded source MD5). Thumbnails
+        from before that metadata existed are stale if the image was written after
+        them (a higher object generation). The stale thumbnail's generation is
+        remembered, so regenerating overwrites exactly that version and nothing newer.
+        """
+        logger.info(f"🔍 Scanning {collection} for stale thumbnails...")
+        
+        try:
+            events = self.scan_collection(collection)
+            reasons = {}
+            stale_events = []
+            
+            for event_id, files in events.items():
+                key = f"{collection}/{event_id}"
+                if not (files['has_image'] and files['has_thumbnail']):
+                    continue
+                reason = stale_reason(self.sources[key], self.thumbnails[key])
+                if reason:
+                    stale_events.append(event_id)
+                    reasons[reason] = reasons.get(reason, 0) + 1
+                    thumbnail = self.thumbnails[key]
+                    # A legacy .jpg thumbnail is superseded by a new .png one
+                    self.replace[key] = thumbnail['generation'] if thumbnail['name'].endswith('.png') else 0
+            
+            logger.info(f"📊 Found {len(stale_events)} stale thumbnails in {collection}"
+                        + (f" ({', '.join(f'{n} {r}' for r, n in reasons.items())})" if reasons else ""))
+            return stale_events
+            
+        except Exception as e:
+            logger.error(f"❌ Error scanning {collection}: {e}")
+            return []
+
+    def discover_events(self, collection: str) -> List[str]:
+        """Events needing thumbnails, soonest upcoming first when prioritising"""
+        if self.stale:
+            events = self.get_stale_events(collection)
+        elif self.use_firestore_discovery:
+            try:
+                events = self.discovery.discover(collection)
+            except Exception as e:
+                logger.warning(f"⚠️ Firestore discovery failed for {collection}, scanning storage instead: {e}")
+                events = self.get_events_needing_thumbnails(collection)
+        else:
+            events = self.get_events_needing_thumbnails(collection)
+        events = self.quarantine.filter(collection, events, self.sources)
+        if self.shard:
+            total = len(events)
+            events = filter_shard(events, self.shard)
+            logger.info(f"🧩 {describe_shard(self.shard)}: {len(events)} of {total} events in {collection}")
+        if self.prioritizer:
+            events = self.prioritizer.order(collection, events)
+        return events
+
+    def backfill_status(self, collections: List[str]) -> int:
+        """Seed thumbnailStatus on existing event documents from one storage listing per collection"""
+        written = 0
+        for collection in collections:
+            try:
+                logger.info(f"🔍 Scanning {collection} to backfill thumbnail status...")
+                statuses = {
+                    event_id: DONE if files['has_thumbnail'] else PENDING
+                    for event_id, files in self.scan_collection(collection).items()
+                    if files['has_image'] or files['has_thumbnail']
+                }
+                written += self.discovery.backfill(collection, statuses)
+            except Exception as e:
+                logger.error(f"❌ Error backfilling status for {collection}: {e}")
+        return written
+
+    def has_thumbnail(self, collection: str, event_id: str) -> bool:
+        """Whether event_thumbnail already exists (for candidates the storage scan did not see)"""
+        for ext in ['png', 'jpg']:
+            if self.bucket.get_blob(f"{collection}/{event_id}/event_thumbnail.{ext}") is not None:
+                return True
+        return False
+
+    def find_source(self, collection: str, event_id: str) -> Optional[dict]:
+        """Find the original event image, from the scan if it saw it"""
+        source = self.sources.get(f"{collection}/{event_id}")
+        if source:
+            return source
+        
         try:
             # Try PNG first, then JPG
             for ext in ['png', 'jpg']:
-                blob_path = f"{collection}/{event_id}/event_image.{ext}"
-                blob = self.bucket.blob(blob_path)
-                
-                if blob.exists():
-                    logger.info(f"📥 Downloading {blob_path}")
-                    return blob.download_as_bytes()
+                blob = self.bucket.get_blob(f"{collection}/{event_id}/event_image.{ext}")
+                if blob is not None:
+                    return {'name': blob.name, 'size': blob.size, 'md5': blob.md5_hash,
+                            'generation': blob.generation, 'metadata': blob.metadata or {}}
             
             logger.warning(f"⚠️ No event_image found for {collection}/{event_id}")
             return None
             
         except Exception as e:
-            logger.error(f"❌ Error downloading image for {event_id}: {e}")
+            logger.error(f"❌ Error looking up image for {event_id}: {e}")
             return None
 
-    def create_thumbnail(self, image_data: bytes, target_size: int = 63 * 1024) -> Optional[bytes]:
-        """Create optimized thumbnail preserving aspect ratio with 63KB size limit"""
+    def probe_image(self, source: dict) -> Optional[dict]:
+        """Read just the header of the original image with a ranged request"""
         try:
-            # Open the image
-            img = Image.open(io.BytesIO(image_data))
+            probe = probe_blob(self.bucket.blob(source['name']), size=source['size'])
+            if probe:
+                logger.info(f"🔎 Probed {source['name']}: {probe['format']} {probe['width']}x{probe['height']}, "
+                            f"orientation {probe['orientation']}")
+            return probe
+        
+        except Exception as e:
+            logger.warning(f"⚠️ Could not probe {source['name']}, downloading it whole: {e}")
+            return None
+
+    def fits_thumbnail(self, source: dict, probe: dict) -> bool:
+        """Whether the original already meets the thumbnail constraints and can be copied as is"""
+        return (probe['format'] in ('JPEG', 'PNG')
+                and source['size'] is not None and source['size'] <= MAX_THUMBNAIL_BYTES
+                and max(probe['width'], probe['height']) <= MAX_DIMENSION
+                and probe['orientation'] == 1)
+
+    def copy_as_thumbnail(self, collection: str, event_id: str, source: dict, probe: dict,
+                          if_generation_match: int = 0) -> Optional[dict]:
+        """Copy the original to event_thumbnail server-side, without downloading it
+        
+        Like upload_thumbnail, only writes if the thumbnail's generation still matches
+        (0: it must not exist yet) and returns {} if another run got there first.
+        """
+        try:
+            blob_path = f"{collection}/{event_id}/event_thumbnail.png"
+            copied = self.bucket.copy_blob(self.bucket.blob(source['name']), self.bucket, blob_path,
+                                           if_generation_match=if_generation_match)
+            logger.info(f"📋 Copied {source['name']} to {blob_path} ({source['size']} bytes, already thumbnail-sized)")
+            
+            # A copy keeps the original's metadata: describe it as a thumbnail like an upload would
+            try:
+                copied.metadata = image_metadata(probe['width'], probe['height'], probe['format'],
+                                                 source_md5=source.get('md5'), generator=GENERATED_BY,
+                                                 version=GENERATOR_VERSION)
+                copied.patch(if_generation_match=copied.generation)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not set metadata on {blob_path}: {e}")
+            return {
+                'thumbnailPath': blob_path,
+                'thumbnailWidth': probe['width'],
+                'thumbnailHeight': probe['height'],
+                'thumbnailBytes': source['size'],
+                'thumbnailContentType': 'image/jpeg' if probe['format'] == 'JPEG' else 'image/png',
+            }
+        
+        except PreconditionFailed:
+            logger.info(f"⏭️ {collection}/{event_id} got a thumbnail from another run while we worked, keeping it")
+            self.skipped_count += 1
+            return {}
+        except Exception as e:
+            logger.error(f"❌ Error copying thumbnail for {event_id}: {e}")
+            return None
+
+    def reuse_thumbnail(self, collection: str, event_id: str, source: dict, img: Image.Image, phash: int,
+                        if_generation_match: int = 0) -> Optional[dict]:
+        """Copy the thumbnail of a near-identical source server-side instead of encoding a new one
+        
+        Returns the thumbnail fields like copy_as_thumbnail ({} if another run stored
+        a thumbnail first), or None when there is no usable match and the image
+        should be encoded as usual.
+        """
+        blob_path = f"{collection}/{event_id}/event_thumbnail.png"
+        match = self.phashes.find(phash, img.width / img.height, exclude=blob_path)
+        if match is None:
+            return None
+        
+        try:
+            existing = self.bucket.get_blob(match['path'])
+            if existing is None or (existing.metadata or {}).get('sourceMd5') != match['sourceMd5']:
+                # Deleted or regenerated from another picture since it was indexed
+                self.phashes.forget(match['hash'])
+                return None
+            
+            # The hashes only say the pictures look alike; compare them before trusting the match, putting
+            # the source through the thumbnail's encoder so its compression loss is not counted as a difference
+            candidate = Image.open(io.BytesIO(existing.download_as_bytes()))
+            candidate.load()
+            reference = img if img.size == candidate.size else img.resize(candidate.size, Image.Resampling.LANCZOS)
+            if candidate.format != 'PNG':
+                quality = int((existing.metadata or {}).get('quality', 85))
+                reference = as_encoded(reference, candidate.format, quality)
+            error = pixel_error(candidate, reference)
+            if error > MAX_PIXEL_ERROR:
+                logger.info(f"🔍 {match['path']} hashes like {collection}/{event_id} but differs "
+                            f"(RMS error {error:.1f}), encoding instead")
+                return None
+            
+            # Built before copying: nothing after the copy may fail over to a second thumbnail
+            metadata = dict(existing.metadata or {})
+            metadata.update(sourceMd5=source.get('md5'), phash=f"{phash:016x}", reusedFrom=match['path'])
+            
+            copied = self.bucket.copy_blob(existing, self.bucket, blob_path, if_generation_match=if_generation_match,
+                                           source_generation=existing.generation)
+            logger.info(f"♻️ Reused {match['path']} for {collection}/{event_id} "
+                        f"(near-identical source, {match['distance']} bits and RMS error {error:.1f} apart)")
+            
+            try:
+                copied.metadata = metadata
+                copied.patch(if_generation_match=copied.generation)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not set metadata on {blob_path}: {e}")
+            
+            return {
+                'thumbnailPath': blob_path,
+                'thumbnailWidth': candidate.width,
+                'thumbnailHeight': candidate.height,
+                'thumbnailBytes': existing.size,
+                'thumbnailContentType': existing.content_type,
+            }
+        
+        except PreconditionFailed:
+            logger.info(f"⏭️ {collection}/{event_id} got a thumbnail from another run while we worked, keeping it")
+            self.skipped_count += 1
+            return {}
+        except Exception as e:
+            logger.warning(f"⚠️ Could not reuse {match['path']} for {collection}/{event_id}, encoding instead: {e}")
+            return None
+
+    def compute_placeholders(self, img: Image.Image) -> dict:
+        """BlurHash and tiny data-URI preview of an already decoded image"""
+        try:
+            return {'thumbnailBlurHash': blurhash(img), 'thumbnailLqip': lqip(img)}
+        except Exception as e:
+            logger.warning(f"⚠️ Could not compute placeholders: {e}")
+            return {}
+
+    def placeholders_from_probe(self, probe: dict) -> dict:
+        """Placeholders for a copied thumbnail, decoded from the probe when it read the whole file"""
+        if not probe['complete']:
+            return {}
+        try:
+            img = Image.open(io.BytesIO(probe['head']))
+            img.load()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not decode probed image for placeholders: {e}")
+            return {}
+        return self.compute_placeholders(img)
+
+    def download_image(self, source: dict, probe: Optional[dict] = None) -> Optional[io.BytesIO]:
+        """Download the original event image into this worker's reusable buffer"""
+        try:
+            buffer = reusable_buffer('download')
+            
+            # Small images were read completely by the probe
+            if probe and probe['complete']:
+                buffer.write(probe['head'])
+                buffer.seek(0)
+                return buffer
+            
+            logger.info(f"📥 Downloading {source['name']}")
+            return download_into(self.bucket.blob(source['name']), buffer)
+            
+        except Exception as e:
+            logger.error(f"❌ Error downloading {source['name']}: {e}")
+            return None
+
+    def create_thumbnail(self, image_data: io.BytesIO, target_size: int = MAX_THUMBNAIL_BYTES,
+                         orientation: int = 1, hint: Optional[dict] = None) -> Optional[Tuple[io.BytesIO, dict]]:
+        """Create optimized thumbnail preserving aspect ratio with 63KB size limit
+
+        Reads the source straight from its buffer and returns the encode buffer
+        holding the thumbnail, ready to upload without another copy, together
+        with the thumbnail's final width and height and its placeholder fields
+        (BlurHash and LQIP, see placeholders.py) and the encode parameters it
+        settled on. JPEGs are decoded in draft mode at the smallest scale that
+        still covers the thumbnail, and the EXIF orientation is applied to the
+        result. `hint` is a previous encode's parameters for the same source
+        (see encode_params.py), where the size search starts.
+        """
+        img = self.decode_thumbnail(image_data, orientation)
+        if img is None:
+            return None
+        return self.encode_thumbnail(img, target_size, hint)
+
+    def decode_thumbnail(self, image_data: io.BytesIO, orientation: int = 1,
+                         max_size: Tuple[int, int] = (MAX_DIMENSION, MAX_DIMENSION)) -> Optional[Image.Image]:
+        """Decode the source upright and scaled to fit max_size (never enlarged), within the decode memory budget"""
+        try:
+            # Open the image (reads the header only, pixels are decoded later)
+            img = Image.open(image_data)
             original_width, original_height = img.size
             aspect_ratio = original_width / original_height
             
             logger.info(f"📐 Original size: {original_width}x{original_height} (ratio: {aspect_ratio:.2f})")
             
-            # Convert to RGB if necessary (for JPEG output)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Start with a max dimension of 400px while preserving aspect ratio
-            max_dimension = 400
+            # Fit in max_size (400px square for thumbnails) while preserving aspect ratio
+            max_width, max_height = max_size
             
-            if original_width >= original_height:
-                # Landscape or square - limit width
-                new_width = min(max_dimension, original_width)
+            if original_width * max_height >= original_height * max_width:
+                # Wider than the box - limit width
+                new_width = min(max_width, original_width)
                 new_height = int(new_width / aspect_ratio)
             else:
-                # Portrait - limit height
-                new_height = min(max_dimension, original_height)
+                # Taller than the box - limit height
+                new_height = min(max_height, original_height)
                 new_width = int(new_height * aspect_ratio)
             
-            # Resize image maintaining aspect ratio
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that is still big enough
+            if img.format == 'JPEG':
+                img.draft('RGB', (new_width, new_height))
+            
+            # Wait for enough of the memory budget before decoding
+            cost = self.admission.estimate(img.width, img.height, img.mode, new_width * new_height)
+            if cost is None:
+                return None
+            
+            with self.admission.admit(cost):
+                # Convert to RGB if necessary (for JPEG output)
+                if img.mode in ('RGBA', 'LA', 'P'):
+                    img = img.convert('RGB')
+                
+                # Resize image maintaining aspect ratio
+                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
             
-            # Optimize to meet size limit while preserving aspect ratio
+            # Display the thumbnail upright; cheaper on the small image than the original
+            if orientation in EXIF_TRANSPOSE:
+                img = img.transpose(EXIF_TRANSPOSE[orientation])
+            return img
+            
+        except Exception as e:
+            logger.error(f"❌ Error decoding image: {e}")
+            return None
+
+    def encode_thumbnail(self, img: Image.Image, target_size: int = MAX_THUMBNAIL_BYTES,
+                         hint: Optional[dict] = None,
+                         formats: Tuple[str, ...] = ('PNG', 'JPEG'),
+                         placeholders: bool = True) -> Optional[Tuple[io.BytesIO, dict]]:
+        """Encode a decoded thumbnail-sized image under target_size bytes (see create_thumbnail)
+        
+        `formats` are the formats allowed: PNG is tried first at each scale, then
+        the lossy format (JPEG or WEBP) over decreasing qualities. Without
+        `placeholders` the BlurHash and LQIP fields are left out of the result.
+        """
+        try:
+            new_width, new_height = img.size
+            lossy = next((fmt for fmt in formats if fmt != 'PNG'), None)
+            
+            # Placeholders come from the decoded image we already have, before any re-encoding
+            placeholders = self.compute_placeholders(img) if placeholders else {}
+            
+            # Optimize to meet size limit while preserving aspect ratio, starting
+            # from the parameters that worked for this source before, if any
             quality = 85
             dimension_scale = 1.0
+            png_too_big_at = None  # PNG size does not depend on quality: try it once per scale
+            encodes = 0
+            
+            hint = usable_hint(hint, target_size)
+            if hint:
+                self.encode_params.hit()
+                dimension_scale = hint['scale']
+                if hint['format'] != 'PNG':
+                    quality = hint['quality']
+                    png_too_big_at = dimension_scale
             
             while quality > 15 and dimension_scale > 0.3:
                 # Calculate current dimensions
                 current_width = int(new_width * dimension_scale)
                 current_height = int(new_height * dimension_scale)
                 
-                # Ensure minimum size
-                if current_width < 100 or current_height < 100:
+                # Ensure minimum size (smaller images are only ever encoded as they are)
+                if dimension_scale < 1.0 and (current_width < 100 or current_height < 100):
                     break
                 
                 # Resize if dimensions changed
@@ -181,152 +635,357 @@ class ThumbnailGenerator:
                     resized_img = img
                 
                 # Try PNG first
-                output = io.BytesIO()
-                resized_img.save(output, format='PNG', optimize=True)
-                png_size = output.tell()
-                
-                if png_size <= target_size:
-                    output.seek(0)
-                    result = output.read()
-                    logger.info(f"📏 Thumbnail (PNG): {current_width}x{current_height}, {len(result)} bytes")
-                    return result
-                
-                # Try JPEG if PNG is too large
-                output = io.BytesIO()
-                resized_img.save(output, format='JPEG', quality=quality, optimize=True)
-                jpeg_size = output.tell()
+                if 'PNG' in formats and png_too_big_at != dimension_scale:
+                    output = reusable_buffer('encode')
+                    resized_img.save(output, format='PNG', optimize=True)
+                    encodes += 1
+                    png_size = output.tell()
+                    
+                    if png_size <= target_size:
+                        logger.info(f"📏 Thumbnail (PNG): {current_width}x{current_height}, {png_size} bytes"
+                                    f"{' (known parameters)' if hint else ''}")
+                        return output, {'width': current_width, 'height': current_height, **placeholders,
+                                        'encode': self._encode_params('PNG', None, dimension_scale, current_width,
+                                                                      current_height, encodes, target_size)}
+                    png_too_big_at = dimension_scale
                 
-                if jpeg_size <= target_size:
-                    output.seek(0)
-                    result = output.read()
-                    logger.info(f"📏 Thumbnail (JPEG): {current_width}x{current_height}, {len(result)} bytes, quality={quality}")
-                    return result
+                # Then the lossy format (JPEG for thumbnails) if PNG is too large
+                if lossy:
+                    output = reusable_buffer('encode')
+                    resized_img.save(output, format=lossy, quality=quality, optimize=True)
+                    encodes += 1
+                    lossy_size = output.tell()
+                    
+                    if lossy_size <= target_size:
+                        logger.info(f"📏 Thumbnail ({lossy}): {current_width}x{current_height}, {lossy_size} bytes, "
+                                    f"quality={quality}{' (known parameters)' if hint else ''}")
+                        return output, {'width': current_width, 'height': current_height, **placeholders,
+                                        'encode': self._encode_params(lossy, quality, dimension_scale, current_width,
+                                                                      current_height, encodes, target_size)}
                 
                 # Adjust parameters for next iteration
-                if quality > 50:
+                if lossy and quality > 50:
                     quality -= 10
-                elif quality > 25:
+                elif lossy and quality > 25:
                     quality -= 5
                 else:
                     # Reduce dimensions while maintaining aspect ratio
-                    dimension_scale -= 0.1
+                    dimension_scale = round(dimension_scale - 0.1, 2)
                     quality = 85  # Reset quality when reducing size
             
             # Final attempt with very low quality
-            final_width = max(100, int(new_width * 0.5))
-            final_height = max(100, int(new_height * 0.5))
+            final_width = max(min(100, new_width), int(new_width * 0.5))
+            final_height = max(min(100, new_height), int(new_height * 0.5))
+            final_format = lossy or 'PNG'
             
             final_img = img.resize((final_width, final_height), Image.Resampling.LANCZOS)
-            output = io.BytesIO()
-            final_img.save(output, format='JPEG', quality=15, optimize=True)
-            output.seek(0)
-            result = output.read()
+            output = reusable_buffer('encode')
+            final_img.save(output, format=final_format, quality=15, optimize=True)
+            encodes += 1
             
-            logger.info(f"📏 Final thumbnail: {final_width}x{final_height}, {len(result)} bytes")
-            return result
+            logger.info(f"📏 Final thumbnail: {final_width}x{final_height}, {output.tell()} bytes")
+            return output, {'width': final_width, 'height': final_height, **placeholders,
+                            'encode': self._encode_params(final_format, 15 if lossy else None, 0.3, final_width,
+                                                          final_height, encodes, target_size)}
             
         except Exception as e:
             logger.error(f"❌ Error creating thumbnail: {e}")
             return None
 
-    def upload_thumbnail(self, collection: str, event_id: str, thumbnail_data: bytes) -> bool:
-        """Upload thumbnail to Firebase Storage"""
+    @staticmethod
+    def _encode_params(fmt: str, quality: Optional[int], scale: float, width: int, height: int,
+                       encodes: int, target_size: int) -> dict:
+        return {'format': fmt, 'quality': quality, 'scale': scale, 'width': width, 'height': height,
+                'encodes': encodes, 'targetBytes': target_size}
+
+    def upload_thumbnail(self, collection: str, event_id: str, thumbnail_data: io.BytesIO,
+                         if_generation_match: int = 0, metadata: Dict[str, str] = None) -> Optional[dict]:
+        """Upload thumbnail to Firebase Storage straight from the encode buffer, returning what was stored
+        
+        The upload is conditional on the thumbnail's generation (0: it must not exist
+        yet), so a run never overwrites a thumbnail another run just wrote; that case
+        returns {}.
+        """
         try:
             blob_path = f"{collection}/{event_id}/event_thumbnail.png"
             blob = self.bucket.blob(blob_path)
+            blob.metadata = metadata
             
             # Detect if this is a JPEG or PNG based on the data
-            is_jpeg = thumbnail_data.startswith(b'\xff\xd8\xff')
-            content_type = 'image/jpeg' if is_jpeg else 'image/png'
+            content_type = sniff_content_type(thumbnail_data)
             
             # Upload with proper content type
-            blob.upload_from_string(thumbnail_data, content_type=content_type)
+            size = upload_buffer(blob, thumbnail_data, content_type=content_type,
+                                 if_generation_match=if_generation_match)
             
-            logger.info(f"✅ Uploaded thumbnail: {blob_path} ({len(thumbnail_data)} bytes) as {content_type}")
-            return True
+            logger.info(f"✅ Uploaded thumbnail: {blob_path} ({size} bytes) as {content_type}")
+            return {'thumbnailPath': blob_path, 'thumbnailBytes': size, 'thumbnailContentType': content_type}
             
+        except PreconditionFailed:
+            logger.info(f"⏭️ {collection}/{event_id} got a thumbnail from another run while we worked, keeping it")
+            self.skipped_count += 1
+            return {}
         except Exception as e:
             logger.error(f"❌ Error uploading thumbnail for {event_id}: {e}")
-            return False
+            return None
 
     def process_event(self, collection: str, event_id: str) -> bool:
-        """Process a single event - download, create thumbnail, upload"""
+        """Process a single event under its lease and queue the result for the batched Firestore write-back"""
+        lease = None
+        if self.leases:
+            try:
+                lease = self.leases.acquire(collection, event_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not take the lease on {collection}/{event_id}, processing anyway: {e}")
+                lease = {}
+            if lease is None:
+                # Another runner holds it and will record the result
+                self.skipped_count += 1
+                return True
+        
+        try:
+            result = self._process_event(collection, event_id)
+        finally:
+            if lease:
+                self.leases.release(lease)
+        
+        if result is None:
+            return False
+        
+        if result == QUARANTINED:
+            # Fails the same way until the image is replaced
+            self.writer.add(collection, event_id, {STATUS_FIELD: FAILED})
+            return False
+        
+        if result is False:
+            # Transient (download, upload, copy): stays a candidate for the next run
+            self.writer.add(collection, event_id, {STATUS_FIELD: PENDING})
+            return False
+        
+        if result:
+            result.update({
+                'thumbnailGenerated': True,
+                'thumbnailGeneratedAt': firestore.SERVER_TIMESTAMP,
+                'thumbnailGeneratedBy': GENERATED_BY,
+            })
+        self.writer.add(collection, event_id, {STATUS_FIELD: DONE, **result})
+        return True
+
+    def _process_event(self, collection: str, event_id: str):
+        """Process a single event - download, create thumbnail, upload
+        
+        Returns the fields describing the new thumbnail ({} if it already
+        existed or another run stored one first), False on a transient failure, QUARANTINED when the
+        image can never be processed, or None when the event has no image yet so its status is left alone.
+        """
         try:
             logger.info(f"🚀 Processing {collection}/{event_id}")
+            started = time.time()
+            
+            # Regenerating a stale thumbnail overwrites only the version that was found stale
+            replace = self.replace.get(f"{collection}/{event_id}", 0)
+            
+            # Firestore candidates were not seen by a storage scan: skip if another run got there first
+            if f"{collection}/{event_id}" not in self.sources and self.has_thumbnail(collection, event_id):
+                logger.info(f"⏭️ Thumbnail already exists for {collection}/{event_id}")
+                self.skipped_count += 1
+                return {}
+            
+            key = f"{collection}/{event_id}"
+            source = self.find_source(collection, event_id)
+            if source is None:
+                # No image yet: leave the status so the event is picked up once it has one
+                self.error_count += 1
+                return None
+            
+            # Sources that already failed for good are retried only once they are replaced
+            if self.quarantine.is_quarantined(key, source['name'], source.get('generation')):
+                logger.info(f"🚫 Skipping {key}: {source['name']} is quarantined")
+                return None
+            if source['size'] == 0:
+                self.quarantine.add(key, source['name'], source.get('generation'), 'empty event_image')
+                self.error_count += 1
+                return QUARANTINED
+            
+            # Read only the header first
+            probe = self.probe_image(source)
+            orientation = 1
+            if probe:
+                orientation = probe['orientation']
+                
+                # Refuse decompression bombs before downloading them
+                if self.admission.estimate(probe['width'], probe['height'], probe['mode']) is None:
+                    self.quarantine.add(key, source['name'], source.get('generation'),
+                                        f"too many pixels ({probe['width']}x{probe['height']})")
+                    self.error_count += 1
+                    return QUARANTINED
+                
+                # Already thumbnail-sized: copy server-side instead of re-encoding
+                if self.fits_thumbnail(source, probe):
+                    stored = self.copy_as_thumbnail(collection, event_id, source, probe, if_generation_match=replace)
+                    if stored is None:
+                        self.error_count += 1
+                        return False
+                    self.quarantine.release(key)
+                    if stored:
+                        self.copied_count += 1
+                        self.processed_count += 1
+                        self.throughput.record(time.time() - started, min(source['size'], PROBE_BYTES), 0)
+                        stored['thumbnailSourceMd5'] = source.get('md5')
+                        stored.update(self.placeholders_from_probe(probe))
+                    return stored
             
             # Download original image
-            image_data = self.download_image(collection, event_id)
-            if not image_data:
+            image_data = self.download_image(source, probe)
+            if image_data is None:
                 self.error_count += 1
                 return False
             
-            # Create thumbnail preserving aspect ratio
-            thumbnail_data = self.create_thumbnail(image_data)
-            if not thumbnail_data:
+            # Decode at thumbnail size, preserving aspect ratio
+            img = self.decode_thumbnail(image_data, orientation)
+            if img is None:
+                # Truncated or corrupt data fails the same way every time
+                self.quarantine.add(key, source['name'], source.get('generation'), 'could not decode event_image')
+                self.error_count += 1
+                return QUARANTINED
+            phash = dhash(img)
+            
+            # A near-identical picture already has a thumbnail: copy it rather than encode and upload
+            if self.phashes:
+                stored = self.reuse_thumbnail(collection, event_id, source, img, phash, if_generation_match=replace)
+                if stored is not None:
+                    self.quarantine.release(key)
+                    if stored:
+                        self.reused_count += 1
+                        self.processed_count += 1
+                        self.throughput.record(time.time() - started, source['size'], 0)
+                        stored['thumbnailSourceMd5'] = source.get('md5')
+                        stored.update(self.compute_placeholders(img))
+                    return stored
+            
+            thumbnail = self.encode_thumbnail(img, hint=self.encode_params.get(source.get('md5')))
+            if thumbnail is None:
                 self.error_count += 1
                 return False
+            thumbnail_data, info = thumbnail
+            params = info.pop('encode')
+            self.encode_params.put(source.get('md5'), params)
             
-            # Upload thumbnail
-            if self.upload_thumbnail(collection, event_id, thumbnail_data):
-                self.processed_count += 1
-                return True
-            else:
+            # Upload thumbnail, recording how it was encoded
+            metadata = to_metadata(params, source.get('md5'))
+            metadata.update(generator=GENERATED_BY, generatorVersion=GENERATOR_VERSION, phash=f"{phash:016x}")
+            stored = self.upload_thumbnail(collection, event_id, thumbnail_data, if_generation_match=replace,
+                                           metadata=metadata)
+            if stored is None:
                 self.error_count += 1
                 return False
+            self.quarantine.release(key)
+            if stored:
+                if self.phashes:
+                    self.phashes.add(phash, stored['thumbnailPath'], source.get('md5'), img.width / img.height)
+                self.processed_count += 1
+                self.throughput.record(time.time() - started, source['size'], stored['thumbnailBytes'])
+                stored.update({
+                    'thumbnailWidth': info.pop('width'),
+                    'thumbnailHeight': info.pop('height'),
+                    'thumbnailSourceMd5': source.get('md5'),
+                    **info,
+                })
+            return stored
                 
         except Exception as e:
             logger.error(f"❌ Error processing {collection}/{event_id}: {e}")
             self.error_count += 1
             return False
 
-    def generate_thumbnails(self, max_workers: int = 5):
-        """Main function to generate all missing thumbnails"""
+    def generate_thumbnails(self, max_workers: int = 5, collections: List[str] = None,
+                            weights: Dict[str, float] = None, executor=None):
+        """Main function to generate all missing thumbnails
+        
+        Collections are scanned concurrently and their events share one worker
+        pool through a weighted fair scheduler, so processing starts as soon as
+        the first scan finishes and no single market's backlog starves the others.
+        With `executor` (anything with submit(), e.g. the worker's shared pool),
+        scans and events run there instead of in pools of this run's own.
+        """
         logger.info("🏁 Starting thumbnail generation process")
         start_time = time.time()
         
-        collections = ['events']
+        collections = collections or DEFAULT_COLLECTIONS
+        scheduler = FairScheduler(weights)
+        totals = {}
+        completed = {collection: 0 for collection in collections}
         
-        for collection in collections:
-            logger.info(f"\n📁 Processing collection: {collection}")
-            
-            # Get events needing thumbnails
-            events = self.get_events_needing_thumbnails(collection)
-            
-            if not events:
-                logger.info(f"✅ No thumbnails needed for {collection}")
-                continue
-            
-            logger.info(f"📋 Will process {len(events)} events with {max_workers} workers")
-            
-            # Process events in parallel
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {
-                    executor.submit(self.process_event, collection, event_id): event_id 
-                    for event_id in events
+        logger.info(f"📁 Collections: {', '.join(collections)} with {max_workers} shared workers")
+        
+        try:
+            with contextlib.ExitStack() as pools:
+                if executor is None:
+                    scan_executor = pools.enter_context(ThreadPoolExecutor(max_workers=len(collections)))
+                    executor = pools.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+                else:
+                    scan_executor = executor
+                scans = {
+                    scan_executor.submit(self.discover_events, collection): collection
+                    for collection in collections
                 }
+                futures = {}
                 
-                completed = 0
-                for future in concurrent.futures.as_completed(futures):
-                    event_id = futures[future]
-                    completed += 1
+                while scans or futures or scheduler:
+                    # Keep every worker busy, always serving the collection furthest behind its share
+                    while scheduler and len(futures) < max_workers:
+                        collection, event_id = scheduler.pop()
+                        futures[executor.submit(self.process_event, collection, event_id)] = (collection, event_id)
+                    
+                    done, _ = concurrent.futures.wait(
+                        list(scans) + list(futures), return_when=concurrent.futures.FIRST_COMPLETED
+                    )
                     
-                    try:
-                        success = future.result()
-                        status = "✅" if success else "❌"
-                        logger.info(f"{status} [{completed}/{len(events)}] {collection}/{event_id}")
+                    for future in done:
+                        if future in scans:
+                            collection = scans.pop(future)
+                            events = future.result()
+                            totals[collection] = len(events)
+                            if events:
+                                logger.info(f"📋 Queued {len(events)} events from {collection}")
+                                scheduler.add(collection, events)
+                            else:
+                                logger.info(f"✅ No thumbnails needed for {collection}")
+                            continue
                         
-                    except Exception as e:
-                        logger.error(f"❌ [{completed}/{len(events)}] Exception processing {event_id}: {e}")
-                        self.error_count += 1
+                        collection, event_id = futures.pop(future)
+                        completed[collection] += 1
+                        progress = f"[{completed[collection]}/{totals[collection]}]"
+                        
+                        try:
+                            success = future.result()
+                            status = "✅" if success else "❌"
+                            logger.info(f"{status} {progress} {collection}/{event_id}")
+                            
+                        except Exception as e:
+                            logger.error(f"❌ {progress} Exception processing {event_id}: {e}")
+                            self.error_count += 1
+        finally:
+            # Write back whatever results are still queued, even if the run was interrupted
+            self.writer.flush()
         
         # Summary
         elapsed_time = time.time() - start_time
+        self.throughput.save(elapsed_time, max_workers)
+        self.save_caches()
         logger.info(f"\n📊 FINAL SUMMARY:")
         logger.info(f"="*50)
         logger.info(f"✅ Successfully processed: {self.processed_count} thumbnails")
+        logger.info(f"📋 Copied server-side (already thumbnail-sized): {self.copied_count}")
+        logger.info(f"♻️ Reused from near-identical sources: {self.reused_count}")
+        logger.info(f"🎯 Encoded from known parameters: {self.encode_params.hits}")
         logger.info(f"⏭️ Skipped (already existed): {self.skipped_count}")
+        logger.info(f"🚫 Skipped (quarantined): {self.quarantine.skipped}")
         logger.info(f"❌ Errors encountered: {self.error_count}")
         logger.info(f"⏱️ Total time: {elapsed_time:.2f} seconds")
+        logger.info(f"🧠 Peak estimated decode memory: {self.admission.peak / MB:.0f}MB")
+        logger.info(f"📝 Firestore results written: {self.writer.written_count} in {self.writer.batch_count} batches "
+                    f"({self.writer.failed_count} failed)")
         
         if self.processed_count > 0:
             logger.info(f"🚀 Average processing time: {elapsed_time/self.processed_count:.2f} seconds per thumbnail")
@@ -337,52 +996,212 @@ class ThumbnailGenerator:
             logger.info("   - No events found with source images")
             logger.info("   - Connection or permission issues")
 
+    def save_caches(self):
+        """Persist what this run learned: encode parameters, quarantine and perceptual hashes"""
+        self.encode_params.save()
+        self.quarantine.save()
+        if self.phashes:
+            self.phashes.save()
+
+    def plan_run(self, collections: List[str] = None, max_workers: int = 5, output: str = None) -> dict:
+        """Dry run: build the exact work list from listing metadata and estimate its cost
+        
+        Nothing is downloaded, leased or written. Sizes and formats come from the
+        storage listing (or object metadata for Firestore-discovered events), and
+        the ETA from the throughput measured by previous runs (see run_planner.py).
+        """
+        collections = collections or DEFAULT_COLLECTIONS
+        logger.info(f"🧪 Dry run: planning thumbnails for {', '.join(collections)}")
+        
+        work = []
+        for collection in collections:
+            for event_id in self.discover_events(collection):
+                source = self.find_source(collection, event_id)
+                if source is None:
+                    continue
+                size = source['size'] or 0
+                extension = source['name'].rsplit('.', 1)[-1].upper()
+                work.append({
+                    'collection': collection,
+                    'eventId': event_id,
+                    'source': source['name'],
+                    'bytes': size,
+                    'format': 'JPEG' if extension == 'JPG' else extension,
+                    # Small originals are copied server-side if the header probe confirms their dimensions
+                    'action': 'copy' if size <= MAX_THUMBNAIL_BYTES else 'encode',
+                })
+        
+        plan = estimate(load_model('thumbnails'), len(work), sum(item['bytes'] for item in work), max_workers)
+        plan['workers'] = max_workers
+        
+        logger.info(f"\n🧪 DRY RUN PLAN:")
+        logger.info(f"="*50)
+        for collection in collections:
+            items = [item for item in work if item['collection'] == collection]
+            if items:
+                formats = ', '.join(f"{fmt} {sum(1 for i in items if i['format'] == fmt)}"
+                                    for fmt in sorted({i['format'] for i in items}))
+                copies = sum(1 for i in items if i['action'] == 'copy')
+                logger.info(f"📁 {collection}: {len(items)} events ({formats}), "
+                            f"{copies} small enough to copy, {format_bytes(sum(i['bytes'] for i in items))} of sources")
+        log_estimate(plan)
+        
+        if output:
+            with open(output, 'w') as f:
+                json.dump({'estimate': plan, 'events': work}, f, indent=2)
+            logger.info(f"📝 Work list written to {output}")
+        
+        return plan
+
+    def drain_queue(self, queue: JobQueue, max_workers: int = 5):
+        """Process every event waiting in the durable job queue as one batch
+        
+        Events are claimed a few batches' worth at a time so their leases stay
+        short; failures go back to the queue with a backoff.
+        """
+        logger.info(f"📬 Draining job queue {queue.path}: {queue.stats()}")
+        start_time = time.time()
+        
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                while True:
+                    items = queue.claim(max_workers * 4, ignore_debounce=True)
+                    if not items:
+                        break
+                    
+                    futures = {
+                        executor.submit(self.process_event, item['collection'], item['event_id']): item
+                        for item in items
+                    }
+                    for future in concurrent.futures.as_completed(futures):
+                        item = futures[future]
+                        try:
+                            success = future.result()
+                        except Exception as e:
+                            logger.error(f"❌ Exception processing {item['event_id']}: {e}")
+                            self.error_count += 1
+                            success = False
+                        
+                        if success:
+                            queue.ack(item)
+                        else:
+                            queue.nack(item, 'thumbnail generation failed')
+        finally:
+            self.writer.flush()
+        
+        self.throughput.save(time.time() - start_time, max_workers)
+        self.save_caches()
+        logger.info(f"📊 Queue drained in {time.time() - start_time:.2f} seconds: "
+                    f"{self.processed_count} processed, {self.skipped_count} skipped, {self.error_count} errors")
+        logger.info(f"📬 Left in queue: {queue.stats()}")
+
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="Firebase Event Thumbnail Generator", allow_abbrev=False)
+    parser.add_argument('--workers', type=int, default=6,
+                        help='Parallel workers; memory use is bounded by --memory-budget, not by this')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // MB,
+                        help='Megabytes of decoded image data allowed in flight at once')
+    parser.add_argument('--max-pixels', type=int, default=DEFAULT_MAX_PIXELS,
+                        help='Refuse source images with more pixels than this (decompression bombs)')
+    parser.add_argument('--collections', default=','.join(DEFAULT_COLLECTIONS),
+                        help='Comma-separated storage folders to process concurrently, '
+                             'e.g. bayAreaEvents,austinEvents,testEvents')
+    parser.add_argument('--weights', default='',
+                        help='Fair-share weights per collection, e.g. bayAreaEvents=2,austinEvents=1 (default 1 each)')
+    parser.add_argument('--no-prioritize', dest='prioritize', action='store_false',
+                        help='Process in listing order instead of soonest upcoming event first')
+    parser.add_argument('--discovery', choices=['storage', 'firestore'], default='storage',
+                        help='Find candidates by listing storage, or by querying thumbnailStatus in Firestore')
+    parser.add_argument('--since-hours', type=float, default=72,
+                        help='With --discovery firestore, also check events created in this window that have no status')
+    parser.add_argument('--backfill-status', action='store_true',
+                        help='Seed thumbnailStatus on existing events from a storage listing, then exit')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='Only process events whose ID hashes to shard i of N, for N parallel runners')
+    parser.add_argument('--no-leases', dest='leases', action='store_false',
+                        help='Do not take per-event leases (only safe when no other run can be active)')
+    parser.add_argument('--stale', action='store_true',
+                        help='Regenerate only thumbnails made from an older version of their event_image')
+    parser.add_argument('--no-reuse', dest='reuse', action='store_false',
+                        help='Always encode, even when a near-identical image already has a thumbnail')
+    parser.add_argument('--atlases', metavar='GROUPINGS',
+                        help='Afterwards rebuild the changed thumbnail atlases, grouped by day and/or venue')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only list the work and estimate bytes and time; nothing is downloaded or written')
+    parser.add_argument('--plan-output', metavar='PATH', help='With --dry-run, also write the work list as JSON')
+    parser.add_argument('--queue', metavar='PATH',
+                        help='Process the events waiting in this SQLite job queue instead of discovering them')
+    parser.add_argument('--event-id', help='Process only this event (exit status 1 if it fails)')
+    parser.add_argument('--collection', help=f"With --event-id, the storage folder of the event "
+                                             f"(default {DEFAULT_COLLECTIONS[0]})")
+    parser.add_argument('--verbose', action='store_true', help='Log debug messages too')
+    args = parser.parse_args()
+    if args.collection and not args.event_id:
+        parser.error("--collection only applies with --event-id; use --collections for full runs")
+    args.collection = args.collection or DEFAULT_COLLECTIONS[0]
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+    collections = [c.strip() for c in args.collections.split(',') if c.strip()]
+    weights = {}
+    for item in filter(None, args.weights.split(',')):
+        name, _, weight = item.partition('=')
+        weights[name.strip()] = float(weight)
+    groupings = [g.strip() for g in (args.atlases or '').split(',') if g.strip()]
+    if set(groupings) - set(GROUPINGS):
+        parser.error(f"--atlases takes a comma-separated list of: {', '.join(GROUPINGS)}")
+    
     print("🎨 Firebase Event Thumbnail Generator")
     print("=====================================")
     print("📐 Preserves original aspect ratio")
     print("⚡ Optimizes for 63KB size limit")
-    print("🔥 Processes all events in 'events' folder")
+    if args.event_id:
+        print(f"🎯 Processes one event: {args.collection}/{args.event_id}")
+    else:
+        print(f"🔥 Processes all events in: {', '.join(collections)}")
+    print(f"🧠 Decode memory budget: {args.memory_budget}MB")
+    print(f"🔍 Discovery: {'stale thumbnails' if args.stale else args.discovery}")
+    if args.shard:
+        print(f"🧩 Processing {describe_shard(args.shard)}")
     print()
     
-    # Check for service account file
-    service_account_paths = [
-        './firebase-key.json',  # GitHub Actions
-        './serviceAccountKey.json',
-        '../serviceAccountKey.json',
-        './Hash/serviceAccountKey.json',
-        '../../serviceAccountKey.json',
-        os.path.expanduser('~/serviceAccountKey.json'),
-    ]
-    
-    service_account_path = None
-    for path in service_account_paths:
-        if os.path.exists(path):
-            service_account_path = path
-            print(f"🔑 Using service account: {path}")
-            break
-    
-    # Check for GOOGLE_APPLICATION_CREDENTIALS environment variable
-    if not service_account_path and os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
-        service_account_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-        print(f"🔑 Using credentials from environment: {service_account_path}")
-    
-    if not service_account_path:
-        print("⚠️ No service account key found. Make sure:")
-        print("   1. You have serviceAccountKey.json in the project directory, OR")
-        print("   2. GOOGLE_APPLICATION_CREDENTIALS environment variable is set")
-        print("\n🔄 Continuing with default credentials...")
+    service_account_path = find_service_account()
     
     print()
     
     # Create generator and run
-    generator = ThumbnailGenerator(service_account_path)
+    generator = ThumbnailGenerator(service_account_path, memory_budget=args.memory_budget * MB,
+                                   max_pixels=args.max_pixels, prioritize=args.prioritize,
+                                   discovery=args.discovery, since=timedelta(hours=args.since_hours),
+                                   shard=args.shard, leases=args.leases, stale=args.stale,
+                                   reuse=args.reuse)
+    
+    if args.backfill_status:
+        written = generator.backfill_status(collections)
+        print(f"\n📝 Backfilled thumbnail status on {written} events")
+        return
+    
+    if args.event_id:
+        success = generator.process_event(args.collection, args.event_id)
+        generator.writer.flush()
+        generator.save_caches()
+        print(f"\n{'🎉' if success else '💥'} {args.collection}/{args.event_id}: {'done' if success else 'failed'}")
+        sys.exit(0 if success else 1)
     
     try:
-        generator.generate_thumbnails(max_workers=3)  # Conservative for Firebase limits
+        if args.dry_run:
+            generator.plan_run(collections, max_workers=args.workers, output=args.plan_output)
+            print("\n🧪 Dry run complete, nothing was changed")
+            return
+        if args.queue:
+            generator.drain_queue(JobQueue(args.queue), max_workers=args.workers)
+        else:
+            generator.generate_thumbnails(max_workers=args.workers, collections=collections, weights=weights)
         print("\n🎉 Thumbnail generation completed!")
         
+        if groupings:
+            AtlasBuilder(generator.bucket, generator.db, workers=args.workers).build_all(collections, groupings)
+        
     except KeyboardInterrupt:
         print("\n⛔ Process interrupted by user")
         print("💡 Partial progress has been saved to Firebase Storage")
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+On-demand event image renditions
+
+Serves any width and format of an event image without a batch regeneration:
+
+    GET /<collection>/<eventId>?w=<width>&fmt=<auto|jpeg|png|webp>
+    GET /health
+
+A request looks up the event_image (cached for SOURCE_TTL seconds), fetches
+the original once (kept in a memory LRU of originals, so other widths of the
+same image do not download it again), decodes it with the thumbnail
+generator's decoder (draft-mode JPEG decoding, EXIF orientation, the decode
+memory budget) and encodes it with its budgeted encoder, the budget growing
+with the area of the rendition (63KB at 400px, like the thumbnails).
+
+Renditions are cached by source version (its MD5, or name and generation
+for composite objects, which have none), width and format in a memory LRU in
+front of a disk LRU, both bounded in bytes (see rendition_cache.py). A
+replaced event_image has a new version and so new cache keys; the old
+renditions age out. Concurrent identical requests are coalesced into one download and
+one encode. Widths are rounded up to a multiple of WIDTH_STEP so clients
+cannot fill the cache with near-identical sizes, and images are never
+enlarged.
+
+Responses carry an ETag (304 on If-None-Match), Cache-Control and
+X-Cache: memory, disk or miss.
+
+Usage:
+    python image_service.py --port 8766 --memory-cache 256 --disk-cache 2048
+    IMAGE_SERVICE_URL=http://127.0.0.1:8766 npm start   # mobile-thumbnail-runner proxies /images/...
+"""
+
+import io
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+from PIL import Image
+
+from generate_thumbnails import ThumbnailGenerator, MAX_DIMENSION, MAX_THUMBNAIL_BYTES
+from decode_admission import MB, DEFAULT_MEMORY_BUDGET
+from firebase_setup import find_service_account
+from rendition_cache import MemoryLRU, RenditionCache, SingleFlight
+from storage_io import exif_orientation, sniff_content_type
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8766
+DEFAULT_CACHE_DIR = 'rendition_cache'
+
+# Requested widths are rounded up to a multiple of WIDTH_STEP within these bounds
+WIDTH_STEP = 40
+MIN_WIDTH = 40
+MAX_WIDTH = 1600
+# Portrait renditions may be at most this many times as tall as wide
+MAX_ASPECT = 4
+MIN_RENDITION_BYTES = 8 * 1024
+
+FORMATS = {
+    'auto': ('PNG', 'JPEG'),
+    'jpeg': ('JPEG',),
+    'png': ('PNG',),
+    'webp': ('WEBP',),
+}
+
+SOURCE_TTL = 60.0
+CACHE_CONTROL = 'public, max-age=86400'
+PATH_PART = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def rendition_width(value: Optional[str]) -> Optional[int]:
+    """Width to render for a ?w= value (MAX_DIMENSION if absent), None if it is not a number"""
+    if not value:
+        return MAX_DIMENSION
+    try:
+        width = int(value)
+    except ValueError:
+        return None
+    width = -(-width // WIDTH_STEP) * WIDTH_STEP
+    return min(max(width, MIN_WIDTH), MAX_WIDTH)
+
+
+def rendition_budget(width: int) -> int:
+    """Byte budget of a rendition: the thumbnail budget scaled by area"""
+    return max(MIN_RENDITION_BYTES, int(MAX_THUMBNAIL_BYTES * (width / MAX_DIMENSION) ** 2))
+
+
+class ImageService:
+    """Renders event images on demand on a warm generator, with caching and coalescing"""
+
+    def __init__(self, generator: ThumbnailGenerator, cache: RenditionCache, originals_bytes: int = 256 * MB):
+        self.generator = generator
+        self.bucket = generator.bucket
+        self.cache = cache
+        self.originals = MemoryLRU(originals_bytes)
+        self.flights = SingleFlight()
+        self.lock = threading.Lock()
+        self.sources = {}  # "collection/eventID" -> (expires, event_image info or None)
+        self.started = time.time()
+        self.rendered_count = 0
+        self.render_seconds = 0.0
+        self.downloaded_count = 0
+        self.error_count = 0
+
+    def find_source(self, collection: str, event_id: str) -> Optional[dict]:
+        """The event_image (PNG first), or None if the event has none; storage errors propagate"""
+        key = f"{collection}/{event_id}"
+        with self.lock:
+            cached = self.sources.get(key)
+        if cached and cached[0] > time.time():
+            return cached[1]
+
+        def lookup():
+            for ext in ['png', 'jpg']:
+                blob = self.bucket.get_blob(f"{key}/event_image.{ext}")
+                if blob is not None:
+                    # Composite objects have no MD5; their name and generation identify the version instead
+                    version = blob.md5_hash or f"{blob.name}#{blob.generation}"
+                    return {'name': blob.name, 'size': blob.size, 'version': version}
+            return None
+
+        source = self.flights.do(f"source:{key}", lookup)
+        with self.lock:
+            self.sources[key] = (time.time() + SOURCE_TTL, source)
+        return source
+
+    def original(self, source: dict) -> bytes:
+        """The original image bytes, downloaded once however many renditions are made of it"""
+        data = self.originals.get(source['version'])
+        if data is not None:
+            return data
+
+        def download():
+            logger.info(f"📥 Downloading {source['name']}")
+            data = self.bucket.blob(source['name']).download_as_bytes()
+            self.originals.put(source['version'], data)
+            with self.lock:
+                self.downloaded_count += 1
+            return data
+
+        return self.flights.do(f"original:{source['version']}", download)
+
+    def render(self, source: dict, width: int, fmt: str) -> Optional[bytes]:
+        """Decode and encode one rendition with the generator's budgeted encoder"""
+        started = time.time()
+        data = self.original(source)
+        try:
+            orientation = exif_orientation(Image.open(io.BytesIO(data)))
+        except Exception as e:
+            logger.error(f"❌ Could not read {source['name']}: {e}")
+            return None
+
+        img = self.generator.decode_thumbnail(io.BytesIO(data), orientation, max_size=(width, width * MAX_ASPECT))
+        if img is None:
+            return None
+        encoded = self.generator.encode_thumbnail(img, rendition_budget(width), formats=FORMATS[fmt],
+                                                  placeholders=False)
+        if encoded is None:
+            return None
+
+        # The encode buffer is this thread's, reused by its next render
+        output, _ = encoded
+        value = output.getvalue()
+        with self.lock:
+            self.rendered_count += 1
+            self.render_seconds += time.time() - started
+        return value
+
+    def get(self, collection: str, event_id: str, width: int, fmt: str) -> Optional[Tuple[Optional[bytes], str, str]]:
+        """(rendition or None if it could not be made, cache status, cache key); None if there is no event_image"""
+        source = self.find_source(collection, event_id)
+        if source is None:
+            return None
+
+        key = f"{source['version']}/{width}.{fmt}"
+        value, status = self.cache.get(key)
+        if value is not None:
+            return value, status, key
+
+        def render():
+            # A coalesced render may have finished just before this one started
+            value = self.cache.memory.get(key)
+            if value is None:
+                value = self.render(source, width, fmt)
+                if value is not None:
+                    self.cache.put(key, value)
+            return value
+
+        value = self.flights.do(key, render)
+        if value is None:
+            with self.lock:
+                self.error_count += 1
+        return value, 'miss', key
+
+    def health(self) -> dict:
+        with self.lock:
+            rendered, render_seconds = self.rendered_count, self.render_seconds
+            downloaded, errors = self.downloaded_count, self.error_count
+        return {
+            'status': 'ok',
+            'service': 'Hash Image Service',
+            'uptime': time.time() - self.started,
+            'rendered': rendered,
+            'averageRenderMs': round(1000 * render_seconds / rendered) if rendered else None,
+            'originalsDownloaded': downloaded,
+            'coalesced': self.flights.coalesced,
+            'errors': errors,
+            'cache': self.cache.stats(),
+            'originals': self.originals.stats(),
+            'peakDecodeMemoryMB': round(self.generator.admission.peak / MB),
+        }
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front of an ImageService (set as `service` on the server)"""
+
+    server_version = 'HashImageService/1.0'
+
+    @property
+    def service(self) -> ImageService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            return self._send_json(200, self.service.health())
+
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or not all(PATH_PART.match(part) for part in parts):
+            return self._send_json(404, {'error': 'Not found'})
+
+        query = parse_qs(url.query)
+        width = rendition_width(query.get('w', [None])[0])
+        fmt = query.get('fmt', ['auto'])[0].lower()
+        if width is None or fmt not in FORMATS:
+            return self._send_json(400, {'error': f"w must be a number and fmt one of {', '.join(FORMATS)}"})
+
+        try:
+            result = self.service.get(parts[0], parts[1], width, fmt)
+        except Exception as e:
+            logger.error(f"❌ Error serving {url.path}: {e}")
+            return self._send_json(502, {'error': 'Could not read the event image'})
+
+        if result is None:
+            return self._send_json(404, {'error': 'Event image not found'})
+        value, status, key = result
+        if value is None:
+            return self._send_json(422, {'error': 'Could not render the event image'})
+
+        etag = f'"{hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', sniff_content_type(io.BytesIO(value)))
+            self.send_header('Content-Length', str(len(value)))
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.send_header('ETag', etag)
+            self.send_header('X-Cache', status)
+            self.end_headers()
+            self.wfile.write(value)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="On-demand event image renditions over HTTP")
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (local only by default)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('IMAGE_SERVICE_PORT', DEFAULT_PORT)))
+    parser.add_argument('--memory-cache', type=int, default=256, help='Megabytes of renditions kept in memory')
+    parser.add_argument('--disk-cache', type=int, default=2048,
+                        help='Megabytes of renditions kept on disk (0: memory only)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory of the disk cache')
+    parser.add_argument('--originals-cache', type=int, default=256,
+                        help='Megabytes of original images kept in memory for further renditions')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // MB,
+                        help='Megabytes of decoded image data allowed in flight at once')
+    args = parser.parse_args()
+
+    print("🖼️ Hash Image Service")
+    print("=====================")
+    generator = ThumbnailGenerator(find_service_account(), memory_budget=args.memory_budget * MB,
+                                   prioritize=False, leases=False, reuse=False)
+    cache = RenditionCache(args.memory_cache * MB, args.cache_dir, args.disk_cache * MB)
+    service = ImageService(generator, cache, originals_bytes=args.originals_cache * MB)
+
+    server = ThreadingHTTPServer((args.host, args.port), ImageRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    print(f"🌐 Listening on http://{args.host}:{args.port}")
+    print(f"💾 Cache: {args.memory_cache}MB in memory, {args.disk_cache}MB in {args.cache_dir}")
+    print("⏹️  Press Ctrl+C to stop\n")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ Shutting down image service...")
+    finally:
+        server.server_close()
+        print("✅ Goodbye!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Durable SQLite job queue for thumbnail work
+
+Webhooks and watchers fire once per Firestore change, often several times for
+the same event (create, then updates), and an import script can fire
+hundreds at once. JobQueue turns that into a small set of batched work items:
+
+- one row per collection/event (deduplication): enqueueing an event that is
+  already waiting only pushes its start back by `debounce` seconds, never
+  more than `max_delay` after it was first enqueued (coalescing),
+- claim() leases ready rows for `visibility_timeout` seconds; a consumer
+  that crashes simply lets its leases expire and the rows become claimable
+  again (crash recovery),
+- an event enqueued again while it is being processed is re-queued after
+  ack(), so a change made mid-processing is not lost,
+- nack() retries with exponential backoff and parks the row as 'dead' after
+  `max_attempts` claims; enqueueing a dead event revives it.
+
+The queue lives in one SQLite file (WAL mode), so the worker daemon and a
+one-off `generate_thumbnails.py --queue` run can share it safely.
+
+Usage:
+    queue = JobQueue('thumbnail_queue.db')
+    queue.enqueue('bayAreaEvents', 'abc123')
+    for item in queue.claim(10):
+        ...
+        queue.ack(item)
+"""
+
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = 'thumbnail_queue.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    collection TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    status TEXT NOT NULL,            -- pending, leased or dead
+    first_enqueued_at REAL NOT NULL,
+    not_before REAL NOT NULL,        -- pending: when it may be claimed
+    lease_until REAL,                -- leased: when the lease expires
+    claim_token TEXT,
+    requeue INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    coalesced INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    PRIMARY KEY (collection, event_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, not_before);
+"""
+
+
+class JobQueue:
+    """Deduplicating, debounced, lease-based work queue in a SQLite file"""
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, debounce: float = 5.0, max_delay: float = 60.0,
+                 visibility_timeout: float = 300.0, max_attempts: int = 5, retry_delay: float = 30.0):
+        self.path = path
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def _transaction(self, work):
+        """Run work(conn) in an immediate (write-locked) transaction"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(self.conn)
+                self.conn.execute('COMMIT')
+                return result
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def enqueue(self, collection: str, event_id: str) -> str:
+        """Add an event, coalescing with a pending entry; returns the row's resulting status"""
+        now = time.time()
+
+        def work(conn):
+            row = conn.execute('SELECT * FROM jobs WHERE collection = ? AND event_id = ?',
+                               (collection, event_id)).fetchone()
+            if row is None:
+                conn.execute('INSERT INTO jobs (collection, event_id, status, first_enqueued_at, not_before) '
+                             'VALUES (?, ?, ?, ?, ?)', (collection, event_id, 'pending', now, now + self.debounce))
+                return 'pending'
+
+            if row['status'] == 'pending':
+                not_before = min(now + self.debounce, row['first_enqueued_at'] + self.max_delay)
+                conn.execute('UPDATE jobs SET not_before = ?, coalesced = coalesced + 1 '
+                             'WHERE collection = ? AND event_id = ?', (not_before, collection, event_id))
+                return 'pending'
+
+            if row['status'] == 'leased':
+                # Being processed right now: run it once more afterwards to pick up this change
+                conn.execute('UPDATE jobs SET requeue = 1, coalesced = coalesced + 1 '
+                             'WHERE collection = ? AND event_id = ?', (collection, event_id))
+                return 'leased'
+
+            # Dead: a new change is a reason to try again
+            conn.execute("UPDATE jobs SET status = 'pending', first_enqueued_at = ?, not_before = ?, attempts = 0, "
+                         "last_error = NULL WHERE collection = ? AND event_id = ?",
+                         (now, now + self.debounce, collection, event_id))
+            return 'pending'
+
+        return self._transaction(work)
+
+    def claim(self, limit: int, ignore_debounce: bool = False) -> List[dict]:
+        """Lease up to `limit` ready events (pending past their debounce, or with expired leases)
+
+        With ignore_debounce, events that have not failed yet are ready straight
+        away (for one-off batch runs); retries still wait out their backoff.
+        """
+        now = time.time()
+
+        def work(conn):
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'pending' AND (not_before <= ? OR (? AND attempts = 0))) "
+                "OR (status = 'leased' AND lease_until <= ?) ORDER BY not_before LIMIT ?",
+                (now, int(ignore_debounce), now, limit)).fetchall()
+
+            claimed = []
+            for row in rows:
+                if row['status'] == 'leased':
+                    logger.warning(f"♻️ Lease expired for {row['collection']}/{row['event_id']}, reclaiming")
+
+                if row['attempts'] >= self.max_attempts:
+                    conn.execute("UPDATE jobs SET status = 'dead', claim_token = NULL "
+                                 "WHERE collection = ? AND event_id = ?", (row['collection'], row['event_id']))
+                    logger.warning(f"💀 Giving up on {row['collection']}/{row['event_id']} after {row['attempts']} attempts")
+                    continue
+
+                token = uuid.uuid4().hex
+                conn.execute("UPDATE jobs SET status = 'leased', lease_until = ?, claim_token = ?, requeue = 0, "
+                             "attempts = attempts + 1 WHERE collection = ? AND event_id = ?",
+                             (now + self.visibility_timeout, token, row['collection'], row['event_id']))
+                claimed.append({
+                    'collection': row['collection'],
+                    'event_id': row['event_id'],
+                    'token': token,
+                    'attempt': row['attempts'] + 1,
+                    'coalesced': row['coalesced'],
+                })
+            return claimed
+
+        return self._transaction(work)
+
+    def ack(self, item: dict):
+        """Finish a claimed event, re-queueing it if it was enqueued again meanwhile"""
+        now = time.time()
+
+        def work(conn):
+            row = self._owned(conn, item)
+            if row is None:
+                return
+            if row['requeue']:
+                conn.execute("UPDATE jobs SET status = 'pending', first_enqueued_at = ?, not_before = ?, attempts = 0, "
+                             "coalesced = 0, claim_token = NULL, lease_until = NULL, requeue = 0 "
+                             "WHERE collection = ? AND event_id = ?",
+                             (now, now + self.debounce, item['collection'], item['event_id']))
+            else:
+                conn.execute('DELETE FROM jobs WHERE collection = ? AND event_id = ?',
+                             (item['collection'], item['event_id']))
+
+        self._transaction(work)
+
+    def nack(self, item: dict, error: str = None):
+        """Release a claimed event for a retry with exponential backoff"""
+        now = time.time()
+
+        def work(conn):
+            row = self._owned(conn, item)
+            if row is None:
+                return
+            delay = self.retry_delay * 2 ** (row['attempts'] - 1)
+            status = 'dead' if row['attempts'] >= self.max_attempts and not row['requeue'] else 'pending'
+            conn.execute("UPDATE jobs SET status = ?, not_before = ?, claim_token = NULL, lease_until = NULL, "
+                         "requeue = 0, last_error = ? WHERE collection = ? AND event_id = ?",
+                         (status, now + delay, error, item['collection'], item['event_id']))
+
+        self._transaction(work)
+
+    def _owned(self, conn, item: dict) -> Optional[sqlite3.Row]:
+        """The row for a claimed item, unless its lease expired and someone else claimed it"""
+        row = conn.execute('SELECT * FROM jobs WHERE collection = ? AND event_id = ? AND claim_token = ?',
+                           (item['collection'], item['event_id'], item['token'])).fetchone()
+        if row is None:
+            logger.warning(f"⚠️ Lost the lease on {item['collection']}/{item['event_id']}, leaving it to its new owner")
+        return row
+
+    def next_ready_in(self) -> Optional[float]:
+        """Seconds until the next event can be claimed (0 if one is ready), None if nothing is waiting"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MIN(CASE WHEN status = 'pending' THEN not_before ELSE lease_until END) AS ready "
+                "FROM jobs WHERE status IN ('pending', 'leased')").fetchone()
+        if row['ready'] is None:
+            return None
+        return max(0.0, row['ready'] - time.time())
+
+    def stats(self) -> dict:
+        """Number of rows in each status"""
+        with self.lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) AS count FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
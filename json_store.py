@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Local JSON state files shared by the caches of a run
+
+encode_params.json, quarantine.json, phash_index.json and the throughput
+history are read, merged with what a run learned and written back, possibly
+by several threads of one process at once (the worker saves from its flush
+loop while a full run saves at its end). Each save holds file_lock(path) for
+the whole read-merge-write, so one merge never overwrites another, and
+write_json() writes a temporary file and renames it over the old one, so a
+reader (or a crash) never sees a truncated file.
+"""
+
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def file_lock(path: str) -> threading.Lock:
+    """The lock guarding read-merge-write cycles of one file in this process"""
+    path = os.path.abspath(path)
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def read_json(path: str) -> dict:
+    """The object stored in a JSON file, empty if the file does not exist or is unreadable"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError as e:
+        # Rewritten in full by the next save
+        logger.warning(f"⚠️ {path} is not valid JSON, starting it over: {e}")
+        return {}
+
+
+def write_json(path: str, data: dict, indent: int = 1):
+    """Replace a JSON file atomically"""
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary, 'w') as f:
+            json.dump(data, f, indent=indent, sort_keys=True)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
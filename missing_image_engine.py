@@ -0,0 +1,768 @@
+#!/usr/bin/env python3
+"""
+Missing Event Image Engine
+
+Shared engine behind the generate_missing_images*.py scripts.
+Finds events that have event_thumbnail but no event_image, upscales the
+thumbnail and uploads it as event_image.
+
+The scripts only differ in which candidates they pick and how they encode,
+so both are configuration here:
+
+Selection policies:
+    all          - every candidate, in listing order
+    date-window  - candidates whose thumbnail was created in the last N months
+    newest       - the N newest candidates by thumbnail creation date
+    first        - the first N candidates in listing order
+    time-budget  - newest first, stop starting new work after N seconds
+    deadline     - cheapest first (or most value per cost), only start work
+                   predicted to finish before the deadline
+
+Encoder profiles:
+    standard     - PNG, compress_level=6, no size limit
+    recent       - PNG, falls back to JPEG (from quality 95) to stay under 1MB
+    simple       - PNG, falls back to JPEG (from quality 85) to stay under 1MB
+
+Events whose thumbnail is empty or undecodable are quarantined (see
+quarantine.py) until the thumbnail is replaced.
+
+Every policy shares the same single-pass scan: one listing of the collection,
+creation dates and sizes taken from the listing itself (no per-blob reload
+and no per-event exists() checks).
+
+Usage:
+    python generate_missing_images.py --policy newest --max-events 100
+    python generate_missing_images.py --policy time-budget --time-budget 1500 --profile simple
+    python generate_missing_images.py --deadline 1500 --order value
+"""
+
+import sys
+import argparse
+from typing import List, Dict, Optional, Tuple
+import io
+from PIL import Image, ImageFilter, UnidentifiedImageError
+import numpy as np
+from firebase_admin import storage, firestore
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from decode_admission import DecodeAdmission, MB, DEFAULT_MEMORY_BUDGET
+from storage_io import (reusable_buffer, download_into, sniff_content_type, upload_buffer, list_blobs_lean,
+                        image_metadata)
+from sharding import Shard, parse_shard, filter_shard, describe_shard
+from run_planner import ThroughputRecorder, load_model
+from quarantine import Quarantine
+from firebase_setup import find_service_account, initialize_firebase, IMAGE_NAMES, THUMBNAIL_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Recorded on every generated event_image
+GENERATED_BY = 'missing-image-engine'
+GENERATOR_VERSION = '1'
+
+# Encoder settings for each profile. max_file_size=None means "save as PNG, no limit".
+ENCODER_PROFILES = {
+    'standard': {
+        'max_file_size': None,
+        'png_compress_level': 6,
+    },
+    'recent': {
+        'max_file_size': 1024 * 1024,
+        'png_compress_level': 9,
+        'jpeg_quality': 95,
+        'quality_steps': (70, 50),    # step by 10 above the first, by 5 above the second
+        'reset_quality': 80,          # quality used again after each 10% downscale
+        'full_size_quality': 30,      # last try at full size before aggressive scaling
+        'fallback_scale': 0.7,
+        'fallback_quality': 60,
+    },
+    'simple': {
+        'max_file_size': 1024 * 1024,
+        'png_compress_level': 9,
+        'jpeg_quality': 85,
+        'quality_steps': (60, 45),
+        'reset_quality': 75,
+        'full_size_quality': None,
+        'fallback_scale': 0.6,
+        'fallback_quality': 70,
+    },
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Started work must be predicted to finish this comfortably before the deadline
+DEADLINE_SAFETY = 1.5
+
+
+class UndecodableImage(Exception):
+    """A thumbnail that fails the same way on every attempt (corrupt, truncated or too many pixels)"""
+
+
+def _created(candidate: dict) -> datetime:
+    """Sort key for candidates: thumbnail creation date (oldest possible if unknown)"""
+    return candidate['thumbnail_date'] or _EPOCH
+
+
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def enhance_for_upscale(img: Image.Image, amount: float = 1.2, saturation: float = 1.05,
+                        threshold: int = 3) -> Image.Image:
+    """Unsharp mask and colour boost fused into one NumPy pass, applied before upscaling
+
+    Replaces UnsharpMask(radius=1, percent=120, threshold=3) -> resize ->
+    Sharpness(1.1) -> Color(1.05), which made four full-image passes and four
+    intermediate images. Saturation is a per-pixel colour matrix and resizing is
+    linear, so both commute with the resize and can run on the small source
+    instead of the 800px result; one LANCZOS resize follows. Output matches the
+    old chain to within ~1 level on average (under 5 levels at the 99th percentile).
+    """
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    pixels = np.asarray(img, dtype=np.float32)
+    detail = np.asarray(img.filter(ImageFilter.GaussianBlur(1)), dtype=np.float32)
+
+    # detail = pixels - blurred, ignoring differences below the threshold (as UnsharpMask does)
+    np.subtract(pixels, detail, out=detail)
+    detail[np.abs(detail) < threshold] = 0
+    detail *= amount
+    pixels += detail
+
+    # Saturation: out = saturation * rgb + (1 - saturation) * luma, as one 3x3 matrix
+    color_matrix = saturation * np.eye(3, dtype=np.float32) + (1 - saturation) * LUMA[:, None]
+    np.matmul(pixels, color_matrix, out=detail)
+    np.clip(detail, 0, 255, out=detail)
+    np.rint(detail, out=detail)
+
+    return Image.fromarray(detail.astype(np.uint8))
+
+
+class SelectionPolicy:
+    """Every candidate, in listing order"""
+    name = 'all'
+    queue_ahead = 2  # jobs per worker submitted ahead of time
+
+    def select(self, candidates: List[dict]) -> List[dict]:
+        return candidates
+
+    def admit(self, elapsed: float, candidate: dict = None) -> bool:
+        """Whether `candidate` (or any new work) may still be started after `elapsed` seconds"""
+        return True
+
+    def describe(self) -> str:
+        return 'all events'
+
+
+class DateWindowPolicy(SelectionPolicy):
+    """Candidates whose thumbnail was created in the last N months"""
+    name = 'date-window'
+
+    def __init__(self, months_back: int = 3):
+        self.months_back = months_back
+        self.cutoff_date = datetime.now(timezone.utc) - timedelta(days=months_back * 30)  # Approximate months to days
+
+    def select(self, candidates: List[dict]) -> List[dict]:
+        return [c for c in candidates if c['thumbnail_date'] and c['thumbnail_date'] >= self.cutoff_date]
+
+    def describe(self) -> str:
+        return f"events created after {self.cutoff_date.strftime('%Y-%m-%d')} (last {self.months_back} months)"
+
+
+class NewestPolicy(SelectionPolicy):
+    """The N newest candidates by thumbnail creation date"""
+    name = 'newest'
+
+    def __init__(self, max_events: int = 100):
+        self.max_events = max_events
+
+    def select(self, candidates: List[dict]) -> List[dict]:
+        return sorted(candidates, key=_created, reverse=True)[:self.max_events]
+
+    def describe(self) -> str:
+        return f"{self.max_events} newest events"
+
+
+class FirstPolicy(SelectionPolicy):
+    """The first N candidates in listing order"""
+    name = 'first'
+
+    def __init__(self, max_events: int = 500):
+        self.max_events = max_events
+
+    def select(self, candidates: List[dict]) -> List[dict]:
+        return candidates[:self.max_events]
+
+    def describe(self) -> str:
+        return f"first {self.max_events} events"
+
+
+class TimeBudgetPolicy(SelectionPolicy):
+    """Newest first, no new work is started once the time budget is spent"""
+    name = 'time-budget'
+
+    def __init__(self, time_budget: float = 1500):
+        self.time_budget = time_budget
+
+    def select(self, candidates: List[dict]) -> List[dict]:
+        return sorted(candidates, key=_created, reverse=True)
+
+    def admit(self, elapsed: float, candidate: dict = None) -> bool:
+        return elapsed < self.time_budget
+
+    def describe(self) -> str:
+        return f"as many events as fit in {self.time_budget:.0f} seconds, newest first"
+
+
+class DeadlinePolicy(SelectionPolicy):
+    """As many events as finish before a deadline, ordered by predicted cost
+
+    Each candidate's duration is predicted from its thumbnail size in the
+    listing and the measured throughput (see run_planner.py). 'cheapest'
+    runs the shortest jobs first, which completes the most events; 'value'
+    ranks by recency per predicted second, so new events are not starved by
+    cheap old ones. A job is only started if it is predicted to finish before
+    the deadline, and jobs are not queued ahead of the workers, so the run
+    ends with in-flight work drained rather than cut off.
+    """
+    name = 'deadline'
+    queue_ahead = 1
+
+    def __init__(self, deadline: float = 1500, order: str = 'cheapest', model: dict = None):
+        self.deadline = deadline
+        self.order = order
+        self.model = model or load_model('missing_images')
+
+    def predict(self, candidate: dict) -> float:
+        """Predicted seconds to process one candidate"""
+        return (self.model['seconds_per_image']
+                + candidate['thumbnail_size'] / MB * self.model['seconds_per_mb'])
+
+    def value(self, candidate: dict) -> float:
+        """Recency weight per predicted second: an event from today counts twice one from a month ago"""
+        age_days = (datetime.now(timezone.utc) - _created(candidate)).total_seconds() / 86400
+        return 1 / (1 + max(age_days, 0) / 30) / candidate['predicted_seconds']
+
+    def select(self, candidates: List[dict]) -> List[dict]:
+        for candidate in candidates:
+            candidate['predicted_seconds'] = self.predict(candidate)
+        if self.order == 'value':
+            return sorted(candidates, key=self.value, reverse=True)
+        return sorted(candidates, key=lambda c: c['predicted_seconds'])
+
+    def admit(self, elapsed: float, candidate: dict = None) -> bool:
+        if candidate is None:
+            return elapsed < self.deadline
+        return elapsed + DEADLINE_SAFETY * candidate['predicted_seconds'] <= self.deadline
+
+    def describe(self) -> str:
+        order = 'most value per cost' if self.order == 'value' else 'cheapest'
+        return f"as many events as finish within {self.deadline:.0f} seconds, {order} first"
+
+
+SELECTION_POLICIES = {
+    policy.name: policy
+    for policy in (SelectionPolicy, DateWindowPolicy, NewestPolicy, FirstPolicy, TimeBudgetPolicy, DeadlinePolicy)
+}
+
+
+def build_policy(name: str, months_back: int = 3, max_events: int = 100,
+                 time_budget: float = 1500, deadline: float = 1500, order: str = 'cheapest') -> SelectionPolicy:
+    """Create a selection policy from its name and the CLI options"""
+    if name == 'date-window':
+        return DateWindowPolicy(months_back)
+    if name == 'newest':
+        return NewestPolicy(max_events)
+    if name == 'first':
+        return FirstPolicy(max_events)
+    if name == 'time-budget':
+        return TimeBudgetPolicy(time_budget)
+    if name == 'deadline':
+        return DeadlinePolicy(deadline, order)
+    if name == 'all':
+        return SelectionPolicy()
+    raise ValueError(f"Unknown selection policy: {name}")
+
+
+class MissingImageGenerator:
+    def __init__(self, service_account_path: str = None, policy: SelectionPolicy = None,
+                 profile: str = 'standard', memory_budget: int = DEFAULT_MEMORY_BUDGET, shard: Shard = None):
+        """Initialize Firebase connection"""
+        self.bucket = None
+        self.db = None
+        self.admission = DecodeAdmission(memory_budget)
+        self.policy = policy or DateWindowPolicy()
+        self.profile_name = profile
+        self.profile = ENCODER_PROFILES[profile]
+        self.shard = shard
+        self.throughput = ThroughputRecorder('missing_images')
+        self.quarantine = Quarantine('missing_images')
+        self.processed_count = 0
+        self.skipped_count = 0
+        self.error_count = 0
+
+        try:
+            initialize_firebase(service_account_path)
+            self.bucket = storage.bucket()
+            self.db = firestore.client()
+            logger.info("✅ Firebase initialized successfully")
+
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize Firebase: {e}")
+            sys.exit(1)
+
+    def scan_collection(self, collection: str) -> List[dict]:
+        """List the collection once and return events with a thumbnail but no event_image"""
+        events = {}
+        total_blobs = 0
+
+        # The listing already carries size and creation date, so no reload() per blob;
+        # it is projected down to just the fields used here
+        for blob in list_blobs_lean(self.bucket, f"{collection}/",
+                                    fields=('name', 'size', 'md5Hash', 'generation', 'timeCreated')):
+            total_blobs += 1
+            path_parts = blob.name.split('/')
+            if len(path_parts) >= 3:  # collection/eventID/filename
+                event_id = path_parts[1]
+                filename = path_parts[2]
+
+                if event_id not in events:
+                    events[event_id] = {
+                        'event_id': event_id,
+                        'has_image': False,
+                        'thumbnail_name': None,
+                        'thumbnail_size': 0,
+                        'thumbnail_md5': None,
+                        'thumbnail_generation': None,
+                        'thumbnail_date': None,
+                    }
+
+                if filename in IMAGE_NAMES:
+                    events[event_id]['has_image'] = True
+                elif filename in THUMBNAIL_NAMES and not events[event_id]['thumbnail_name']:
+                    events[event_id]['thumbnail_name'] = blob.name
+                    events[event_id]['thumbnail_size'] = blob.size or 0
+                    events[event_id]['thumbnail_md5'] = blob.md5_hash
+                    events[event_id]['thumbnail_generation'] = blob.generation
+                    events[event_id]['thumbnail_date'] = blob.time_created
+
+        logger.info(f"📊 Listed {total_blobs:,} blobs covering {len(events):,} events in {collection}")
+        return [e for e in events.values() if e['thumbnail_name'] and not e['has_image']]
+
+    def get_events_needing_images(self, collection: str) -> List[dict]:
+        """Get the events that need event_image generated, as chosen by the selection policy"""
+        logger.info(f"🔍 Scanning {collection} for events needing event_image ({self.policy.describe()})...")
+
+        try:
+            # Shard before selecting, so each runner applies the policy to its own slice
+            candidates = filter_shard(self.scan_collection(collection), self.shard, key=lambda c: c['event_id'])
+            listed = len(candidates)
+            candidates = [c for c in candidates if not self.quarantine.is_quarantined(
+                f"{collection}/{c['event_id']}", c['thumbnail_name'], c['thumbnail_generation'])]
+            if len(candidates) < listed:
+                logger.info(f"🚫 Skipping {listed - len(candidates)} quarantined events in {collection} "
+                            f"(see python quarantine.py)")
+            selected = self.policy.select(candidates)
+
+            logger.info(f"📊 Found {len(candidates)} events in {collection} needing event_image, "
+                        f"selected {len(selected)}")
+            dated = [c['thumbnail_date'] for c in selected if c['thumbnail_date']]
+            if dated:
+                logger.info(f"🕐 Date range: {max(dated).strftime('%Y-%m-%d %H:%M:%S')} (newest) to "
+                            f"{min(dated).strftime('%Y-%m-%d %H:%M:%S')} (oldest in selection)")
+            return selected
+
+        except Exception as e:
+            logger.error(f"❌ Error scanning {collection}: {e}")
+            return []
+
+    def download_thumbnail(self, candidate: dict) -> Optional[io.BytesIO]:
+        """Download the thumbnail image found by the scan into this worker's reusable buffer"""
+        try:
+            blob_path = candidate['thumbnail_name']
+            logger.info(f"📥 Downloading {blob_path}")
+            return download_into(self.bucket.blob(blob_path))
+
+        except Exception as e:
+            logger.error(f"❌ Error downloading thumbnail for {candidate['event_id']}: {e}")
+            return None
+
+    def upscale_image(self, thumbnail_data: io.BytesIO,
+                      target_size: tuple = (800, 800)) -> Optional[Tuple[io.BytesIO, dict]]:
+        """Upscale thumbnail to full-size image with quality enhancement
+
+        Returns the encode buffer and the format, quality and dimensions it was encoded with,
+        or None if it could not be encoded within the size limit or failed unexpectedly (worth
+        retrying). Raises UndecodableImage when the thumbnail itself cannot be decoded.
+        """
+        try:
+            # Open the thumbnail
+            try:
+                img = Image.open(thumbnail_data)
+            except (UnidentifiedImageError, OSError) as e:
+                logger.error(f"❌ Error decoding thumbnail: {e}")
+                raise UndecodableImage('could not decode event_thumbnail')
+            original_width, original_height = img.size
+            aspect_ratio = original_width / original_height
+
+            logger.info(f"📐 Original thumbnail size: {original_width}x{original_height} (ratio: {aspect_ratio:.2f})")
+
+            # Calculate new size maintaining aspect ratio
+            target_width, target_height = target_size
+
+            if aspect_ratio >= 1:  # Landscape or square
+                new_width = min(target_width, int(target_height * aspect_ratio))
+                new_height = int(new_width / aspect_ratio)
+            else:  # Portrait
+                new_height = min(target_height, int(target_width / aspect_ratio))
+                new_width = int(new_height * aspect_ratio)
+
+            # Wait for enough of the memory budget before decoding
+            cost = self.admission.estimate(original_width, original_height, img.mode, new_width * new_height)
+            if cost is None:
+                raise UndecodableImage(f"too many pixels ({original_width}x{original_height})")
+
+            with self.admission.admit(cost):
+                try:
+                    img.load()
+                except (UnidentifiedImageError, OSError) as e:
+                    # Truncated or corrupt data fails the same way every time
+                    logger.error(f"❌ Error decoding thumbnail: {e}")
+                    raise UndecodableImage('could not decode event_thumbnail')
+
+                # Convert to RGB if necessary
+                if img.mode in ('RGBA', 'LA', 'P'):
+                    img = img.convert('RGB')
+
+                # Use high-quality upscaling
+                if original_width < new_width or original_height < new_height:
+                    # Sharpen and boost colour in one pass, then a single LANCZOS upscale
+                    img = enhance_for_upscale(img)
+                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                else:
+                    # If thumbnail is already large enough, just resize
+                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+                result = self.encode_image(img)
+
+            if result is not None:
+                logger.info(f"🖼️ Upscaled image: {new_width}x{new_height}, {result[0].tell()} bytes")
+                return result
+            else:
+                logger.error(f"❌ Could not optimize image to under {self.profile['max_file_size']} bytes")
+                return None
+
+        except UndecodableImage:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error upscaling image: {e}")
+            return None
+
+    def encode_image(self, img: Image.Image) -> Optional[Tuple[io.BytesIO, dict]]:
+        """Encode the upscaled image according to the encoder profile, into this worker's encode buffer"""
+        profile = self.profile
+
+        # Try PNG first; without a size limit this is the only attempt
+        output = reusable_buffer('encode')
+        img.save(output, format='PNG', optimize=True, compress_level=profile['png_compress_level'])
+
+        if profile['max_file_size'] is None or output.tell() <= profile['max_file_size']:
+            return output, {'format': 'PNG', 'quality': None, 'width': img.width, 'height': img.height}
+
+        return self._optimize_image_size(img, profile['max_file_size'])
+
+    def _optimize_image_size(self, img: Image.Image, max_size: int) -> Optional[Tuple[io.BytesIO, dict]]:
+        """Fall back to JPEG, lowering quality and then dimensions, to stay under max_size bytes"""
+        profile = self.profile
+        width, height = img.size
+
+        try:
+            quality = profile['jpeg_quality']
+            high_step, low_step = profile['quality_steps']
+            scale_factor = 1.0
+
+            while quality > 30 and scale_factor > 0.5:
+                # Try current settings
+                current_img = img
+
+                # Scale down if needed
+                if scale_factor < 1.0:
+                    scaled_width = int(width * scale_factor)
+                    scaled_height = int(height * scale_factor)
+                    current_img = img.resize((scaled_width, scaled_height), Image.Resampling.LANCZOS)
+
+                output = reusable_buffer('encode')
+                current_img.save(output, format='JPEG', quality=quality, optimize=True)
+
+                if output.tell() <= max_size:
+                    actual_width, actual_height = current_img.size
+                    logger.info(f"📏 Optimized to JPEG: {actual_width}x{actual_height}, quality={quality}, scale={scale_factor:.2f}")
+                    return output, {'format': 'JPEG', 'quality': quality, 'width': actual_width, 'height': actual_height}
+
+                # Adjust parameters for next iteration
+                if quality > high_step:
+                    quality -= 10
+                elif quality > low_step:
+                    quality -= 5
+                else:
+                    # Start scaling down while maintaining reasonable quality
+                    quality = profile['reset_quality']
+                    scale_factor -= 0.1
+
+            # Final attempt with very low quality but original size
+            if profile['full_size_quality']:
+                output = reusable_buffer('encode')
+                img.save(output, format='JPEG', quality=profile['full_size_quality'], optimize=True)
+
+                if output.tell() <= max_size:
+                    logger.info(f"📏 Final JPEG: {width}x{height}, quality={profile['full_size_quality']}")
+                    return output, {'format': 'JPEG', 'quality': profile['full_size_quality'],
+                                    'width': width, 'height': height}
+
+            # If still too large, scale down more aggressively
+            scale_factor = profile['fallback_scale']
+            while scale_factor > 0.3:
+                scaled_width = int(width * scale_factor)
+                scaled_height = int(height * scale_factor)
+                scaled_img = img.resize((scaled_width, scaled_height), Image.Resampling.LANCZOS)
+
+                output = reusable_buffer('encode')
+                scaled_img.save(output, format='JPEG', quality=profile['fallback_quality'], optimize=True)
+
+                if output.tell() <= max_size:
+                    logger.info(f"📏 Scaled JPEG: {scaled_width}x{scaled_height}, quality={profile['fallback_quality']}, scale={scale_factor:.2f}")
+                    return output, {'format': 'JPEG', 'quality': profile['fallback_quality'],
+                                    'width': scaled_width, 'height': scaled_height}
+
+                scale_factor -= 0.1
+
+            logger.warning(f"⚠️ Could not optimize image to under {max_size} bytes")
+            return None
+
+        except Exception as e:
+            logger.error(f"❌ Error optimizing image size: {e}")
+            return None
+
+    def upload_image(self, collection: str, event_id: str, image_data: io.BytesIO,
+                     metadata: Dict[str, str] = None) -> bool:
+        """Upload full-size image to Firebase Storage straight from the encode buffer"""
+        try:
+            blob_path = f"{collection}/{event_id}/event_image.png"
+            blob = self.bucket.blob(blob_path)
+            blob.metadata = metadata
+
+            # Upload as PNG or JPEG based on the data
+            content_type = sniff_content_type(image_data)
+
+            size = upload_buffer(blob, image_data, content_type=content_type)
+
+            logger.info(f"✅ Uploaded image: {blob_path} ({size} bytes) as {content_type}")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Error uploading image for {event_id}: {e}")
+            return False
+
+    def process_event(self, collection: str, candidate: dict) -> bool:
+        """Process a single event - download thumbnail, upscale, upload image"""
+        event_id = candidate['event_id']
+        try:
+            logger.info(f"🚀 Processing {collection}/{event_id}")
+            started = time.time()
+            key = f"{collection}/{event_id}"
+
+            if candidate['thumbnail_size'] == 0:
+                self.quarantine.add(key, candidate['thumbnail_name'], candidate['thumbnail_generation'],
+                                    'empty event_thumbnail')
+                self.error_count += 1
+                return False
+
+            # Download thumbnail
+            thumbnail_data = self.download_thumbnail(candidate)
+            if thumbnail_data is None:
+                self.error_count += 1
+                return False
+
+            # Upscale thumbnail to full-size image
+            try:
+                upscaled = self.upscale_image(thumbnail_data)
+            except UndecodableImage as e:
+                self.quarantine.add(key, candidate['thumbnail_name'], candidate['thumbnail_generation'], str(e))
+                self.error_count += 1
+                return False
+            if upscaled is None:
+                # Size limit missed or unexpected error: retried on the next run
+                self.error_count += 1
+                return False
+
+            image_data, info = upscaled
+
+            # Upload full-size image, describing it in its metadata
+            metadata = image_metadata(info['width'], info['height'], info['format'], info['quality'],
+                                      source_md5=candidate['thumbnail_md5'], generator=GENERATED_BY,
+                                      version=GENERATOR_VERSION)
+            if self.upload_image(collection, event_id, image_data, metadata=metadata):
+                self.quarantine.release(key)
+                self.processed_count += 1
+                self.throughput.record(time.time() - started, candidate['thumbnail_size'],
+                                       image_data.getbuffer().nbytes)
+                return True
+            else:
+                self.error_count += 1
+                return False
+
+        except Exception as e:
+            logger.error(f"❌ Error processing {collection}/{event_id}: {e}")
+            self.error_count += 1
+            return False
+
+    def generate_missing_images(self, max_workers: int = 3, collections: List[str] = None):
+        """Main function to generate missing event_image files"""
+        logger.info(f"🏁 Starting missing image generation process "
+                    f"(policy: {self.policy.name}, profile: {self.profile_name})")
+        start_time = time.time()
+
+        collections = collections or ['events']
+
+        for collection in collections:
+            logger.info(f"\n📁 Processing collection: {collection}")
+
+            # Get events needing images
+            events = self.get_events_needing_images(collection)
+
+            if not events:
+                logger.info(f"✅ No event_image files needed for {collection}")
+                continue
+
+            logger.info(f"📋 Will process {len(events)} events with {max_workers} workers")
+            self._process_events(collection, events, max_workers, start_time)
+
+        # Summary
+        elapsed_time = time.time() - start_time
+        self.throughput.save(elapsed_time, max_workers)
+        self.quarantine.save()
+        logger.info(f"\n📊 FINAL SUMMARY:")
+        logger.info(f"="*50)
+        logger.info(f"✅ Successfully processed: {self.processed_count} images")
+        logger.info(f"⏭️ Skipped (time budget): {self.skipped_count}")
+        logger.info(f"🚫 Skipped (quarantined): {self.quarantine.skipped}")
+        logger.info(f"❌ Errors encountered: {self.error_count}")
+        logger.info(f"⏱️ Total time: {elapsed_time:.2f} seconds")
+
+        if self.processed_count > 0:
+            logger.info(f"🚀 Average processing time: {elapsed_time/self.processed_count:.2f} seconds per image")
+
+        if self.processed_count == 0:
+            logger.info("ℹ️ No images were generated. This could mean:")
+            logger.info("   - All events already have event_image files")
+            logger.info("   - No events found with only thumbnails")
+            logger.info("   - Connection or permission issues")
+
+    def _process_events(self, collection: str, events: List[dict], max_workers: int, start_time: float):
+        """Run process_event over the selection, keeping only a few jobs queued ahead of the workers"""
+        pending = iter(events)
+        futures = {}
+        completed = 0
+        deferred = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                # Top up the queue with the work the policy still admits
+                while len(futures) < max_workers * self.policy.queue_ahead:
+                    if not self.policy.admit(time.time() - start_time):
+                        break
+                    candidate = next(pending, None)
+                    if candidate is None:
+                        break
+                    if not self.policy.admit(time.time() - start_time, candidate):
+                        deferred += 1
+                        continue
+                    futures[executor.submit(self.process_event, collection, candidate)] = candidate['event_id']
+
+                if not futures:
+                    break
+
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    event_id = futures.pop(future)
+                    completed += 1
+
+                    try:
+                        success = future.result()
+                        status = "✅" if success else "❌"
+                        logger.info(f"{status} [{completed}/{len(events)}] {collection}/{event_id}")
+
+                    except Exception as e:
+                        logger.error(f"❌ [{completed}/{len(events)}] Exception processing {event_id}: {e}")
+                        self.error_count += 1
+
+        remaining = deferred + sum(1 for _ in pending)
+        if remaining:
+            self.skipped_count += remaining
+            logger.info(f"⏰ Time budget reached, {remaining} events in {collection} left for the next run")
+
+
+def main(argv: List[str] = None, title: str = "Firebase Missing Event Image Generator", **defaults):
+    """Command line entry point shared by the generate_missing_images*.py scripts
+
+    `defaults` preset the CLI options (policy, profile, months_back, max_events,
+    time_budget, deadline, order, workers) so each script keeps its historical behaviour.
+    """
+    parser = argparse.ArgumentParser(description=title)
+    parser.add_argument('--policy', choices=sorted(SELECTION_POLICIES), default='date-window',
+                        help='How candidate events are selected')
+    parser.add_argument('--profile', choices=sorted(ENCODER_PROFILES), default='standard',
+                        help='Encoder settings for the generated event_image')
+    parser.add_argument('--months-back', type=int, default=3, help='Window for the date-window policy')
+    parser.add_argument('--max-events', type=int, default=100, help='Limit for the newest and first policies')
+    parser.add_argument('--time-budget', type=float, default=1500,
+                        help='Seconds after which the time-budget policy stops starting new events')
+    parser.add_argument('--deadline', type=float,
+                        help='Use the deadline policy: only start events predicted to finish within this many seconds')
+    parser.add_argument('--order', choices=['cheapest', 'value'], default='cheapest',
+                        help='Order for the deadline policy: shortest jobs, or recency per predicted second')
+    parser.add_argument('--workers', type=int, default=3, help='Parallel workers (conservative for Firebase limits)')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // MB,
+                        help='Megabytes of decoded image data allowed in flight at once')
+    parser.add_argument('--collection', action='append', dest='collections',
+                        help='Storage folder to process (repeatable, default: events)')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='Only process events whose ID hashes to shard i of N, for N parallel runners')
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+
+    if args.deadline is not None:
+        args.policy = 'deadline'
+    policy = build_policy(args.policy, args.months_back, args.max_events, args.time_budget,
+                          args.deadline or 1500, args.order)
+
+    print(f"🖼️ {title}")
+    print("=" * (len(title) + 3))
+    print("📈 Upscales thumbnails to full-size images")
+    print("✨ Enhances quality during upscaling")
+    print(f"🎯 Selection: {policy.describe()}")
+    print(f"📏 Encoder profile: {args.profile}")
+    if args.shard:
+        print(f"🧩 Processing {describe_shard(args.shard)}")
+    print()
+
+    service_account_path = find_service_account()
+    print()
+
+    # Create generator and run
+    generator = MissingImageGenerator(service_account_path, policy=policy, profile=args.profile,
+                                      memory_budget=args.memory_budget * MB, shard=args.shard)
+
+    try:
+        generator.generate_missing_images(max_workers=args.workers, collections=args.collections)
+        print("\n🎉 Missing image generation completed!")
+
+    except KeyboardInterrupt:
+        print("\n⛔ Process interrupted by user")
+        print("💡 Partial progress has been saved to Firebase Storage")
+    except Exception as e:
+        print(f"\n💥 Unexpected error: {e}")
+        logger.exception("Full error details:")
+        sys.exit(1)
@@ -12,6 +12,7 @@ const { spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
 const { v4: uuidv4 } = require('uuid');
+const { WORKER_URL, startRunOnWorker, getWorkerJob } = require('../thumbnail-worker-client');
 
 const app = express();
 const PORT = process.env.PORT || 3001;
@@ -33,6 +34,30 @@ function authenticate(req, res, next) {
     }
 }
 
+// Mirror a job running on the long-lived thumbnail worker into the local job record
+function followWorkerJob(job, workerJobId) {
+    const timer = setInterval(async () => {
+        try {
+            const remote = await getWorkerJob(workerJobId);
+            job.processed = remote.processed;
+            job.errors = remote.errors;
+            job.logs = remote.logs.map(line => `[WORKER] ${line}`);
+            job.progress = remote.logs.length ? remote.logs[remote.logs.length - 1] : 'Waiting for worker...';
+            
+            if (remote.status === 'completed' || remote.status === 'failed') {
+                clearInterval(timer);
+                job.endTime = new Date();
+                job.status = remote.status;
+                job.progress = remote.status === 'completed' ? 'Generation completed successfully' : 'Generation failed';
+                job.error = remote.error || undefined;
+                console.log(`${remote.status === 'completed' ? '✅' : '❌'} Job ${job.id} ${remote.status} on worker`);
+            }
+        } catch (error) {
+            console.error(`⚠️ Could not poll worker job ${workerJobId}: ${error.message}`);
+        }
+    }, 2000);
+}
+
 // Serve the main page
 app.get('/', (req, res) => {
     res.sendFile(path.join(__dirname, 'index.html'));
@@ -54,6 +79,33 @@ app.post('/api/generate-thumbnails', authenticate, async (req, res) => {
             throw new Error('Thumbnail generator script not found');
         }
         
+        // Full runs go to the long-lived worker when one is configured (it has no dry-run mode)
+        if (WORKER_URL && !dryRun) {
+            try {
+                const remote = await startRunOnWorker(['events']);
+                const job = {
+                    id: jobId,
+                    status: 'running',
+                    startTime: new Date(),
+                    processed: 0,
+                    errors: 0,
+                    logs: [],
+                    progress: 'Queued on thumbnail worker...'
+                };
+                jobs.set(jobId, job);
+                followWorkerJob(job, remote.id);
+                
+                return res.json({
+                    success: true,
+                    jobId: jobId,
+                    status: 'running',
+                    message: 'Thumbnail generation started on worker'
+                });
+            } catch (error) {
+                console.log(`⚠️ Thumbnail worker unavailable (${error.message}), spawning the script`);
+            }
+        }
+        
         // Prepare command arguments
         const args = ['python3', scriptPath];
         if (dryRun) {
@@ -230,6 +282,37 @@ app.delete('/api/generate-thumbnails', authenticate, (req, res) => {
     }
 });
 
+// Resized event images, rendered and cached by the Python image service (image_service.py)
+const IMAGE_SERVICE_URL = process.env.IMAGE_SERVICE_URL;
+
+app.get('/images/:collection/:eventId', async (req, res) => {
+    if (!IMAGE_SERVICE_URL) {
+        return res.status(404).json({ error: 'Image service not configured (set IMAGE_SERVICE_URL)' });
+    }
+    
+    const { collection, eventId } = req.params;
+    const query = new URLSearchParams(req.query).toString();
+    const headers = req.headers['if-none-match'] ? { 'If-None-Match': req.headers['if-none-match'] } : {};
+    
+    try {
+        const response = await fetch(
+            `${IMAGE_SERVICE_URL}/${encodeURIComponent(collection)}/${encodeURIComponent(eventId)}${query ? `?${query}` : ''}`,
+            { headers }
+        );
+        res.status(response.status);
+        for (const name of ['content-type', 'cache-control', 'etag', 'x-cache']) {
+            const value = response.headers.get(name);
+            if (value) {
+                res.set(name, value);
+            }
+        }
+        res.send(Buffer.from(await response.arrayBuffer()));
+    } catch (error) {
+        console.error(`⚠️ Image service unreachable: ${error.message}`);
+        res.status(502).json({ error: 'Image service unreachable' });
+    }
+});
+
 // Health check endpoint
 app.get('/health', (req, res) => {
     res.json({
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Perceptual hashes for reusing thumbnails of near-identical sources
+
+Scraped flyers for the same recurring show are often re-encoded copies of one
+image: different bytes (so different MD5s) but the same picture. dhash()
+reduces an image to 64 bits that survive re-encoding, resizing and small
+colour shifts: shrink a grayscale copy to 9x8 and record, per row, whether
+each pixel is brighter than its right neighbour. Near-identical images have
+hashes a few bits apart. 64 bits cannot tell a flyer from the same flyer with
+another date, so a match is confirmed by comparing the pictures themselves
+(pixel_error) before its thumbnail is reused.
+
+PerceptualIndex maps hashes to the thumbnails made from them and finds the
+closest one within `max_distance` bits with a BK-tree (a metric tree over
+Hamming distance, so a lookup only visits the branches that can hold a match).
+It is persisted to `phash_index.json` and also learns from the `phash`
+metadata recorded on thumbnails during storage scans, so every runner knows
+about every thumbnail.
+"""
+
+import io
+import os
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from json_store import file_lock, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+PHASH_INDEX_FILE = 'phash_index.json'
+
+# At most this many of the 64 bits may differ for two images to count as the same picture
+DEFAULT_MAX_DISTANCE = 4
+
+# Sources whose aspect ratios differ by more than this are never matched (crops, different layouts)
+ASPECT_TOLERANCE = 0.02
+
+# The hash of flat images (blank or single-colour), which says nothing about the picture
+FLAT = 0
+
+# A hash match is only trusted if no ERROR_BLOCK-pixel block of the two pictures differs by more than this
+# RMS error (0-255) at thumbnail size, after the source has gone through the thumbnail's encoder. Calibrated
+# on flyers: re-encoded copies stay below it, a changed digit in a date line does not
+ERROR_BLOCK = 8
+MAX_PIXEL_ERROR = 18.0
+
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash of an image"""
+    gray = img.convert('L').resize((9, 8), Image.Resampling.BOX)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def pixel_error(a: Image.Image, b: Image.Image) -> float:
+    """Worst RMS difference over ERROR_BLOCK-pixel blocks of two pictures, compared at the size of the first
+    
+    Taken per block rather than over the whole picture so that a changed date or
+    venue line is not averaged away by the rest of the flyer.
+    """
+    if b.size != a.size:
+        b = b.resize(a.size, Image.Resampling.BILINEAR)
+    difference = np.asarray(a.convert('RGB'), dtype=np.float32) - np.asarray(b.convert('RGB'), dtype=np.float32)
+    squared = (difference ** 2).mean(axis=2)
+    rows, columns = -(-squared.shape[0] // ERROR_BLOCK), -(-squared.shape[1] // ERROR_BLOCK)
+    # Edge blocks are padded with their own mean so partial blocks are not diluted with zeros
+    padded = np.pad(squared, ((0, rows * ERROR_BLOCK - squared.shape[0]), (0, columns * ERROR_BLOCK - squared.shape[1])),
+                    mode='mean')
+    blocks = padded.reshape(rows, ERROR_BLOCK, columns, ERROR_BLOCK).mean(axis=(1, 3))
+    return float(np.sqrt(blocks.max()))
+
+
+def as_encoded(img: Image.Image, fmt: str, quality: int) -> Image.Image:
+    """An image after a round trip through a lossy format, so it carries the same codec loss as a thumbnail"""
+    buffer = io.BytesIO()
+    img.convert('RGB').save(buffer, format=fmt, quality=quality)
+    buffer.seek(0)
+    encoded = Image.open(buffer)
+    encoded.load()
+    return encoded
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Integers under Hamming distance, searchable for everything within a radius"""
+
+    def __init__(self):
+        self.root = None  # [value, {distance: child}]
+
+    def add(self, value: int):
+        if self.root is None:
+            self.root = [value, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int]]:
+        """(distance, value) pairs within `radius` of value, closest first"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[0]))
+            # Triangle inequality: only children at |distance - radius|..distance + radius can match
+            for child_distance, child in node[1].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return sorted(found)
+
+
+class PerceptualIndex:
+    """Thread-safe hash -> thumbnail map with nearest-match lookup, persisted to a JSON file"""
+
+    def __init__(self, path: str = PHASH_INDEX_FILE, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.entries = {}  # hash -> {'path', 'sourceMd5', 'aspect'}
+        self.dirty = {}
+        self.tree = BKTree()
+
+        try:
+            if os.path.exists(path):
+                with open(path) as f:
+                    for key, entry in json.load(f).items():
+                        self._insert(int(key, 16), entry)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read perceptual hash index from {path}, starting empty: {e}")
+
+    def _insert(self, value: int, entry: dict):
+        self.entries[value] = entry
+        self.tree.add(value)
+
+    def add(self, value: int, path: str, source_md5: Optional[str], aspect: float):
+        if value == FLAT:
+            return
+        entry = {'path': path, 'sourceMd5': source_md5, 'aspect': round(aspect, 4)}
+        with self.lock:
+            if self.entries.get(value) != entry:
+                self._insert(value, entry)
+                self.dirty[value] = entry
+
+    def seed(self, name: str, metadata: Optional[dict]):
+        """Learn from a thumbnail's metadata (phash, width, height, sourceMd5), without overriding local entries"""
+        try:
+            value = int(metadata['phash'], 16)
+            aspect = int(metadata['width']) / int(metadata['height'])
+        except (TypeError, KeyError, ValueError, ZeroDivisionError):
+            return
+        with self.lock:
+            if value not in self.entries:
+                self._insert(value, {'path': name, 'sourceMd5': metadata.get('sourceMd5'), 'aspect': round(aspect, 4)})
+
+    def find(self, value: int, aspect: float, exclude: str = None) -> Optional[Dict]:
+        """The closest thumbnail of a near-identical picture, with its 'hash' and 'distance', or None"""
+        if value == FLAT:
+            return None
+        with self.lock:
+            matches = self.tree.search(value, self.max_distance)
+            for distance, match in matches:
+                entry = self.entries.get(match)
+                if entry is None or entry['path'] == exclude:
+                    continue
+                if abs(entry['aspect'] - aspect) > ASPECT_TOLERANCE * aspect:
+                    continue
+                return dict(entry, hash=match, distance=distance)
+        return None
+
+    def forget(self, value: int):
+        """Drop a hash whose thumbnail turned out to be gone or replaced (the tree keeps the node)"""
+        with self.lock:
+            self.entries.pop(value, None)
+            self.dirty[value] = None
+
+    def save(self):
+        """Merge the entries added since the last save into the file"""
+        with file_lock(self.path):
+            with self.lock:
+                if not self.dirty:
+                    return
+                dirty, self.dirty = self.dirty, {}
+            try:
+                stored = read_json(self.path)
+                for value, entry in dirty.items():
+                    if entry is None:
+                        stored.pop(f"{value:016x}", None)
+                    else:
+                        stored[f"{value:016x}"] = entry
+                write_json(self.path, stored)
+
+            except Exception as e:
+                logger.warning(f"⚠️ Could not save perceptual hash index: {e}")
+                with self.lock:
+                    for value, entry in dirty.items():
+                        self.dirty.setdefault(value, entry)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Negative cache for events that cannot be processed
+
+An event whose source is missing, empty, truncated or undecodable fails the
+same way on every run. Quarantine remembers such failures in
+`quarantine.json`, keyed by event and pinned to the exact source object
+(name and generation) that failed, so scans skip the event until that object
+is replaced or deleted. Events without a source are not quarantined (they are
+simply not ready yet), and neither are transient errors (downloads, uploads,
+Firestore).
+
+Usage:
+    python quarantine.py                       # report quarantined events by reason
+    python quarantine.py --kind thumbnails --collection bayAreaEvents
+    python quarantine.py --release bayAreaEvents/abc123
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+from json_store import file_lock, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_FILE = 'quarantine.json'
+
+
+class Quarantine:
+    """Thread-safe "collection/eventID" -> failed source map for one kind of run, persisted to a JSON file"""
+
+    def __init__(self, kind: str, path: str = QUARANTINE_FILE):
+        self.kind = kind
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.changed = {}  # key -> entry, or None once released
+        self.skipped = 0
+
+        try:
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.entries = json.load(f).get(kind, {})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read quarantine from {path}, starting empty: {e}")
+
+    def is_quarantined(self, key: str, source: Optional[str], generation: Optional[int]) -> bool:
+        """Whether this exact source object already failed for the event (never for an unknown source)"""
+        if source is None:
+            return False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['source'] != source or entry['generation'] != generation:
+                return False
+            self.skipped += 1
+            return True
+
+    def add(self, key: str, source: Optional[str], generation: Optional[int], reason: str):
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry['source'] == source and entry['generation'] == generation:
+                entry = dict(entry, reason=reason, failures=entry['failures'] + 1, last_failed=now)
+            else:
+                entry = {'source': source, 'generation': generation, 'reason': reason,
+                         'failures': 1, 'first_failed': now, 'last_failed': now}
+            self.entries[key] = entry
+            self.changed[key] = entry
+        logger.warning(f"🚫 Quarantined {key}: {reason}")
+
+    def release(self, key: str):
+        """Forget an event, e.g. once it was processed successfully"""
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.changed[key] = None
+
+    def filter(self, collection: str, event_ids: List[str], sources: dict) -> List[str]:
+        """Drop quarantined events, given the sources a storage scan found ("collection/eventID" -> blob info)
+
+        Events whose source the scan did not see (Firestore discovery) are kept;
+        they are checked against their actual source when processed.
+        """
+        kept = []
+        for event_id in event_ids:
+            key = f"{collection}/{event_id}"
+            source = sources.get(key)
+            if not source or not self.is_quarantined(key, source['name'], source.get('generation')):
+                kept.append(event_id)
+        if len(kept) < len(event_ids):
+            logger.info(f"🚫 Skipping {len(event_ids) - len(kept)} quarantined events in {collection} "
+                        f"(see python quarantine.py)")
+        return kept
+
+    def save(self):
+        """Merge the changes since the last save into the file"""
+        with file_lock(self.path):
+            with self.lock:
+                if not self.changed:
+                    return
+                changed, self.changed = self.changed, {}
+            try:
+                stored = read_json(self.path)
+                entries = stored.setdefault(self.kind, {})
+                for key, entry in changed.items():
+                    if entry is None:
+                        entries.pop(key, None)
+                    else:
+                        entries[key] = entry
+                write_json(self.path, stored, indent=2)
+
+            except Exception as e:
+                logger.warning(f"⚠️ Could not save quarantine: {e}")
+                with self.lock:
+                    for key, entry in changed.items():
+                        self.changed.setdefault(key, entry)
+
+
+def report(path: str = QUARANTINE_FILE, kind: str = None, collection: str = None):
+    """Print quarantined events grouped by kind and reason"""
+    if not os.path.exists(path):
+        print(f"✅ Nothing quarantined ({path} does not exist)")
+        return
+
+    with open(path) as f:
+        stored = json.load(f)
+
+    total = 0
+    for name in sorted(stored):
+        if kind and name != kind:
+            continue
+        entries = {key: entry for key, entry in stored[name].items()
+                   if not collection or key.startswith(f"{collection}/")}
+        if not entries:
+            continue
+        total += len(entries)
+
+        print(f"\n🚫 {name}: {len(entries)} quarantined events")
+        print("=" * 50)
+        reasons = {}
+        for key, entry in entries.items():
+            reasons.setdefault(entry['reason'], []).append((key, entry))
+        for reason, items in sorted(reasons.items(), key=lambda item: -len(item[1])):
+            print(f"\n❌ {reason} ({len(items)})")
+            for key, entry in sorted(items):
+                source = entry['source'] or 'no source'
+                print(f"   {key}  {source}  failed {entry['failures']}x, last {entry['last_failed'][:19]}")
+
+    if total == 0:
+        print("✅ Nothing quarantined")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report or release quarantined events")
+    parser.add_argument('--path', default=QUARANTINE_FILE, help='Quarantine file')
+    parser.add_argument('--kind', choices=['thumbnails', 'missing_images'], help='Only this kind of run')
+    parser.add_argument('--collection', help='Only events in this collection')
+    parser.add_argument('--release', nargs='+', metavar='COLLECTION/EVENT_ID',
+                        help='Remove events from the quarantine so the next run retries them')
+    args = parser.parse_args()
+
+    if args.release:
+        for kind in ([args.kind] if args.kind else ['thumbnails', 'missing_images']):
+            quarantine = Quarantine(kind, args.path)
+            for key in args.release:
+                quarantine.release(key)
+            quarantine.save()
+        print(f"✅ Released {len(args.release)} events")
+        return
+
+    report(args.path, args.kind, args.collection)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Byte-bounded rendition caches and request coalescing for the image service
+
+- MemoryLRU keeps encoded renditions in memory, evicting the least recently
+  used ones once their total size exceeds `max_bytes` (sizes are counted in
+  bytes, not entries, so a few large renditions cannot crowd out the budget
+  unnoticed).
+- DiskLRU does the same in a directory. Recency survives restarts: a hit
+  touches the file's mtime and the index is rebuilt from mtimes on start.
+  Files are written to a temporary name and renamed, so readers never see a
+  partial rendition.
+- RenditionCache puts the two together: memory first, then disk (promoting
+  hits into memory), writes going to both.
+- SingleFlight runs one call per key at a time; concurrent callers for the
+  same key wait for that call and share its result, so a burst of identical
+  requests costs one download and one encode.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLRU:
+    """Thread-safe key -> bytes map holding at most max_bytes of values"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries': len(self.items), 'bytes': self.size, 'maxBytes': self.max_bytes,
+                    'evictions': self.evictions}
+
+
+class DiskLRU:
+    """Thread-safe key -> bytes map stored as files in a directory, holding at most max_bytes"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.files = OrderedDict()  # file name -> size, least recently used first
+        self.size = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.tmp'):
+                # Left by a write that was interrupted
+                self._remove(entry.name)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.files[name] = size
+            self.size += size
+        with self.lock:
+            self._evict()
+        logger.info(f"💽 Disk cache {directory}: {len(self.files)} renditions, {self.size / (1024 * 1024):.1f}MB")
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _remove(self, name: str):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Drop least recently used files until within max_bytes (lock held)"""
+        while self.size > self.max_bytes and self.files:
+            name, size = self.files.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            self._remove(name)
+
+    def get(self, key: str) -> Optional[bytes]:
+        name = self._name(key)
+        with self.lock:
+            if name not in self.files:
+                return None
+            self.files.move_to_end(name)
+
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)
+            return value
+        except OSError:
+            # Evicted by another thread in the meantime
+            return None
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        name = self._name(key)
+        path = os.path.join(self.directory, name)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(value)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write {key} to the disk cache: {e}")
+            self._remove(os.path.basename(temporary))
+            return
+
+        with self.lock:
+            self.size -= self.files.pop(name, 0)
+            self.files[name] = len(value)
+            self.size += len(value)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries': len(self.files), 'bytes': self.size, 'maxBytes': self.max_bytes,
+                    'evictions': self.evictions}
+
+
+class RenditionCache:
+    """Memory LRU in front of an optional disk LRU"""
+
+    def __init__(self, memory_bytes: int, disk_directory: str = None, disk_bytes: int = 0):
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = DiskLRU(disk_directory, disk_bytes) if disk_directory and disk_bytes else None
+        self.lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+
+    def _count(self, status: str):
+        with self.lock:
+            if status == 'miss':
+                self.misses += 1
+            else:
+                self.hits[status] += 1
+
+    def get(self, key: str) -> Tuple[Optional[bytes], str]:
+        """The cached value and where it came from ('memory', 'disk' or 'miss')"""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory')
+            return value, 'memory'
+
+        if self.disk:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                self._count('disk')
+                return value, 'disk'
+
+        self._count('miss')
+        return None, 'miss'
+
+    def put(self, key: str, value: bytes):
+        self.memory.put(key, value)
+        if self.disk:
+            self.disk.put(key, value)
+
+    def stats(self) -> dict:
+        with self.lock:
+            hits, misses = dict(self.hits), self.misses
+        return {'memory': self.memory.stats(), 'disk': self.disk.stats() if self.disk else None,
+                'hits': hits, 'misses': misses}
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key: str, call: Callable):
+        """Return call()'s result, or that of the call already running for key (exceptions are shared too)"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = call()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Throughput history and run planning for the image generators
+
+Every real run records, per processed event, how long it took and how many
+bytes it downloaded and uploaded. At the end of the run a linear model
+
+    seconds per event = per_image + per_mb * downloaded MB
+
+is fitted to those samples and merged into `image_throughput.json`, along
+with the run's parallel efficiency (busy worker time / workers x wall time)
+and the average upload size. The scheduled workflow commits the file, so
+estimates keep improving from one run to the next.
+
+Dry runs use the model to turn a work list built from listing metadata
+(source sizes, formats) into expected download/upload bytes and an ETA,
+without downloading anything. Until a kind of run has history, conservative
+defaults are used (for missing images, the old "500 events in 12.5 minutes
+with 3 workers" rule of thumb).
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from json_store import file_lock, read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+THROUGHPUT_FILE = 'image_throughput.json'
+
+# History counts as at most this many samples when merged with a new run, so the model keeps adapting
+MAX_HISTORY_WEIGHT = 2000
+
+DEFAULT_MODELS = {
+    'thumbnails': {
+        'seconds_per_image': 0.8,
+        'seconds_per_mb': 1.0,
+        'upload_bytes_per_image': 45 * 1024,
+        'parallel_efficiency': 0.7,
+        'samples': 0,
+    },
+    'missing_images': {
+        'seconds_per_image': 4.5,
+        'seconds_per_mb': 2.0,
+        'upload_bytes_per_image': 700 * 1024,
+        'parallel_efficiency': 1.0,
+        'samples': 0,
+    },
+}
+
+
+def load_model(kind: str, path: str = THROUGHPUT_FILE) -> dict:
+    """Throughput model for a kind of run, from history if there is any"""
+    model = dict(DEFAULT_MODELS[kind])
+    try:
+        if os.path.exists(path):
+            with open(path) as f:
+                model.update(json.load(f).get(kind, {}))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not read throughput history from {path}, using defaults: {e}")
+    return model
+
+
+def estimate(model: dict, images: int, download_bytes: int, workers: int) -> dict:
+    """Expected bytes and wall-clock seconds for a run of `images` events"""
+    busy_seconds = images * model['seconds_per_image'] + download_bytes / MB * model['seconds_per_mb']
+    parallelism = max(1.0, workers * model['parallel_efficiency'])
+    return {
+        'images': images,
+        'download_bytes': download_bytes,
+        'upload_bytes': int(images * model['upload_bytes_per_image']),
+        'seconds': busy_seconds / parallelism,
+        'based_on_samples': model['samples'],
+    }
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 90:
+        return f"{seconds:.0f} seconds"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.1f} minutes"
+    return f"{seconds / 3600:.1f} hours"
+
+
+def format_bytes(size: float) -> str:
+    if size < MB:
+        return f"{size / 1024:.0f}KB"
+    if size < 1024 * MB:
+        return f"{size / MB:.1f}MB"
+    return f"{size / 1024 / MB:.2f}GB"
+
+
+def log_estimate(plan: dict):
+    """Log the totals of an estimate() result"""
+    logger.info(f"🖼️ Events to process: {plan['images']:,}")
+    logger.info(f"📥 Expected download: {format_bytes(plan['download_bytes'])}")
+    logger.info(f"📤 Expected upload: {format_bytes(plan['upload_bytes'])}")
+    source = (f"measured over {plan['based_on_samples']:,} events" if plan['based_on_samples']
+              else "default rates, no history yet")
+    logger.info(f"⏱️ Estimated time: {format_duration(plan['seconds'])} ({source})")
+
+
+class ThroughputRecorder:
+    """Collects per-event timings during a run and folds them into the history file"""
+
+    def __init__(self, kind: str, path: str = THROUGHPUT_FILE):
+        self.kind = kind
+        self.path = path
+        self.samples = []  # (seconds, download bytes, upload bytes)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float, download_bytes: int, upload_bytes: int):
+        with self.lock:
+            self.samples.append((seconds, download_bytes or 0, upload_bytes or 0))
+
+    def fit(self, wall_seconds: float, workers: int) -> dict:
+        """Model fitted to this run's samples alone"""
+        samples = np.array(self.samples, dtype=np.float64)
+        seconds, download_mb, upload = samples[:, 0], samples[:, 1] / MB, samples[:, 2]
+
+        per_image, per_mb = float(seconds.mean()), 0.0
+        if len(samples) >= 5 and download_mb.std() > 0:
+            design = np.column_stack([np.ones_like(download_mb), download_mb])
+            (intercept, slope), *_ = np.linalg.lstsq(design, seconds, rcond=None)
+            if intercept > 0 and slope > 0:
+                per_image, per_mb = float(intercept), float(slope)
+
+        efficiency = seconds.sum() / max(wall_seconds * workers, 1e-6)
+        return {
+            'seconds_per_image': per_image,
+            'seconds_per_mb': per_mb,
+            'upload_bytes_per_image': float(upload.mean()),
+            'parallel_efficiency': float(min(1.0, max(0.1, efficiency))),
+            'samples': len(samples),
+        }
+
+    def save(self, wall_seconds: float, workers: int):
+        """Merge this run into the history file, weighting by sample counts"""
+        with self.lock:
+            if not self.samples:
+                return
+        try:
+            run = self.fit(wall_seconds, workers)
+            with file_lock(self.path):
+                history = read_json(self.path)
+                previous = history.get(self.kind)
+                if previous:
+                    old = min(previous.get('samples', 0), MAX_HISTORY_WEIGHT)
+                    new = run['samples']
+                    merged = {
+                        name: (previous[name] * old + run[name] * new) / (old + new)
+                        for name in ('seconds_per_image', 'seconds_per_mb', 'upload_bytes_per_image',
+                                     'parallel_efficiency')
+                    }
+                    merged['samples'] = previous.get('samples', 0) + new
+                else:
+                    merged = run
+
+                merged['updated'] = datetime.now(timezone.utc).isoformat()
+                history[self.kind] = merged
+                write_json(self.path, history, indent=2)
+            logger.info(f"📈 Throughput: {merged['seconds_per_image']:.2f}s per event + "
+                        f"{merged['seconds_per_mb']:.2f}s per MB, saved to {self.path}")
+
+        except Exception as e:
+            logger.warning(f"⚠️ Could not save throughput history: {e}")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Deterministic sharding of events across parallel runners
+
+`--shard i/N` gives runner i (0-based) the events whose stable hash of the
+event ID falls in slot i of N. The hash is MD5 rather than Python's hash(),
+which is randomised per process, so every runner, on every machine and in
+every run, agrees on which shard owns an event. N runners (or a CI matrix)
+therefore split the work with no coordination and no overlap:
+
+    python generate_thumbnails.py --shard 0/4
+    python generate_thumbnails.py --shard 1/4
+    ...
+"""
+
+import hashlib
+import argparse
+from typing import Iterable, List, Optional, Tuple, Callable, Any
+
+Shard = Tuple[int, int]
+
+
+def parse_shard(value: str) -> Shard:
+    """Parse 'i/N' into (i, N), for use as an argparse type"""
+    try:
+        index, _, count = value.partition('/')
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, e.g. 0/4 (got {value!r})")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 0 and {count - 1} (got {value!r})")
+    return index, count
+
+
+def shard_of(event_id: str, count: int) -> int:
+    """Which of `count` shards owns an event"""
+    digest = hashlib.md5(event_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def in_shard(event_id: str, shard: Optional[Shard]) -> bool:
+    """Whether an event belongs to this runner's shard (always true when not sharding)"""
+    if shard is None or shard[1] == 1:
+        return True
+    return shard_of(event_id, shard[1]) == shard[0]
+
+
+def filter_shard(items: Iterable[Any], shard: Optional[Shard], key: Callable[[Any], str] = lambda item: item) -> List[Any]:
+    """Keep only the items whose event ID (via `key`) belongs to this shard"""
+    return [item for item in items if in_shard(key(item), shard)]
+
+
+def describe_shard(shard: Optional[Shard]) -> str:
+    return f"shard {shard[0]}/{shard[1]}" if shard else "all events"
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Batched Cloud Storage operations for bulk maintenance
+
+Setting metadata, copying and deleting objects one call at a time costs one
+HTTP round trip each, which turns maintenance over whole collections into
+hours. StorageBatch queues such operations and sends them as JSON API batch
+requests of up to 100 operations each (the size Cloud Storage recommends),
+then reports a result for every operation:
+
+- 'ok', 'not_found' or 'precondition_failed' (412), per item,
+- rate limits and server errors (408, 429, 5xx) are retried in a later
+  batch with exponential backoff, up to `max_attempts` times,
+- anything else is 'error', with the HTTP status.
+
+Renames are a copy of one generation of the source followed, once the copy
+has succeeded, by a delete conditional on that generation, so a source
+rewritten in the meantime is kept (the rename reports precondition_failed).
+Uploads and downloads cannot be batched.
+
+Per-item results of a batch are read from the private `_responses` list of
+google-cloud-storage's Batch (there is no public API for them). Clients
+whose Batch lacks it, or has no raise_exception option, fall back to one call
+per operation, with the same results.
+
+Usage:
+    python storage_batch.py --clean-leases   # delete expired lease objects left by crashed runs
+"""
+
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from firebase_admin import storage
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from event_lease import LEASE_PREFIX
+from storage_io import list_blobs_lean
+from firebase_setup import find_service_account, initialize_firebase
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+RETRYABLE = {408, 429, 500, 502, 503, 504}
+
+
+def _status(code: Optional[int]) -> str:
+    if code is not None and 200 <= code < 300:
+        return 'ok'
+    if code == 404:
+        return 'not_found'
+    if code == 412:
+        return 'precondition_failed'
+    return 'error'
+
+
+class StorageBatch:
+    """Queue metadata, copy and delete operations on a bucket and run them in batches"""
+
+    def __init__(self, bucket, batch_size: int = BATCH_SIZE, max_attempts: int = 4, retry_delay: float = 1.0):
+        self.bucket = bucket
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.operations = []
+        self.batch_count = 0
+
+    def set_metadata(self, name: str, metadata: Dict[str, str], if_generation_match: int = None):
+        """Merge custom metadata into an object (a None value removes that key)"""
+        self.operations.append({'op': 'set_metadata', 'name': name, 'metadata': metadata,
+                                'if_generation_match': if_generation_match})
+
+    def copy(self, source: str, destination: str, if_generation_match: int = None):
+        """Server-side copy; if_generation_match applies to the destination (0: must not exist)"""
+        self.operations.append({'op': 'copy', 'name': source, 'destination': destination,
+                                'if_generation_match': if_generation_match})
+
+    def delete(self, name: str, if_generation_match: int = None):
+        self.operations.append({'op': 'delete', 'name': name, 'if_generation_match': if_generation_match})
+
+    def rename(self, source: str, destination: str, if_generation_match: int = None,
+               source_generation: int = None):
+        """Copy, then delete the source once the copy succeeded
+        
+        The copy and the delete are pinned to `source_generation` (looked up when not
+        given), so a source rewritten between the two is not deleted.
+        """
+        self.operations.append({'op': 'rename', 'name': source, 'destination': destination,
+                                'if_generation_match': if_generation_match, 'source_generation': source_generation})
+
+    def execute(self) -> List[dict]:
+        """Run every queued operation, returning them with 'status' (and 'code') filled in"""
+        operations, self.operations = self.operations, []
+
+        # Renames run as a copy pass, then a delete pass for the copies that succeeded
+        copies = [dict(op, op='copy', rename=True) if op['op'] == 'rename' else op for op in operations]
+        missing = [op for op in copies if op.get('rename') and op['source_generation'] is None]
+        for op in missing:
+            blob = self.bucket.get_blob(op['name'])
+            if blob is None:
+                op['status'], op['code'] = 'not_found', 404
+            else:
+                op['source_generation'] = blob.generation
+        self._run([op for op in copies if 'status' not in op])
+        copied = [op for op in copies if op.get('rename') and op['status'] == 'ok']
+        deletes = [{'op': 'delete', 'name': op['name'], 'if_generation_match': op['source_generation']}
+                   for op in copied]
+        self._run(deletes)
+        for op, delete in zip(copied, deletes):
+            op['status'], op['code'] = delete['status'], delete['code']
+        for op in copies:
+            if op.pop('rename', False):
+                op['op'] = 'rename'
+
+        counts = {}
+        for op in copies:
+            counts[op['status']] = counts.get(op['status'], 0) + 1
+        if copies:
+            requests = f"{self.batch_count} batches" if self.batch_count else "separate requests"
+            logger.info(f"📦 {len(copies)} storage operations in {requests}: "
+                        + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+        return copies
+
+    def _run(self, operations: List[dict]):
+        pending = list(operations)
+        for attempt in range(self.max_attempts):
+            retry = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                for op, code in zip(chunk, self._send(chunk)):
+                    op['code'] = code
+                    op['status'] = _status(code)
+                    if code is None or code in RETRYABLE:
+                        retry.append(op)
+            if not retry:
+                return
+            pending = retry
+            if attempt + 1 < self.max_attempts:
+                delay = self.retry_delay * 2 ** attempt
+                logger.warning(f"⚠️ Retrying {len(retry)} storage operations in {delay:.0f}s")
+                time.sleep(delay)
+
+    def _send(self, chunk: List[dict]) -> List[Optional[int]]:
+        """HTTP status per operation (None if the request itself failed)"""
+        client = getattr(self.bucket, 'client', None)
+        try:
+            batch = client.batch(raise_exception=False)
+        except (AttributeError, TypeError):
+            return [self._call(op) for op in chunk]
+        if not isinstance(getattr(batch, '_responses', None), list):
+            # Per-item results are private to google-cloud-storage; without them, one call each
+            return [self._call(op) for op in chunk]
+
+        self.batch_count += 1
+        try:
+            with batch:
+                for op in chunk:
+                    self._apply(op)
+            if len(batch._responses) != len(chunk):
+                raise ValueError(f"{len(batch._responses)} responses for {len(chunk)} requests")
+            return [response.status_code for response in batch._responses]
+        except Exception as e:
+            logger.warning(f"⚠️ Storage batch of {len(chunk)} failed: {e}")
+            return [None] * len(chunk)
+
+    def _call(self, op: dict) -> Optional[int]:
+        """One operation as its own request, for clients without batch results"""
+        try:
+            self._apply(op)
+            return 200
+        except NotFound:
+            return 404
+        except PreconditionFailed:
+            return 412
+        except Exception as e:
+            logger.warning(f"⚠️ {op['op']} {op['name']} failed: {e}")
+            return getattr(e, 'code', None)
+
+    def _apply(self, op: dict):
+        blob = self.bucket.blob(op['name'])
+        if op['op'] == 'set_metadata':
+            blob.metadata = op['metadata']
+            blob.patch(if_generation_match=op['if_generation_match'])
+        elif op['op'] == 'copy':
+            self.bucket.copy_blob(blob, self.bucket, op['destination'], if_generation_match=op['if_generation_match'],
+                                  source_generation=op.get('source_generation'))
+        elif op['op'] == 'delete':
+            blob.delete(if_generation_match=op['if_generation_match'])
+        else:
+            raise ValueError(f"Unknown storage operation: {op['op']}")
+
+
+def clean_leases(bucket) -> int:
+    """Delete lease objects whose lease has expired, unless they were renewed meanwhile"""
+    now = datetime.now(timezone.utc)
+    batch = StorageBatch(bucket)
+    for blob in list_blobs_lean(bucket, f"{LEASE_PREFIX}/", fields=('name', 'generation', 'metadata')):
+        expires = (blob.metadata or {}).get('expiresAt')
+        if not expires or datetime.fromisoformat(expires) <= now:
+            batch.delete(blob.name, if_generation_match=blob.generation)
+
+    results = batch.execute()
+    return sum(1 for op in results if op['status'] == 'ok')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk storage maintenance with batched requests")
+    parser.add_argument('--clean-leases', action='store_true', help='Delete expired lease objects')
+    args = parser.parse_args()
+    if not args.clean_leases:
+        parser.print_help()
+        return 1
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    initialize_firebase(find_service_account())
+
+    deleted = clean_leases(storage.bucket())
+    print(f"\n🧹 Deleted {deleted} expired leases")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Storage I/O helpers shared by the thumbnail and image generators
+
+Keeps image bytes in one place on their way through download -> decode ->
+encode -> upload:
+
+- downloads stream into a per-thread reusable buffer instead of
+  download_as_bytes() (no intermediate bytes object),
+- Pillow opens that buffer directly,
+- encoders write into a second per-thread reusable buffer,
+- uploads read straight from the encode buffer (no seek(0)/read() copy).
+
+A thread's buffers are reused for its next event, so a worker must finish
+uploading before it downloads again (process_event already works that way).
+
+probe_blob() reads only the first few KB of an image with a ranged request and
+parses format, dimensions and EXIF orientation from the header, so callers can
+decide what to do with an image before paying for the full download.
+
+list_blobs_lean() lists a prefix asking the JSON API for only the object
+fields a scanner reads (a field projection) at the maximum page size, instead
+of full object resources, which cuts the listing payload several times over.
+
+image_metadata() builds the custom metadata every generated image is uploaded
+with (width, height, format, quality, source MD5, generator and version).
+"""
+
+import io
+import threading
+import logging
+from typing import Optional, Iterable, Iterator, Dict
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+PNG_MAGIC = b'\x89PNG'
+
+# Enough for the JPEG/PNG header and EXIF block of almost every upload
+PROBE_BYTES = 64 * 1024
+
+# Objects per listing request; the JSON API does not return more than 1000
+LIST_PAGE_SIZE = 1000
+EXIF_ORIENTATION = 0x0112
+
+
+def reusable_buffer(name: str) -> io.BytesIO:
+    """Return this thread's buffer called `name`, emptied and rewound"""
+    buffer = getattr(_local, name, None)
+    if buffer is None:
+        buffer = io.BytesIO()
+        setattr(_local, name, buffer)
+    buffer.seek(0)
+    buffer.truncate()
+    return buffer
+
+
+def download_into(blob, buffer: io.BytesIO = None) -> io.BytesIO:
+    """Stream a blob into `buffer` (this thread's download buffer by default), rewound for reading"""
+    if buffer is None:
+        buffer = reusable_buffer('download')
+    blob.download_to_file(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def buffer_size(buffer: io.BytesIO) -> int:
+    """Number of bytes held by a BytesIO, without copying them"""
+    with buffer.getbuffer() as view:
+        return view.nbytes
+
+
+def sniff_content_type(buffer: io.BytesIO) -> str:
+    """Content type of encoded image data, read from the magic bytes in place"""
+    with buffer.getbuffer() as view:
+        head = bytes(view[:12])
+    if head.startswith(JPEG_MAGIC):
+        return 'image/jpeg'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/png'
+
+
+def upload_buffer(blob, buffer: io.BytesIO, content_type: str = None, **kwargs) -> int:
+    """Upload the whole of `buffer` to `blob` as a file, returning the number of bytes sent"""
+    size = buffer_size(buffer)
+    content_type = content_type or sniff_content_type(buffer)
+    blob.upload_from_file(buffer, size=size, content_type=content_type, rewind=True, **kwargs)
+    return size
+
+
+def image_metadata(width: int, height: int, fmt: str, quality: int = None, source_md5: str = None,
+                   generator: str = None, version: str = None) -> Dict[str, str]:
+    """Custom blob metadata describing an image, so listings can answer questions without downloads"""
+    fields = {
+        'width': width,
+        'height': height,
+        'format': fmt,
+        'quality': quality,
+        'sourceMd5': source_md5,
+        'generator': generator,
+        'generatorVersion': version,
+    }
+    return {name: str(value) for name, value in fields.items() if value is not None}
+
+
+def list_blobs_lean(bucket, prefix: str, fields: Iterable[str] = ('name', 'size'),
+                    page_size: int = LIST_PAGE_SIZE) -> Iterator:
+    """List the blobs under `prefix` with only `fields` (JSON API names, e.g. md5Hash, timeCreated) filled in
+
+    Pages are requested lazily as the iterator is consumed. Blob properties
+    outside the projection are None.
+    """
+    projection = ','.join(fields)
+    return bucket.list_blobs(prefix=prefix, page_size=page_size, fields=f"items({projection}),nextPageToken")
+
+
+def exif_orientation(img: Image.Image) -> int:
+    """EXIF orientation of an opened image, read from its header"""
+    if img.format == 'PNG' and 'exif' not in img.info:
+        # PNG keeps EXIF ahead of the image data, so there is none; getexif() would load the pixels
+        return 1
+    return img.getexif().get(EXIF_ORIENTATION, 1)
+
+
+def probe_blob(blob, size: int = None, probe_bytes: int = PROBE_BYTES) -> Optional[dict]:
+    """Read the start of an image blob and parse its header without decoding pixels
+
+    Returns format, width, height, mode and EXIF orientation, plus `head` (the
+    bytes read) and `complete` (whether `head` is the whole object, in which case
+    no further download is needed). Returns None if the header does not fit in
+    the first `probe_bytes`; callers should then fall back to a full download.
+    """
+    head = blob.download_as_bytes(start=0, end=probe_bytes - 1)
+    complete = len(head) >= size if size is not None else len(head) < probe_bytes
+
+    try:
+        img = Image.open(io.BytesIO(head))
+        orientation = exif_orientation(img)
+    except Exception as e:
+        logger.debug(f"Header of {blob.name} not within first {probe_bytes} bytes: {e}")
+        return None
+
+    return {
+        'format': img.format,
+        'width': img.width,
+        'height': img.height,
+        'mode': img.mode,
+        'orientation': orientation,
+        'head': head,
+        'complete': complete,
+    }
@@ -0,0 +1,65 @@
+/**
+ * Thumbnail Worker Client
+ *
+ * Talks to the long-lived Python worker (thumbnail_worker.py) so callers don't
+ * spawn a new Python process per event. Set THUMBNAIL_WORKER_URL (and
+ * THUMBNAIL_WORKER_TOKEN if the worker requires one) to use it; callers fall
+ * back to spawning generate_thumbnails.py when it is unset or unreachable.
+ *
+ * Requires Node 18+ (global fetch).
+ */
+
+const WORKER_URL = process.env.THUMBNAIL_WORKER_URL;
+const WORKER_TOKEN = process.env.THUMBNAIL_WORKER_TOKEN;
+
+class WorkerUnavailableError extends Error {}
+
+async function request(method, path, body) {
+  const headers = { 'Content-Type': 'application/json' };
+  if (WORKER_TOKEN) {
+    headers.Authorization = `Bearer ${WORKER_TOKEN}`;
+  }
+
+  let response;
+  try {
+    response = await fetch(`${WORKER_URL}${path}`, {
+      method,
+      headers,
+      body: body ? JSON.stringify(body) : undefined
+    });
+  } catch (error) {
+    throw new WorkerUnavailableError(`Thumbnail worker unreachable: ${error.message}`);
+  }
+
+  const job = await response.json();
+  if (!response.ok) {
+    throw new Error(job.error || `Thumbnail worker returned ${response.status}`);
+  }
+  return job;
+}
+
+// Generate one event's thumbnail and wait for the result
+async function runEventOnWorker(eventId, collection) {
+  const job = await request('POST', '/jobs', { eventId, collection, wait: true });
+  if (job.status !== 'completed') {
+    throw new Error(job.error || `Thumbnail job ${job.id} ${job.status}`);
+  }
+  return job;
+}
+
+// Start a full run over whole collections without waiting
+function startRunOnWorker(collections) {
+  return request('POST', '/jobs', { collections });
+}
+
+function getWorkerJob(jobId) {
+  return request('GET', `/jobs/${jobId}`);
+}
+
+module.exports = {
+  WORKER_URL,
+  WorkerUnavailableError,
+  runEventOnWorker,
+  startRunOnWorker,
+  getWorkerJob
+};
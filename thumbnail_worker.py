@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Long-lived thumbnail worker
+
+The webhook server, the auto-thumbnail watcher and the mobile runner used to
+spawn `python3 generate_thumbnails.py` for every request, paying interpreter
+startup, the Pillow/firebase_admin imports and credential setup each time.
+This worker does that once and keeps a warm ThumbnailGenerator and thread
+pool behind a small local HTTP API:
+
+    POST /jobs                  {"collection": "bayAreaEvents", "eventId": "abc"}
+                                or {"collections": ["bayAreaEvents"]} for a full run;
+                                add "wait": true to block until the job finishes
+    GET  /jobs                  recent jobs
+    GET  /jobs/<id>             job status, counts and recent log lines
+    GET  /jobs/<id>/stream      job log lines as they happen (NDJSON), until it finishes
+    GET  /health
+
+Event jobs go through a durable SQLite queue (job_queue.py): repeated
+requests for an event coalesce into one job during a short debounce window,
+a change that arrives while the event is being processed runs it once more
+afterwards, and events still queued when the worker stops are picked up
+when it starts again. Results are written back to
+Firestore through the generator's batched writer, flushed every couple of
+seconds so concurrent jobs share batches.
+
+Usage:
+    python thumbnail_worker.py --port 8765 --workers 4
+    THUMBNAIL_WORKER_URL=http://127.0.0.1:8765 node webhook-thumbnail-server.js
+
+Set THUMBNAIL_WORKER_TOKEN to require `Authorization: Bearer <token>`.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from generate_thumbnails import ThumbnailGenerator
+from decode_admission import MB, DEFAULT_MEMORY_BUDGET
+from firebase_setup import find_service_account
+from job_queue import JobQueue, DEFAULT_QUEUE_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+MAX_JOBS = 200
+MAX_JOB_LOGS = 500
+FLUSH_INTERVAL = 2.0
+
+# The job whose work the current thread is doing, so its log lines can be routed to it
+_current = threading.local()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """One unit of work submitted to the worker and its progress"""
+
+    def __init__(self, kind: str, collection: str = None, event_id: str = None, collections: List[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.collection = collection
+        self.event_id = event_id
+        self.collections = collections
+        self.status = 'queued'
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.processed = 0
+        self.errors = 0
+        self.error = None
+        self.logs = []
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def log(self, line: str):
+        with self.changed:
+            self.logs.append(line)
+            del self.logs[:-MAX_JOB_LOGS]
+            self.changed.notify_all()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+    def to_dict(self, logs: int = 20) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'collection': self.collection,
+            'eventId': self.event_id,
+            'collections': self.collections,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+            'processed': self.processed,
+            'errors': self.errors,
+            'error': self.error,
+            'logs': self.logs[-logs:] if logs else [],
+        }
+
+
+class JobLogHandler(logging.Handler):
+    """Copies log records to the job the logging thread is working on"""
+
+    def emit(self, record):
+        job = getattr(_current, 'job', None)
+        if job is not None:
+            job.log(self.format(record))
+
+
+class JobExecutor:
+    """Submits a job's work to the shared pool, with the job set as the log context of the pool thread"""
+
+    def __init__(self, executor: ThreadPoolExecutor, job: Job):
+        self.executor = executor
+        self.job = job
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        _current.job = self.job
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.job = None
+
+
+class ThumbnailWorker:
+    """Runs thumbnail jobs on a warm generator and worker pool"""
+
+    def __init__(self, generator: ThumbnailGenerator, queue: JobQueue, workers: int = 4):
+        self.generator = generator
+        self.queue = queue
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.run_lock = threading.Lock()  # full runs fill the shared pool, so one at a time
+        self.jobs = OrderedDict()
+        self.active = {}  # "collection/eventID" -> latest job for that event
+        self.running = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.started = time.time()
+        self.stopping = threading.Event()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+        threading.Thread(target=self._consume_loop, daemon=True).start()
+
+    def submit_event(self, collection: str, event_id: str) -> Job:
+        """Queue one event durably, or return the queued job it coalesces with"""
+        key = f"{collection}/{event_id}"
+        self.queue.enqueue(collection, event_id)
+        with self.lock:
+            job = self.active.get(key)
+            if job is None or job.status != 'queued':
+                # A change to an event that is already running gets a job of its own (it is re-run afterwards)
+                job = Job('event', collection=collection, event_id=event_id)
+                self.active[key] = job
+                self._remember(job)
+        self.wakeup.set()
+        return job
+
+    def submit_run(self, collections: List[str]) -> Job:
+        """Queue a full run over whole collections"""
+        job = Job('run', collections=collections)
+        with self.lock:
+            self._remember(job)
+        threading.Thread(target=self._run_collections, args=(job,), daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def recent(self, count: int = 20) -> List[Job]:
+        with self.lock:
+            return list(self.jobs.values())[-count:][::-1]
+
+    def _remember(self, job: Job):
+        """Track a job, forgetting the oldest finished ones (caller holds the lock)"""
+        self.jobs[job.id] = job
+        for job_id in [job_id for job_id, old in self.jobs.items() if old.finished][:max(0, len(self.jobs) - MAX_JOBS)]:
+            del self.jobs[job_id]
+
+    def _consume_loop(self):
+        """Claim ready events from the durable queue whenever a worker is free"""
+        while not self.stopping.is_set():
+            try:
+                with self.lock:
+                    free = self.workers - self.running
+                for item in self.queue.claim(free) if free > 0 else []:
+                    self._start_event(item)
+                wait = self.queue.next_ready_in()
+            except Exception as e:
+                logger.error(f"❌ Error reading the job queue: {e}")
+                wait = 5.0
+
+            self.wakeup.wait(min(wait, 5.0) if wait is not None else 5.0)
+            self.wakeup.clear()
+
+    def _start_event(self, item: dict):
+        key = f"{item['collection']}/{item['event_id']}"
+        with self.lock:
+            job = self.active.get(key)
+            if job is None or job.status != 'queued':
+                # Left in the queue by an earlier run of the worker, or a retry
+                job = Job('event', collection=item['collection'], event_id=item['event_id'])
+                self.active[key] = job
+                self._remember(job)
+            job.update(status='running', started_at=_now())
+            self.running += 1
+        self.executor.submit(self._run_event, job, item)
+
+    def _run_event(self, job: Job, item: dict):
+        _current.job = job
+        try:
+            success = self.generator.process_event(job.collection, job.event_id)
+            job.update(status='completed' if success else 'failed', finished_at=_now(),
+                       processed=1 if success else 0, errors=0 if success else 1)
+        except Exception as e:
+            logger.error(f"❌ Job {job.id} failed: {e}")
+            success = False
+            job.update(status='failed', finished_at=_now(), errors=1, error=str(e))
+        finally:
+            _current.job = None
+
+        try:
+            if success:
+                self.queue.ack(item)
+            else:
+                self.queue.nack(item, job.error or 'thumbnail generation failed')
+        except Exception as e:
+            logger.error(f"❌ Error updating the job queue for {job.collection}/{job.event_id}: {e}")
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.wakeup.set()
+
+    def _run_collections(self, job: Job):
+        _current.job = job
+        try:
+            with self.run_lock:
+                job.update(status='running', started_at=_now())
+
+                # A fork keeps this run's counts separate and shares everything else with event jobs
+                generator = self.generator.fork()
+                generator.generate_thumbnails(max_workers=self.workers, collections=job.collections,
+                                              executor=JobExecutor(self.executor, job))
+
+                job.update(status='completed' if generator.error_count == 0 else 'failed', finished_at=_now(),
+                           processed=generator.processed_count, errors=generator.error_count)
+        except Exception as e:
+            logger.error(f"❌ Job {job.id} failed: {e}")
+            job.update(status='failed', finished_at=_now(), error=str(e))
+        finally:
+            _current.job = None
+
+    def _flush_loop(self):
+        """Commit queued Firestore results every few seconds, shared across concurrent jobs"""
+        while not self.stopping.wait(FLUSH_INTERVAL):
+            try:
+                self.generator.writer.flush()
+                self.generator.save_caches()
+            except Exception as e:
+                logger.error(f"❌ Error writing results to Firestore: {e}")
+
+    def shutdown(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.executor.shutdown(wait=True)
+        self.generator.writer.flush()
+        self.generator.save_caches()
+        self.queue.close()
+
+    def health(self) -> dict:
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            'status': 'ok',
+            'service': 'Hash Thumbnail Worker',
+            'uptime': time.time() - self.started,
+            'workers': self.workers,
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'peakDecodeMemoryMB': round(self.generator.admission.peak / MB),
+            'queue': self.queue.stats(),
+        }
+
+
+class WorkerRequestHandler(BaseHTTPRequestHandler):
+    """JSON API in front of a ThumbnailWorker (set as `worker` on the server)"""
+
+    server_version = 'HashThumbnailWorker/1.0'
+
+    @property
+    def worker(self) -> ThumbnailWorker:
+        return self.server.worker
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _authorized(self) -> bool:
+        token = self.server.token
+        if not token or self.headers.get('Authorization') == f"Bearer {token}":
+            return True
+        self._send_json(401, {'error': 'Unauthorized'})
+        return False
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            return self._send_json(200, self.worker.health())
+        if not self._authorized():
+            return
+
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            return self._send_json(200, {'jobs': [job.to_dict(logs=0) for job in self.worker.recent()]})
+
+        job = self.worker.get(parts[1]) if len(parts) >= 2 and parts[0] == 'jobs' else None
+        if job is None:
+            return self._send_json(404, {'error': 'Job not found'})
+        if len(parts) == 3 and parts[2] == 'stream':
+            return self._stream(job)
+        return self._send_json(200, job.to_dict())
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path.strip('/') != 'jobs':
+            return self._send_json(404, {'error': 'Not found'})
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_json(400, {'error': 'Body must be JSON'})
+
+        if body.get('eventId') and body.get('collection'):
+            job = self.worker.submit_event(body['collection'], body['eventId'])
+        elif body.get('collections') or body.get('collection'):
+            job = self.worker.submit_run(body.get('collections') or [body['collection']])
+        else:
+            return self._send_json(400, {'error': 'Missing eventId and collection, or collections'})
+
+        if body.get('wait'):
+            with job.changed:
+                job.changed.wait_for(lambda: job.finished)
+        return self._send_json(200, job.to_dict())
+
+    def _stream(self, job: Job):
+        """Send log lines as NDJSON until the job finishes, then its final status"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+
+        sent = 0
+        while True:
+            with job.changed:
+                job.changed.wait_for(lambda: len(job.logs) != sent or job.finished, timeout=15)
+                lines, finished = list(job.logs), job.finished
+            # Logs are trimmed to the most recent lines, so resync if we fell behind
+            new = lines[sent:] if sent <= len(lines) else lines
+            sent = len(lines)
+            try:
+                for line in new:
+                    self.wfile.write((json.dumps({'log': line}) + '\n').encode('utf-8'))
+                if finished:
+                    self.wfile.write((json.dumps({'job': job.to_dict(logs=0)}) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if finished:
+                return
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Long-lived Firebase Event Thumbnail Worker")
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (local only by default)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('THUMBNAIL_WORKER_PORT', DEFAULT_PORT)))
+    parser.add_argument('--workers', type=int, default=4, help='Events processed in parallel')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // MB,
+                        help='Megabytes of decoded image data allowed in flight at once')
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH,
+                        help='SQLite file holding queued events, so they survive a restart')
+    parser.add_argument('--debounce', type=float, default=5.0,
+                        help='Seconds to wait for more changes to an event before processing it')
+    args = parser.parse_args()
+
+    # Logging itself is configured by generate_thumbnails (thumbnail_generation.log and the console)
+    job_handler = JobLogHandler()
+    job_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(job_handler)
+
+    print("🎨 Firebase Event Thumbnail Worker")
+    print("==================================")
+    generator = ThumbnailGenerator(find_service_account(), memory_budget=args.memory_budget * MB)
+    queue = JobQueue(args.queue, debounce=args.debounce)
+    worker = ThumbnailWorker(generator, queue, workers=args.workers)
+
+    server = ThreadingHTTPServer((args.host, args.port), WorkerRequestHandler)
+    server.daemon_threads = True
+    server.worker = worker
+    server.token = os.getenv('THUMBNAIL_WORKER_TOKEN')
+
+    print(f"🌐 Listening on http://{args.host}:{args.port} with {args.workers} workers")
+    print(f"📬 Queue: {args.queue} ({queue.stats().get('pending', 0)} events waiting)")
+    print("⏹️  Press Ctrl+C to stop\n")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ Shutting down thumbnail worker...")
+    finally:
+        server.server_close()
+        worker.shutdown()
+        print("✅ Goodbye!")
+
+
+if __name__ == "__main__":
+    main()